@@ -1,101 +1,193 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from datetime import datetime, timedelta, timezone
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Optional, Tuple
+from app.core.config import settings
+from app.db.session import SessionLocal
 from app.models.antifraud import BlockedEntity, BlockedEntityType
 from app.models.rifa_numero import RifaNumero, NumeroStatus
 from app.models.user import User
 from fastapi import HTTPException
+import threading
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Configuração Hardcoded (Simples)
-MAX_SIMULTANEOUS_RESERVATIONS = 5
+# Reservas ativas por usuário numa rifa; comporta uma compra em lote (5-20 números)
+MAX_SIMULTANEOUS_RESERVATIONS = settings.MAX_SIMULTANEOUS_RESERVATIONS
 COOLDOWN_SECONDS = 0
 RATE_LIMIT_PER_MINUTE = 10
+RATE_LIMIT_PER_USER_PER_MINUTE = 10
+RATE_LIMIT_WINDOW_SECONDS = 60
+# Bloqueios inseridos direto no banco aparecem no máximo depois disso
+BLOCKLIST_TTL_SECONDS = 60
+
+
+class SlidingWindowLimiter:
+    """
+    Rate limit em memória com janela deslizante (um deque de timestamps por chave).
+    Toda tentativa conta, inclusive as recusadas, ao contrário do proxy pelo AuditLog.
+    Um único worker uvicorn: o estado do processo é o estado global.
+    """
+
+    def __init__(self, window_seconds: int = RATE_LIMIT_WINDOW_SECONDS):
+        self.window = window_seconds
+        self._hits: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def hit(self, key: str, limit: int) -> bool:
+        """
+        Registra uma tentativa e diz se ela está dentro do limite.
+        """
+        now = time.monotonic()
+        cutoff = now - self.window
+        with self._lock:
+            hits = self._hits.setdefault(key, deque())
+            while hits and hits[0] <= cutoff:
+                hits.popleft()
+            hits.append(now)
+            allowed = len(hits) <= limit
+            if now - self._last_sweep > self.window:
+                self._sweep(cutoff)
+                self._last_sweep = now
+        return allowed
+
+    def count(self, key: str) -> int:
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            return sum(1 for t in self._hits.get(key, ()) if t > cutoff)
+
+    def reset(self):
+        with self._lock:
+            self._hits.clear()
+
+    def _sweep(self, cutoff: float):
+        # Remove chaves sem tentativas na janela para a memória não crescer
+        for key in [k for k, hits in self._hits.items() if not hits or hits[-1] <= cutoff]:
+            del self._hits[key]
+
+
+class BlocklistCache:
+    """
+    Conjunto de entidades bloqueadas em memória.
+    Recarregado quando expira (TTL) ou quando `invalidate()` é chamado
+    (o job de antifraude chama ao criar bloqueios).
+    """
+
+    def __init__(self, ttl_seconds: int = BLOCKLIST_TTL_SECONDS):
+        self.ttl = ttl_seconds
+        self._entries: Dict[Tuple[Optional[str], BlockedEntityType, str], str] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _load(self):
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                BlockedEntity.tenant_id, BlockedEntity.type, BlockedEntity.value, BlockedEntity.reason
+            ).all()
+        finally:
+            db.close()
+        return {
+            (str(tenant_id) if tenant_id else None, type_, value): reason
+            for tenant_id, type_, value, reason in rows
+        }
+
+    def _current(self) -> Dict[Tuple[Optional[str], BlockedEntityType, str], str]:
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._entries
+            # Carrega segurando o lock: evita várias requisições recarregando juntas
+            self._entries = self._load()
+            self._loaded_at = time.monotonic()
+            return self._entries
+
+    def find(self, tenant_id, ip_address: Optional[str], user_id) -> Optional[str]:
+        """
+        Retorna o motivo do bloqueio se o IP ou o usuário estão bloqueados no tenant.
+        """
+        entries = self._current()
+        tenant_key = str(tenant_id) if tenant_id else None
+        for key in ((tenant_key, BlockedEntityType.IP, ip_address),
+                    (tenant_key, BlockedEntityType.USER, str(user_id))):
+            if key in entries:
+                return str(entries[key])
+        return None
+
+
+blocklist = BlocklistCache()
+rate_limiter = SlidingWindowLimiter()
+
 
 def check_antifraud(
     db: Session,
     user: User,
     ip_address: str,
-    rifa_id: str
+    rifa_id: str,
+    quantidade: Optional[int] = 1
 ):
+    """
+    Valida uma tentativa de reserva de `quantidade` números (uma requisição).
+    Com quantidade=None o limite de reservas simultâneas fica para depois
+    (check_reservation_limit), quando se sabe quantos números são novos.
+    """
     if user.role == "admin":
         return
 
-    # 1. Blacklist Check
-    blocked = db.query(BlockedEntity).filter(
-        ((BlockedEntity.type == BlockedEntityType.IP) & (BlockedEntity.value == ip_address)) |
-        ((BlockedEntity.type == BlockedEntityType.USER) & (BlockedEntity.value == str(user.id))),
-        BlockedEntity.tenant_id == user.tenant_id
-    ).first()
-    
-    if blocked:
-        raise HTTPException(status_code=403, detail=f"Blocked: {blocked.reason}")
-
-    # 2. Reservation Limit Check (Active reservations)
-    active_reservations = db.query(func.count(RifaNumero.id)).filter(
-        RifaNumero.user_id == user.id,
-        RifaNumero.status == NumeroStatus.RESERVADO,
-        RifaNumero.rifa_id == rifa_id # Usually limit per rifa or global? "por usuário" implies global usually, but let's stick to rifa or global.
-        # Let's assume global per tenant (which is filtered by user_id being in tenant)
-    ).scalar()
-    
-    if active_reservations >= MAX_SIMULTANEOUS_RESERVATIONS:
-        raise HTTPException(status_code=429, detail=f"Limite de {MAX_SIMULTANEOUS_RESERVATIONS} reservas simultâneas atingido.")
+    # 1. Blacklist Check (memória)
+    reason = blocklist.find(user.tenant_id, ip_address, user.id)
+    if reason is not None:
+        raise HTTPException(status_code=403, detail=f"Blocked: {reason}")
 
-    # 3. Cooldown Check (Last reservation time)
-    # Get latest reservation for this user
-    last_reservation = db.query(RifaNumero).filter(
+    # 2. Rate Limit por IP e por usuário (memória; conta tentativas recusadas também)
+    ip_allowed = rate_limiter.hit(f"ip:{ip_address}", RATE_LIMIT_PER_MINUTE) if ip_address else True
+    user_allowed = rate_limiter.hit(f"user:{user.id}", RATE_LIMIT_PER_USER_PER_MINUTE)
+    if not ip_allowed:
+        raise HTTPException(status_code=429, detail="Muitas requisições deste IP. Tente novamente mais tarde.")
+    if not user_allowed:
+        raise HTTPException(status_code=429, detail="Muitas tentativas de reserva. Tente novamente mais tarde.")
+
+    # 3. Limite de reservas ativas na rifa + cooldown: uma única consulta,
+    # coberta por ix_rifa_numeros_user_id_status
+    active_reservations, last_time = db.query(
+        func.count(RifaNumero.id).filter(RifaNumero.rifa_id == rifa_id),
+        func.max(RifaNumero.updated_at)
+    ).filter(
         RifaNumero.user_id == user.id,
         RifaNumero.status == NumeroStatus.RESERVADO
-    ).order_by(RifaNumero.updated_at.desc()).first()
-    
-    if last_reservation and last_reservation.updated_at:
-        # Ensure updated_at is timezone aware if stored that way. 
-        # Postgres stores with timezone usually if configured.
-        now = datetime.now(timezone.utc)
-        
-        # If updated_at is naive, assume UTC or convert. SQLAlchemy usually returns what DB has.
-        # Assuming UTC for now.
-        last_time = last_reservation.updated_at
+    ).one()
+
+    if quantidade is not None and active_reservations + quantidade > MAX_SIMULTANEOUS_RESERVATIONS:
+        raise HTTPException(status_code=429, detail=f"Limite de {MAX_SIMULTANEOUS_RESERVATIONS} reservas simultâneas atingido.")
+
+    if COOLDOWN_SECONDS and last_time:
+        # Assuming UTC for naive values
         if last_time.tzinfo is None:
             last_time = last_time.replace(tzinfo=timezone.utc)
-            
-        if (now - last_time).total_seconds() < COOLDOWN_SECONDS:
-             raise HTTPException(status_code=429, detail=f"Aguarde {COOLDOWN_SECONDS} segundos entre reservas.")
-
-    # 4. Rate Limit (Reservations per minute per IP)
-    # This is tricky without a separate table for IP logs. 
-    # We can query RifaNumero but that only tracks successful reservations, not attempts.
-    # But prompt says "Intercepta reserva, valida regras".
-    # Using RifaNumero created_at/updated_at is a proxy for "successful reservations".
-    # If we want to limit *attempts*, we need middleware/Redis.
-    # "Anti-fraude simples" -> Limit successful reservations per minute is likely enough to prevent hoarding.
-    
-    one_minute_ago = datetime.now(timezone.utc) - timedelta(minutes=1)
-    
-    # We need to join User to check IP? No, we don't store IP on RifaNumero.
-    # We only have User ID.
-    # So we can limit by User ID per minute (which we effectively did with Cooldown, but Cooldown is 10s -> 6/min).
-    # If we want IP limit, we need to log IP or check BlockedEntity.
-    # The prompt says "Rate limit por IP".
-    # Since we don't store IP in RifaNumero, we can't strictly enforce "Rate limit per IP" using historical DB data
-    # UNLESS we add ip_address to RifaNumero or have a separate log.
-    # AuditLog has IP!
-    # Let's check AuditLog for "RESERVE_NUMBER" actions in last minute by this IP.
-    
-    from app.models.audit_finance import AuditLog
-    
-    recent_actions_by_ip = db.query(func.count(AuditLog.id)).filter(
-        AuditLog.ip_address == ip_address,
-        AuditLog.action == "RESERVE_NUMBER",
-        AuditLog.created_at >= one_minute_ago
-    ).scalar()
-    
-    if recent_actions_by_ip >= RATE_LIMIT_PER_MINUTE:
-         # Auto-block IP?
-         # "Estados que disparam antifraude: muitas reservas..."
-         # Let's just block the request for now.
-         raise HTTPException(status_code=429, detail="Muitas requisições deste IP. Tente novamente mais tarde.")
+        if (datetime.now(timezone.utc) - last_time).total_seconds() < COOLDOWN_SECONDS:
+            raise HTTPException(status_code=429, detail=f"Aguarde {COOLDOWN_SECONDS} segundos entre reservas.")
+
 
+def check_reservation_limit(db: Session, user: User, rifa_id, novos: int):
+    """
+    Limite de reservas simultâneas para a reserva em lote, contando só os
+    `novos` números que serão reservados agora: os que o usuário já segura
+    estão nas reservas ativas, e os indisponíveis não contam.
+    """
+    if user.role == "admin" or novos <= 0:
+        return
+    active_reservations = db.query(func.count(RifaNumero.id)).filter(
+        RifaNumero.user_id == user.id,
+        RifaNumero.rifa_id == rifa_id,
+        RifaNumero.status == NumeroStatus.RESERVADO
+    ).scalar()
+    if active_reservations + novos > MAX_SIMULTANEOUS_RESERVATIONS:
+        raise HTTPException(status_code=429, detail=f"Limite de {MAX_SIMULTANEOUS_RESERVATIONS} reservas simultâneas atingido.")
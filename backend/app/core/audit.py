@@ -1,12 +1,213 @@
+import atexit
 import logging
 import json
-from datetime import datetime
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, List
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError, InterfaceError
 from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.session import SessionLocal
 from app.models.audit_finance import AuditLog
 
 logger = logging.getLogger(__name__)
 
+
+def _as_uuid(value):
+    # actor_id/tenant_id are UUID columns; callers sometimes pass "system"
+    if value is None or isinstance(value, uuid.UUID):
+        return value
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+class AuditWriter:
+    """
+    Background writer for audit entries.
+    Entries are queued in memory and flushed with multi-row INSERTs every
+    AUDIT_FLUSH_INTERVAL_MS or AUDIT_BATCH_SIZE entries, on its own session.
+    If the database is unreachable (or the queue is full) entries are appended
+    to AUDIT_FALLBACK_PATH as JSON lines and replayed after the next good flush.
+    With AUDIT_SYNC_MODE the entry is written before `submit` returns.
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=settings.AUDIT_QUEUE_SIZE)
+        self._thread: threading.Thread = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._fallback_lock = threading.Lock()
+        self.sync = settings.AUDIT_SYNC_MODE
+
+    def submit(self, entries: List[dict]):
+        if self.sync:
+            self._write(entries)
+            return
+        self.start()
+        for i, entry in enumerate(entries):
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                logger.warning("Audit queue full, writing entries to fallback file")
+                self._write_fallback(entries[i:])
+                return
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """
+        Stop the writer after flushing everything still queued.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self.flush()
+
+    def flush(self):
+        """
+        Write everything currently queued, in the calling thread.
+        """
+        while True:
+            batch = self._drain(settings.AUDIT_BATCH_SIZE, block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def _drain(self, max_items: int, block: bool) -> List[dict]:
+        batch = []
+        deadline = time.monotonic() + settings.AUDIT_FLUSH_INTERVAL_MS / 1000
+        while len(batch) < max_items:
+            try:
+                if block:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._drain(settings.AUDIT_BATCH_SIZE, block=True)
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[dict]):
+        db = SessionLocal()
+        try:
+            db.execute(insert(AuditLog), batch)
+            db.commit()
+        except (OperationalError, InterfaceError) as e:
+            db.rollback()
+            logger.error(f"Audit DB unavailable, {len(batch)} entries sent to fallback file: {e}")
+            self._write_fallback(batch)
+            return
+        except Exception as e:
+            db.rollback()
+            logger.error(f"FAILED TO CREATE AUDIT LOG BATCH, retrying row by row: {e}")
+            self._write_rows(batch)
+            return
+        finally:
+            db.close()
+        self._replay_fallback()
+
+    def _write_rows(self, batch: List[dict]):
+        db = SessionLocal()
+        try:
+            for entry in batch:
+                try:
+                    db.execute(insert(AuditLog), [entry])
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"FAILED TO CREATE AUDIT LOG: {e}")
+        finally:
+            db.close()
+
+    def _write_fallback(self, entries: List[dict]):
+        try:
+            with self._fallback_lock, open(settings.AUDIT_FALLBACK_PATH, "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, default=str) + "\n")
+        except Exception as e:
+            logger.error(f"FAILED TO WRITE AUDIT FALLBACK FILE, {len(entries)} entries lost: {e}")
+
+    def _replay_fallback(self):
+        path = settings.AUDIT_FALLBACK_PATH
+        if not os.path.exists(path):
+            return
+        replaying = f"{path}.replay"
+        with self._fallback_lock:
+            if os.path.exists(replaying):
+                return
+            os.replace(path, replaying)
+
+        with open(replaying, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        for entry in entries:
+            entry["created_at"] = datetime.fromisoformat(entry["created_at"])
+        logger.info(f"Replaying {len(entries)} audit entries from fallback file")
+        for i in range(0, len(entries), settings.AUDIT_BATCH_SIZE):
+            # A failed chunk goes back to the fallback file via _write
+            self._write(entries[i:i + settings.AUDIT_BATCH_SIZE])
+        os.remove(replaying)
+
+
+audit_writer = AuditWriter()
+atexit.register(audit_writer.stop)
+
+
 class AuditLogger:
+    @staticmethod
+    def _build_entry(
+        action: str,
+        entity_type: str,
+        entity_id: str,
+        actor_id: str = None,
+        actor_role: str = None,
+        old_value: dict = None,
+        new_value: dict = None,
+        ip_address: str = None,
+        user_agent: str = None,
+        tenant_id: str = None
+    ) -> dict:
+        # Serialize JSON values
+        old_val_json = json.dumps(old_value, default=str) if old_value else None
+        new_val_json = json.dumps(new_value, default=str) if new_value else None
+
+        return dict(
+            actor_id=_as_uuid(actor_id),
+            actor_role=actor_role,
+            action=action,
+            entity_type=entity_type,
+            entity_id=str(entity_id),
+            old_value=old_val_json,
+            new_value=new_val_json,
+            ip_address=ip_address,
+            user_agent=user_agent,
+            tenant_id=_as_uuid(tenant_id),
+            # Set here, not by the DB: the row may be written later by the writer
+            created_at=datetime.now(timezone.utc)
+        )
+
     @staticmethod
     def log(
         db: Session,
@@ -23,27 +224,34 @@ class AuditLogger:
     ):
         """
         Create an audit log entry.
+        The entry is handed to the background audit writer: it does not touch
+        (or commit) the caller's session. `db` is kept for call compatibility.
         Designed to be safe (catch exceptions) so main logic doesn't fail if logging fails.
         """
         try:
-            # Serialize JSON values
-            old_val_json = json.dumps(old_value, default=str) if old_value else None
-            new_val_json = json.dumps(new_value, default=str) if new_value else None
-
-            audit_entry = AuditLog(
-                actor_id=actor_id,
-                actor_role=actor_role,
+            audit_writer.submit([AuditLogger._build_entry(
                 action=action,
                 entity_type=entity_type,
-                entity_id=str(entity_id),
-                old_value=old_val_json,
-                new_value=new_val_json,
+                entity_id=entity_id,
+                actor_id=actor_id,
+                actor_role=actor_role,
+                old_value=old_value,
+                new_value=new_value,
                 ip_address=ip_address,
                 user_agent=user_agent,
                 tenant_id=tenant_id
-            )
-            db.add(audit_entry)
-            db.commit() # Commit immediately for audit trail
+            )])
         except Exception as e:
             logger.error(f"FAILED TO CREATE AUDIT LOG: {e}")
             # Do NOT raise exception, let the flow continue
+
+    @staticmethod
+    def log_many(db: Session, entries: Iterable[dict]):
+        """
+        Queue several audit entries at once; they are written together.
+        Each entry takes the same keyword arguments as `log` (minus db).
+        """
+        try:
+            audit_writer.submit([AuditLogger._build_entry(**entry) for entry in entries])
+        except Exception as e:
+            logger.error(f"FAILED TO CREATE AUDIT LOG: {e}")
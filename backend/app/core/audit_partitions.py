@@ -0,0 +1,176 @@
+import gzip
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# audit_logs é particionada por mês (UTC) em created_at:
+#   audit_logs_2024_05  FOR VALUES FROM ('2024-05-01') TO ('2024-06-01')
+#   audit_logs_default  linhas fora de qualquer partição mensal
+# Consultas continuam indo para audit_logs; o Postgres só lê as partições do intervalo.
+DEFAULT_PARTITION = "audit_logs_default"
+PARTITION_RE = re.compile(r"^audit_logs_(\d{4})_(\d{2})$")
+
+
+def month_start(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    moment = moment.astimezone(timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"audit_logs_{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(db: Session) -> bool:
+    """
+    Bancos criados antes do particionamento têm audit_logs como tabela comum
+    até rodar scripts/partition_audit_logs.py.
+    """
+    return bool(db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'audit_logs')"
+    )).scalar())
+
+
+def list_partitions(db: Session) -> List[Tuple[str, datetime]]:
+    """
+    Partições mensais anexadas a audit_logs, em ordem cronológica.
+    """
+    names = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'audit_logs'"
+    )).scalars().all()
+    partitions = []
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions.append((name, datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partition(db: Session, month: datetime) -> bool:
+    """
+    Cria a partição do mês se ainda não existe. Linhas desse mês que caíram
+    na partição default são movidas para ela. Não faz commit.
+    """
+    name = partition_name(month)
+    if db.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar():
+        return False
+
+    bounds = {"inicio": month, "fim": add_months(month, 1)}
+    in_default = db.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} "
+        "WHERE created_at >= :inicio AND created_at < :fim)"
+    ), bounds).scalar()
+
+    # Valores dos limites gerados aqui (não vêm de usuário)
+    bound_sql = f"FROM ('{bounds['inicio'].isoformat()}') TO ('{bounds['fim'].isoformat()}')"
+    if not in_default:
+        db.execute(text(f"CREATE TABLE {name} PARTITION OF audit_logs FOR VALUES {bound_sql}"))
+    else:
+        # CREATE ... PARTITION OF falharia: cria solta, move as linhas e anexa
+        db.execute(text(f"CREATE TABLE {name} (LIKE audit_logs INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        moved = db.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE created_at >= :inicio AND created_at < :fim RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), bounds).rowcount
+        db.execute(text(f"ALTER TABLE audit_logs ATTACH PARTITION {name} FOR VALUES {bound_sql}"))
+        logger.info(f"Moved {moved} audit rows from {DEFAULT_PARTITION} into {name}")
+    logger.info(f"Created audit partition {name}")
+    return True
+
+
+def ensure_partitions(db: Session, since: Optional[datetime] = None, months_ahead: Optional[int] = None) -> int:
+    """
+    Garante a partição default e as mensais de `since` (padrão: mês atual)
+    até AUDIT_PARTITION_MONTHS_AHEAD meses à frente. Não faz commit.
+    """
+    if months_ahead is None:
+        months_ahead = settings.AUDIT_PARTITION_MONTHS_AHEAD
+    db.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF audit_logs DEFAULT"))
+
+    current = month_start(datetime.now(timezone.utc))
+    month = month_start(since) if since else current
+    last = add_months(current, months_ahead)
+    created = 0
+    while month <= last:
+        created += create_partition(db, month)
+        month = add_months(month, 1)
+    return created
+
+
+def archive_partition(db: Session, name: str, archive_dir: Optional[str] = None) -> str:
+    """
+    Copia a partição para <archive_dir>/<name>.csv.gz (COPY ... CSV HEADER),
+    depois a desanexa e remove. O arquivo é gravado antes de qualquer DROP;
+    se a cópia falhar a partição continua no lugar.
+    """
+    archive_dir = archive_dir or settings.AUDIT_ARCHIVE_DIR
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp_path = f"{path}.tmp"
+
+    cursor = db.connection().connection.cursor()
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+    finally:
+        cursor.close()
+    os.replace(tmp_path, path)
+
+    db.execute(text(f"ALTER TABLE audit_logs DETACH PARTITION {name}"))
+    db.execute(text(f"DROP TABLE {name}"))
+    db.commit()
+    logger.info(f"Archived audit partition {name} to {path}")
+    return path
+
+
+def archive_old_partitions(db: Session, retention_months: Optional[int] = None) -> List[str]:
+    """
+    Arquiva e remove as partições mensais que terminam antes da janela de retenção.
+    """
+    if retention_months is None:
+        retention_months = settings.AUDIT_RETENTION_MONTHS
+    cutoff = add_months(month_start(datetime.now(timezone.utc)), -retention_months)
+    archived = []
+    for name, month in list_partitions(db):
+        if month >= cutoff:
+            break
+        archived.append(archive_partition(db, name))
+    return archived
+
+
+def maintain_audit_partitions():
+    """
+    Job do scheduler: cria as partições dos próximos meses e arquiva as antigas.
+    """
+    db = SessionLocal()
+    try:
+        if not is_partitioned(db):
+            logger.warning("audit_logs is not partitioned; run scripts/partition_audit_logs.py")
+            return
+        ensure_partitions(db)
+        db.commit()
+        archive_old_partitions(db)
+    except Exception as e:
+        logger.error(f"Error maintaining audit partitions: {e}")
+        db.rollback()
+    finally:
+        db.close()
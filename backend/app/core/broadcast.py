@@ -0,0 +1,460 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+import httpx
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.core.audit import AuditLogger
+from app.core.config import settings
+from app.core.notifications import KIND_NEW_RIFA, claim_deliveries
+from app.db.session import SessionLocal
+from app.models.broadcast_campaign import BroadcastCampaign
+from app.models.notification_delivery import NotificationDelivery
+from app.models.rifa import Rifa, RifaStatus
+from app.models.user import User
+from services.whatsapp_service import whatsapp_service
+
+logger = logging.getLogger(__name__)
+
+# Destinatários lidos (e resultados gravados) por vez
+BATCH_SIZE = 500
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+TWILIO_MESSAGES_URL = "https://api.twilio.com/2010-04-01/Accounts/{sid}/Messages.json"
+
+
+class RetryableSendError(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Limite de mensagens por segundo de um provedor: `rate` fichas por segundo,
+    acumulando no máximo `capacity` (rajada).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Espera antes da tentativa seguinte: backoff exponencial com jitter, nunca
+    menos que o Retry-After do provedor (que é respeitado sem jitter).
+    """
+    backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * (0.5 + random.random() / 2)
+    if retry_after:
+        return max(retry_after, backoff)
+    return backoff
+
+
+class AsyncWhatsAppSender:
+    """
+    Envio de templates direto nas APIs HTTP (Meta Cloud API / Twilio), com
+    httpx assíncrono. Monta as requisições com os mesmos helpers do
+    WhatsAppService síncrono.
+    """
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+
+    async def send(self, provider: str, phone: str, message: dict) -> str:
+        try:
+            if provider == "meta":
+                return await self._send_meta(phone, message)
+            return await self._send_twilio(phone, message)
+        except httpx.TransportError as e:
+            raise RetryableSendError(f"transport error: {e}")
+
+    def _check(self, response: httpx.Response):
+        if response.status_code in RETRY_STATUS_CODES:
+            raise RetryableSendError(f"HTTP {response.status_code}", _retry_after(response))
+        response.raise_for_status()
+
+    async def _send_meta(self, phone: str, message: dict) -> str:
+        url, headers, payload = whatsapp_service.meta_request(phone, message["meta_template"], message["variables"])
+        response = await self.client.post(url, headers=headers, json=payload)
+        self._check(response)
+        return response.json().get("messages", [{}])[0].get("id")
+
+    async def _send_twilio(self, phone: str, message: dict) -> str:
+        to, from_number = whatsapp_service.twilio_numbers(phone)
+        response = await self.client.post(
+            TWILIO_MESSAGES_URL.format(sid=settings.TWILIO_ACCOUNT_SID),
+            auth=(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN),
+            data={
+                "From": from_number,
+                "To": to,
+                "ContentSid": message["twilio_content_sid"],
+                "ContentVariables": json.dumps(
+                    {str(i): str(v) for i, v in enumerate(message["variables"], start=1)}
+                ),
+            }
+        )
+        self._check(response)
+        return response.json().get("sid")
+
+
+def _message_for(kind: str, rifa: Rifa) -> dict:
+    if kind == KIND_NEW_RIFA:
+        tipo = rifa.tipo_rifa.value if hasattr(rifa.tipo_rifa, 'value') else str(rifa.tipo_rifa)
+        return {
+            "meta_template": settings.META_TEMPLATE_NEW_RIFA,
+            "twilio_content_sid": settings.TWILIO_TEMPLATE_NEW_RIFA,
+            "variables": [rifa.titulo, str(rifa.data_sorteio), tipo, str(rifa.id)],
+            "audit_action": "WHATSAPP_NOTIFIED_RIFA",
+            "audit_value": {"rifa_id": str(rifa.id), "titulo": rifa.titulo},
+        }
+    raise ValueError(f"Unknown broadcast kind: {kind}")
+
+
+class BroadcastEngine:
+    """
+    Disparos de WhatsApp num event loop próprio (thread "broadcast-engine"),
+    fora do worker que atende as requisições.
+    Cada campanha envia com até BROADCAST_CONCURRENCY mensagens em paralelo,
+    limitadas por um token bucket por provedor; 429/5xx/erros de rede são
+    repetidos com backoff exponencial (ou Retry-After).
+    O estado fica no banco (broadcast_campaigns + notification_deliveries):
+    campanhas pendentes/em andamento são retomadas no start().
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._tasks: Dict[uuid.UUID, asyncio.Task] = {}
+        # Campanhas reenviadas ao engine enquanto já rodavam (ver _spawn)
+        self._rerun: Set[uuid.UUID] = set()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sender: Optional[AsyncWhatsAppSender] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._start_lock:
+            if self.running():
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="broadcast-engine", daemon=True)
+            self._thread.start()
+            ready.wait()
+        self._resume()
+
+    def stop(self, timeout: float = 10):
+        """
+        Interrompe os envios. Destinatários ainda não enviados continuam
+        "claimed" e a campanha é retomada no próximo start().
+        """
+        loop = self._loop
+        if loop is None or not self.running():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout=timeout)
+        except Exception as e:
+            logger.error(f"Error stopping broadcast engine: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=timeout)
+        self._loop = None
+
+    def submit(self, campaign_id: uuid.UUID):
+        if not self.running():
+            self.start()
+        self._loop.call_soon_threadsafe(self._spawn, campaign_id)
+
+    def _run_loop(self, ready: threading.Event):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(15.0, connect=5.0))
+        self._sender = AsyncWhatsAppSender(self._client)
+        self._semaphore = asyncio.Semaphore(settings.BROADCAST_CONCURRENCY)
+        self._buckets = {
+            "meta": TokenBucket(settings.BROADCAST_META_RATE_PER_SECOND),
+            "twilio": TokenBucket(settings.BROADCAST_TWILIO_RATE_PER_SECOND),
+        }
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    async def _shutdown(self):
+        self._rerun.clear()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._client.aclose()
+
+    def _resume(self):
+        db = SessionLocal()
+        try:
+            pending = db.query(BroadcastCampaign.id).filter(
+                BroadcastCampaign.status.in_(("pending", "running"))
+            ).all()
+        finally:
+            db.close()
+        for (campaign_id,) in pending:
+            self.submit(campaign_id)
+        if pending:
+            logger.info(f"Resuming {len(pending)} broadcast campaigns")
+
+    def _spawn(self, campaign_id: uuid.UUID):
+        task = self._tasks.get(campaign_id)
+        if task and not task.done():
+            # Roda de novo quando terminar: a campanha pode ter sido reaberta
+            # depois que a execução atual já a deu por concluída
+            self._rerun.add(campaign_id)
+            return
+        self._tasks[campaign_id] = self._loop.create_task(self._run_campaign(campaign_id))
+
+    async def _run_campaign(self, campaign_id: uuid.UUID):
+        try:
+            info = await asyncio.to_thread(self._begin, campaign_id)
+            if info is None:
+                return
+            provider = whatsapp_service.provider()
+            if provider is None:
+                logger.warning("No WhatsApp service enabled (Meta or Twilio). Broadcast skipped.")
+
+            # Uma reabertura durante o envio volta a marcar "claimed" linhas atrás
+            # de last_id: repassa do início até _finish não achar nenhuma
+            done = False
+            while not done:
+                last_id = 0
+                while True:
+                    batch = await asyncio.to_thread(self._next_batch, info, last_id)
+                    if not batch:
+                        break
+                    last_id = batch[-1].id
+                    if provider is None:
+                        results = [None] * len(batch)
+                    else:
+                        results = await asyncio.gather(*(self._send_one(provider, info, row) for row in batch))
+                    await asyncio.to_thread(self._record, campaign_id, info, batch, results)
+
+                done = await asyncio.to_thread(self._finish, campaign_id, info)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error running broadcast campaign {campaign_id}: {e}")
+        finally:
+            self._tasks.pop(campaign_id, None)
+            if campaign_id in self._rerun:
+                self._rerun.discard(campaign_id)
+                self._spawn(campaign_id)
+
+    async def _send_one(self, provider: str, info: dict, row) -> Optional[str]:
+        if not row.phone:
+            return None
+        async with self._semaphore:
+            for attempt in range(settings.BROADCAST_MAX_ATTEMPTS):
+                await self._buckets[provider].acquire()
+                try:
+                    return await self._sender.send(provider, row.phone, info["message"])
+                except RetryableSendError as e:
+                    if attempt + 1 == settings.BROADCAST_MAX_ATTEMPTS:
+                        logger.error(f"Giving up on user {row.user_id} after {attempt + 1} attempts: {e}")
+                        return None
+                    await asyncio.sleep(retry_delay(attempt, e.retry_after))
+                except Exception as e:
+                    logger.error(f"Error notifying user {row.user_id}: {e}")
+                    return None
+        return None
+
+    # --- Banco (chamado via asyncio.to_thread) ---
+
+    def _begin(self, campaign_id: uuid.UUID) -> Optional[dict]:
+        db = SessionLocal()
+        try:
+            campaign = db.query(BroadcastCampaign).get(campaign_id)
+            if not campaign or campaign.status == "done":
+                return None
+            rifa = db.query(Rifa).get(campaign.rifa_id)
+            if not rifa:
+                return None
+            campaign.status = "running"
+            campaign.started_at = campaign.started_at or datetime.now(timezone.utc)
+            info = {
+                "tenant_id": campaign.tenant_id,
+                "rifa_id": campaign.rifa_id,
+                "kind": campaign.kind,
+                "message": _message_for(campaign.kind, rifa),
+            }
+            db.commit()
+            return info
+        finally:
+            db.close()
+
+    @staticmethod
+    def _claimed(info: dict) -> tuple:
+        return (
+            NotificationDelivery.tenant_id == info["tenant_id"],
+            NotificationDelivery.kind == info["kind"],
+            NotificationDelivery.rifa_id == info["rifa_id"],
+            NotificationDelivery.status == "claimed",
+        )
+
+    def _next_batch(self, info: dict, last_id: int) -> List:
+        db = SessionLocal()
+        try:
+            return db.query(
+                NotificationDelivery.id, NotificationDelivery.user_id, User.phone
+            ).join(User, User.id == NotificationDelivery.user_id).filter(
+                *self._claimed(info),
+                NotificationDelivery.id > last_id
+            ).order_by(NotificationDelivery.id).limit(BATCH_SIZE).all()
+        finally:
+            db.close()
+
+    def _record(self, campaign_id: uuid.UUID, info: dict, batch: List, results: List[Optional[str]]):
+        now = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            db.execute(update(NotificationDelivery), [
+                {
+                    "id": row.id,
+                    "status": "sent" if message_id else "failed",
+                    "message_id": str(message_id) if message_id else None,
+                    "sent_at": now if message_id else None,
+                }
+                for row, message_id in zip(batch, results)
+            ])
+            sent = sum(1 for message_id in results if message_id)
+            db.execute(update(BroadcastCampaign).where(BroadcastCampaign.id == campaign_id).values(
+                sent=BroadcastCampaign.sent + sent,
+                failed=BroadcastCampaign.failed + (len(results) - sent)
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+        message = info["message"]
+        AuditLogger.log_many(db, (
+            dict(
+                action=message["audit_action"],
+                entity_type="user",
+                entity_id=str(row.user_id),
+                actor_id="system",
+                actor_role="system",
+                new_value=message["audit_value"],
+                tenant_id=info["tenant_id"]
+            )
+            for row, message_id in zip(batch, results) if message_id
+        ))
+
+    def _finish(self, campaign_id: uuid.UUID, info: dict) -> bool:
+        """
+        Marca a campanha como "done" se não sobrou destinatário "claimed".
+        Devolve False (sem mudar nada) se sobrou, para o envio repassar.
+        """
+        db = SessionLocal()
+        try:
+            # Trava a campanha antes de olhar o ledger: notify_users_new_rifa grava
+            # os claims e o status na mesma transação, então depois do lock a
+            # consulta abaixo já enxerga uma reabertura concorrente
+            campaign = db.query(BroadcastCampaign).filter(
+                BroadcastCampaign.id == campaign_id
+            ).with_for_update().first()
+            if campaign is None:
+                return True
+            if db.query(NotificationDelivery.id).filter(*self._claimed(info)).first():
+                db.rollback()
+                return False
+            campaign.status = "done"
+            campaign.finished_at = datetime.now(timezone.utc)
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+
+broadcast_engine = BroadcastEngine()
+
+
+def notify_users_new_rifa(rifa_id: uuid.UUID, tenant_id: uuid.UUID):
+    """
+    Cria (ou reabre) a campanha de "nova rifa" e entrega ao broadcast engine.
+    Só faz trabalho de banco: o envio acontece na thread do engine.
+    """
+    logger.info(f"Starting new raffle notification for Rifa {rifa_id} (Tenant {tenant_id})")
+    db = SessionLocal()
+    try:
+        rifa = db.query(Rifa).get(rifa_id)
+        if not rifa:
+            logger.error(f"Rifa {rifa_id} not found during notification")
+            return
+
+        # Only notify if ATIVA
+        if rifa.status != RifaStatus.ATIVA:
+            logger.info(f"Rifa {rifa_id} is not ATIVA (Status: {rifa.status}). Skipping notification.")
+            return
+
+        user_ids = db.query(User.id).filter(
+            User.tenant_id == tenant_id,
+            User.whatsapp_opt_in == True,
+            User.phone.isnot(None)
+        ).all()
+        claimed = claim_deliveries(db, tenant_id, KIND_NEW_RIFA, rifa.id, ((user_id, "") for (user_id,) in user_ids))
+
+        # Progresso recontado a partir do ledger (reabrir não conta duas vezes)
+        counts = dict(db.query(NotificationDelivery.status, func.count(NotificationDelivery.id)).filter(
+            NotificationDelivery.tenant_id == tenant_id,
+            NotificationDelivery.kind == KIND_NEW_RIFA,
+            NotificationDelivery.rifa_id == rifa.id
+        ).group_by(NotificationDelivery.status).all())
+        values = dict(
+            total=sum(counts.values()),
+            sent=counts.get("sent", 0),
+            failed=counts.get("failed", 0),
+        )
+        status = "pending" if claimed else "done"
+        stmt = pg_insert(BroadcastCampaign).values(
+            id=uuid.uuid4(), tenant_id=tenant_id, rifa_id=rifa.id, kind=KIND_NEW_RIFA, status=status, **values
+        )
+        campaign_id = db.execute(stmt.on_conflict_do_update(
+            constraint="uq_broadcast_campaigns_key",
+            set_=dict(status=status, finished_at=None, **values)
+        ).returning(BroadcastCampaign.id)).scalar()
+        db.commit()
+        logger.info(f"Broadcast campaign {campaign_id}: {len(claimed)} of {len(user_ids)} opted-in users queued")
+    finally:
+        db.close()
+
+    if claimed:
+        broadcast_engine.submit(campaign_id)
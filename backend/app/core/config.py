@@ -32,9 +32,45 @@ class Settings:
     META_TEMPLATE_NEW_RIFA: str = os.getenv("META_TEMPLATE_NEW_RIFA", "nova_rifa_disponivel")
     META_TEMPLATE_WINNER: str = os.getenv("META_TEMPLATE_WINNER", "rifa_resultado_ganhador")
 
+    # Disparo em massa (app/core/broadcast.py): envios simultâneos e mensagens/s por provedor
+    BROADCAST_CONCURRENCY: int = int(os.getenv("BROADCAST_CONCURRENCY", 20))
+    BROADCAST_META_RATE_PER_SECOND: float = float(os.getenv("BROADCAST_META_RATE_PER_SECOND", 40))
+    BROADCAST_TWILIO_RATE_PER_SECOND: float = float(os.getenv("BROADCAST_TWILIO_RATE_PER_SECOND", 10))
+    BROADCAST_MAX_ATTEMPTS: int = int(os.getenv("BROADCAST_MAX_ATTEMPTS", 5))
+
     # Asaas Payment Integration
     ASAAS_API_URL: str = os.getenv("ASAAS_API_URL", "https://www.asaas.com/api/v3")
     ASAAS_API_KEY: str = os.getenv("ASAAS_API_KEY", "$aact_prod_000MzkwODA2MWY2OGM3MWRlMDU2NWM3MzJlNzZmNGZhZGY6OmRkM2U4OTE0LTlmOWItNDQwZC04MzQ4LWUzZjY4NGY5MDJmNDo6JGFhY2hfYTZhMjgzNTYtOGU5OC00MmZmLWJjOGEtZWE0ZWQ2MTI5MTQx")
     ASAAS_WEBHOOK_SECRET: str = os.getenv("ASAAS_WEBHOOK_SECRET", "") # Configure no painel do Asaas e adicione no .env se necessário
+    ASAAS_MAX_CONNECTIONS: int = int(os.getenv("ASAAS_MAX_CONNECTIONS", 20)) # Pool do cliente HTTP compartilhado
+    ASAAS_CUSTOMER_CACHE_SIZE: int = int(os.getenv("ASAAS_CUSTOMER_CACHE_SIZE", 10000)) # LRU usuário -> cliente Asaas
+
+    # Antifraude: reservas ativas por usuário numa rifa (reserva em lote conta só os números novos)
+    MAX_SIMULTANEOUS_RESERVATIONS: int = int(os.getenv("MAX_SIMULTANEOUS_RESERVATIONS", 20))
+
+    # Webhooks de pagamento: gravados e aplicados em background (app/core/payment_events.py)
+    PAYMENT_EVENT_WORKERS: int = int(os.getenv("PAYMENT_EVENT_WORKERS", 4))
+    PAYMENT_EVENT_MAX_ATTEMPTS: int = int(os.getenv("PAYMENT_EVENT_MAX_ATTEMPTS", 5))
+    # Conciliação periódica com o Asaas (app/core/payment_reconciliation.py)
+    PAYMENT_RECONCILE_INTERVAL_SECONDS: int = int(os.getenv("PAYMENT_RECONCILE_INTERVAL_SECONDS", 60))
+    PAYMENT_RECONCILE_WINDOW_MINUTES: int = int(os.getenv("PAYMENT_RECONCILE_WINDOW_MINUTES", 60)) # 4x a reserva de 15 min
+    # Pagos depois de a reserva expirar: varredura mais lenta e mais longa
+    PAYMENT_RECONCILE_EXPIRED_INTERVAL_MINUTES: int = int(os.getenv("PAYMENT_RECONCILE_EXPIRED_INTERVAL_MINUTES", 30))
+    PAYMENT_RECONCILE_LOOKBACK_DAYS: int = int(os.getenv("PAYMENT_RECONCILE_LOOKBACK_DAYS", 2))
+    PAYMENT_STATUS_CACHE_SECONDS: int = int(os.getenv("PAYMENT_STATUS_CACHE_SECONDS", 5)) # /pagamentos/check
+
+    # Audit log writer
+    AUDIT_SYNC_MODE: bool = os.getenv("AUDIT_SYNC_MODE", "False").lower() == "true" # Grava na hora (testes)
+    AUDIT_FLUSH_INTERVAL_MS: int = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", 200))
+    AUDIT_BATCH_SIZE: int = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+    AUDIT_QUEUE_SIZE: int = int(os.getenv("AUDIT_QUEUE_SIZE", 20000))
+    AUDIT_FALLBACK_PATH: str = os.getenv("AUDIT_FALLBACK_PATH", "audit_fallback.jsonl")
+    # Partições mensais de audit_logs: criadas com antecedência, arquivadas (.csv.gz) e removidas após a retenção
+    AUDIT_PARTITION_MONTHS_AHEAD: int = int(os.getenv("AUDIT_PARTITION_MONTHS_AHEAD", 2))
+    AUDIT_RETENTION_MONTHS: int = int(os.getenv("AUDIT_RETENTION_MONTHS", 12))
+    AUDIT_ARCHIVE_DIR: str = os.getenv("AUDIT_ARCHIVE_DIR", "audit_archive")
+
+    # Novas rifas sem linhas LIVRE em rifa_numeros (números criados na primeira reserva)
+    LAZY_NUMEROS: bool = os.getenv("LAZY_NUMEROS", "True").lower() == "true"
 
 settings = Settings()
@@ -0,0 +1,165 @@
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Hashable, List, Optional
+from app.db.session import SessionLocal
+from app.models.rifa_numero import RifaNumero, NumeroStatus
+
+logger = logging.getLogger(__name__)
+
+
+class HierarchicalTimerWheel:
+    """
+    Roda de timers hierárquica com resolução de 1 tick.
+    Níveis: 60 slots de 1 tick, 60 slots de 60 ticks e 24 slots de 3600 ticks;
+    prazos além de 24h ficam num overflow reavaliado a cada hora.
+    Agendar e cancelar são O(1); cada tick processa só o seu slot.
+    Não é thread-safe: quem usa faz o lock.
+    """
+
+    LEVELS = ((60, 1), (60, 60), (24, 3600))
+
+    def __init__(self, current_tick: int):
+        self.current_tick = current_tick
+        self._slots: List[List[Dict[Hashable, int]]] = [
+            [dict() for _ in range(size)] for size, _ in self.LEVELS
+        ]
+        self._overflow: Dict[Hashable, int] = {}
+        # Prazo vigente de cada chave; entradas antigas nos slots são ignoradas
+        self._deadlines: Dict[Hashable, int] = {}
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, key: Hashable, deadline_tick: int):
+        deadline_tick = max(deadline_tick, self.current_tick + 1)
+        self._deadlines[key] = deadline_tick
+        self._place(key, deadline_tick)
+
+    def cancel(self, key: Hashable):
+        self._deadlines.pop(key, None)
+
+    def _place(self, key: Hashable, deadline_tick: int):
+        delta = deadline_tick - self.current_tick
+        for level, (size, span) in enumerate(self.LEVELS):
+            if delta < size * span:
+                self._slots[level][(deadline_tick // span) % size][key] = deadline_tick
+                return
+        self._overflow[key] = deadline_tick
+
+    def _cascade(self, entries: Dict[Hashable, int]):
+        for key, deadline_tick in entries.items():
+            if self._deadlines.get(key) == deadline_tick:
+                self._place(key, deadline_tick)
+
+    def advance(self, to_tick: int) -> List[Hashable]:
+        """
+        Avança até `to_tick` (inclusive) e devolve as chaves vencidas.
+        """
+        due = []
+        while self.current_tick < to_tick:
+            self.current_tick += 1
+            tick = self.current_tick
+
+            # Níveis de cima primeiro, para que entradas do minuto/hora atual
+            # desçam antes do slot de 1 tick ser disparado
+            if tick % 3600 == 0:
+                overflow, self._overflow = self._overflow, {}
+                self._cascade(overflow)
+            for level in range(len(self.LEVELS) - 1, 0, -1):
+                size, span = self.LEVELS[level]
+                if tick % span == 0:
+                    slot = self._slots[level][(tick // span) % size]
+                    entries = dict(slot)
+                    slot.clear()
+                    self._cascade(entries)
+
+            slot = self._slots[0][tick % self.LEVELS[0][0]]
+            for key, deadline_tick in slot.items():
+                if self._deadlines.get(key) == deadline_tick:
+                    del self._deadlines[key]
+                    due.append(key)
+            slot.clear()
+        return due
+
+
+def _to_epoch(dt: datetime) -> float:
+    # Reservas são gravadas com datetime.utcnow() (naive, em UTC)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class ReservationExpiryWheel:
+    """
+    Libera cada reserva ~1s depois de reserved_until, sem varrer a tabela.
+    Semeada do banco na inicialização e alimentada por reservas/checkout.
+    O job periódico do scheduler continua como rede de segurança.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wheel = HierarchicalTimerWheel(int(time.time()))
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, numero_id, reserved_until: datetime):
+        with self._lock:
+            self._wheel.schedule(numero_id, math.ceil(_to_epoch(reserved_until)))
+
+    def cancel(self, numero_id):
+        with self._lock:
+            self._wheel.cancel(numero_id)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._wheel)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._seed()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reservation-expiry-wheel", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _seed(self):
+        db = SessionLocal()
+        try:
+            reservas = db.query(RifaNumero.id, RifaNumero.reserved_until).filter(
+                RifaNumero.status == NumeroStatus.RESERVADO,
+                RifaNumero.reserved_until.isnot(None)
+            ).all()
+        finally:
+            db.close()
+        for numero_id, reserved_until in reservas:
+            self.schedule(numero_id, reserved_until)
+        logger.info(f"Expiry wheel seeded with {len(reservas)} reservations")
+
+    def _run(self):
+        from app.core.scheduler import expire_reservations
+
+        while not self._stop.wait(1 - (time.time() % 1)):
+            with self._lock:
+                due = self._wheel.advance(int(time.time()))
+            if not due:
+                continue
+            db = SessionLocal()
+            try:
+                # Reservas estendidas/pagas nesse meio tempo são filtradas pelo UPDATE
+                expire_reservations(db, numero_ids=due)
+            except Exception as e:
+                logger.error(f"Error releasing reservations from expiry wheel: {e}")
+                db.rollback()
+            finally:
+                db.close()
+
+
+expiry_wheel = ReservationExpiryWheel()
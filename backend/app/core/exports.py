@@ -0,0 +1,83 @@
+import csv
+import enum
+import io
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterator, List
+from sqlalchemy.sql import Select
+from app.db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Linhas lidas do cursor do servidor por vez (e por chunk enviado)
+EXPORT_CHUNK_SIZE = 1000
+
+FORMATOS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _csv_chunk(rows, writer, buffer: io.StringIO) -> str:
+    for row in rows:
+        writer.writerow(["" if v is None else _plain(v) for v in row])
+    chunk = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    return chunk
+
+
+def _ndjson_chunk(rows, columns: List[str]) -> str:
+    return "".join(
+        json.dumps({c: _plain(v) for c, v in zip(columns, row)}, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+def stream_export(stmt: Select, formato: str) -> Iterator[str]:
+    """
+    Gera o resultado de `stmt` em CSV ou NDJSON, EXPORT_CHUNK_SIZE linhas por vez.
+    Usa um cursor do servidor (yield_per) numa sessão própria, aberta e fechada
+    pelo gerador: a memória não cresce com o tamanho da exportação e a sessão
+    da requisição já pode ter sido fechada quando o stream começa.
+    """
+    columns = [c.key for c in stmt.selected_columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if formato == "csv":
+        writer.writerow(columns)
+        yield _csv_chunk((), writer, buffer)
+
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        for rows in result.partitions():
+            if formato == "csv":
+                yield _csv_chunk(rows, writer, buffer)
+            else:
+                yield _ndjson_chunk(rows, columns)
+    except Exception as e:
+        # O status 200 já foi enviado: só dá para interromper o stream
+        logger.error(f"Export interrupted: {e}")
+        raise
+    finally:
+        db.close()
+
+
+def export_filename(prefixo: str, formato: str) -> str:
+    return f"{prefixo}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{formato}"
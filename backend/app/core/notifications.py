@@ -0,0 +1,72 @@
+import logging
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Set, Tuple
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models.notification_delivery import NotificationDelivery
+
+logger = logging.getLogger(__name__)
+
+KIND_NEW_RIFA = "new_rifa"
+KIND_WINNER = "winner"
+
+CLAIM_BATCH_SIZE = 1000
+
+
+def claim_deliveries(
+    db: Session,
+    tenant_id,
+    kind: str,
+    rifa_id,
+    destinatarios: Iterable[Tuple[object, str]]
+) -> Set[Tuple[object, str]]:
+    """
+    Reserva o envio para cada (user_id, numero) e devolve os que couberam a
+    este chamador: os novos e os que falharam antes (nova tentativa).
+    Já enviados ou em envio por outra tarefa ficam de fora.
+    Um INSERT ... ON CONFLICT por lote; o chamador faz commit antes de enviar.
+    """
+    destinatarios = list(dict.fromkeys((user_id, numero or "") for user_id, numero in destinatarios))
+    claimed = set()
+    for i in range(0, len(destinatarios), CLAIM_BATCH_SIZE):
+        rows = [
+            dict(tenant_id=tenant_id, user_id=user_id, kind=kind, rifa_id=rifa_id,
+                 numero=numero, status="claimed")
+            for user_id, numero in destinatarios[i:i + CLAIM_BATCH_SIZE]
+        ]
+        stmt = pg_insert(NotificationDelivery).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_notification_deliveries_key",
+            set_={"status": "claimed"},
+            where=NotificationDelivery.status == "failed"
+        ).returning(NotificationDelivery.user_id, NotificationDelivery.numero)
+        claimed.update((user_id, numero) for user_id, numero in db.execute(stmt))
+    return claimed
+
+
+def mark_delivery(
+    db: Session,
+    tenant_id,
+    kind: str,
+    rifa_id,
+    user_id,
+    numero: str = "",
+    message_id: Optional[str] = None,
+    sent: bool = True
+):
+    """
+    Registra o resultado de um envio reservado. Falhas voltam a ser reservadas
+    na próxima execução. Não faz commit.
+    """
+    db.execute(update(NotificationDelivery).where(
+        NotificationDelivery.tenant_id == tenant_id,
+        NotificationDelivery.user_id == user_id,
+        NotificationDelivery.kind == kind,
+        NotificationDelivery.rifa_id == rifa_id,
+        NotificationDelivery.numero == (numero or "")
+    ).values(
+        status="sent" if sent else "failed",
+        message_id=str(message_id) if message_id else None,
+        sent_at=datetime.now(timezone.utc) if sent else None
+    ))
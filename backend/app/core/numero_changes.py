@@ -0,0 +1,111 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import func, insert, text
+from sqlalchemy.orm import Session
+from app.db.session import SessionLocal
+from app.models.rifa_numero import RifaNumero
+from app.models.rifa_numero_change import RifaNumeroChange
+
+logger = logging.getLogger(__name__)
+
+# Mudanças mais antigas que isso são apagadas; clientes atrasados recebem snapshot
+CHANGE_FEED_RETENTION_MINUTES = 60
+# Acima disso é mais barato mandar a grade inteira
+CHANGE_FEED_MAX_CHANGES = 2000
+
+
+def record_numero_change(db: Session, num: RifaNumero):
+    """
+    Registra a mudança de status de um número na sessão do chamador.
+    Vai para o banco no mesmo commit da mudança em si.
+    """
+    db.add(RifaNumeroChange(
+        rifa_id=num.rifa_id,
+        numero=num.numero,
+        status=num.status,
+        user_id=num.user_id,
+        tenant_id=num.tenant_id
+    ))
+
+
+def record_numero_changes(db: Session, rows: Iterable[dict]):
+    """
+    Versão em lote: um único INSERT multi-linha.
+    Cada item precisa de rifa_id, numero, status, user_id e tenant_id.
+    """
+    rows = list(rows)
+    if rows:
+        db.execute(insert(RifaNumeroChange), rows)
+
+
+# Versão do feed: horizonte de transações (xmin do snapshot atual). Toda
+# transação com txid abaixo dele já terminou, então tudo que ela gravou é
+# visível para leituras feitas depois. ids (BIGSERIAL) não servem de versão:
+# são distribuídos no INSERT, e um id menor pode ser commitado depois de um maior.
+HORIZON_SQL = text("SELECT (pg_snapshot_xmin(pg_current_snapshot())::text)::bigint")
+
+
+def latest_version(db: Session) -> int:
+    """
+    Versão atual. Ler ANTES dos dados que ela acompanha (grade, mudanças):
+    em READ COMMITTED cada comando tem seu snapshot, e o que vier depois
+    já enxerga tudo abaixo do horizonte.
+    """
+    return db.execute(HORIZON_SQL).scalar()
+
+
+def get_changes_since(db: Session, rifa_id, since: int) -> Optional[Tuple[int, List[RifaNumeroChange]]]:
+    """
+    Mudanças da rifa gravadas por transações com txid >= since, em ordem de id,
+    junto com a nova versão. Mudanças já entregues podem voltar (transações que
+    estavam em andamento na leitura anterior): o cliente deduplica pelo id.
+    Retorna None quando `since` é antigo demais (já podado) ou inválido,
+    e o cliente precisa recarregar a grade completa.
+    """
+    if since <= 0:
+        return None
+
+    version = latest_version(db)
+    oldest = db.query(func.min(RifaNumeroChange.txid)).scalar()
+    if oldest is None or since < oldest or since > version:
+        return None
+
+    changes = db.query(RifaNumeroChange).filter(
+        RifaNumeroChange.rifa_id == rifa_id,
+        RifaNumeroChange.txid >= since
+    ).order_by(RifaNumeroChange.id).limit(CHANGE_FEED_MAX_CHANGES + 1).all()
+
+    if len(changes) > CHANGE_FEED_MAX_CHANGES:
+        return None
+    return version, changes
+
+
+def prune_numero_changes():
+    """
+    Remove mudanças fora da janela de retenção.
+    Corta por txid (tudo abaixo do menor txid ainda na janela), para que
+    "since >= min(txid)" garanta que nada a partir de `since` foi apagado.
+    A linha mais recente é sempre mantida.
+    """
+    db = SessionLocal()
+    try:
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=CHANGE_FEED_RETENTION_MINUTES)
+        keep_from = db.query(func.min(RifaNumeroChange.txid)).filter(
+            RifaNumeroChange.created_at >= cutoff
+        ).scalar()
+        if keep_from is None:
+            keep_from = db.query(RifaNumeroChange.txid).order_by(RifaNumeroChange.id.desc()).limit(1).scalar()
+        if keep_from is None:
+            return
+        deleted = db.query(RifaNumeroChange).filter(
+            RifaNumeroChange.txid < keep_from
+        ).delete(synchronize_session=False)
+        db.commit()
+        if deleted:
+            logger.info(f"Pruned {deleted} old number changes")
+    except Exception as e:
+        logger.error(f"Error pruning number changes: {e}")
+        db.rollback()
+    finally:
+        db.close()
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Dict, List, Optional, Set
+from starlette.concurrency import run_in_threadpool
+from app.db.session import SessionLocal
+from app.models.rifa_numero_change import RifaNumeroChange
+from app.core.numero_changes import latest_version
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 1.0
+# Cliente que acumula mais eventos que isso está lento demais: é desconectado
+# e recebe "resync" para recarregar a grade.
+SUBSCRIBER_QUEUE_SIZE = 500
+
+RESYNC = object()
+
+
+def format_sse(data: dict, event: str, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def change_event(change) -> dict:
+    status = change.status.value if hasattr(change.status, "value") else str(change.status)
+    return {"version": change.id, "numero": change.numero, "status": status}
+
+
+class NumeroChangeBroadcaster:
+    """
+    Fan-out em processo das mudanças de status dos números.
+    Uma única tarefa lê rifa_numero_changes (alimentada por reservas, webhooks,
+    scheduler etc.) e distribui para as filas dos clientes conectados a cada rifa.
+
+    O cursor é o horizonte de txid (ver numero_changes.latest_version), não o id:
+    cada leitura pega txid >= cursor, o que relê mudanças de transações que
+    estavam em andamento na leitura anterior; as já distribuídas são puladas
+    pelo id. Cada evento vai para a fila como (cursor, evento); o cursor é o
+    id SSE, seguro para retomar com Last-Event-ID.
+
+    Quem assina informa a versão até onde já leu (hello / backlog); o cursor
+    recua para a menor delas na próxima leitura, para nada entre essa versão
+    e o horizonte do broadcaster se perder. Repetições são deduplicadas pelo
+    cliente.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[uuid.UUID, Set[asyncio.Queue]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._cursor: Optional[int] = None
+        # ids já distribuídos que ainda podem voltar na próxima leitura
+        self._seen: Set[int] = set()
+        # Menor versão entregue a uma assinatura ainda não coberta pelo cursor
+        self._rewind: Optional[int] = None
+
+    def subscribe(self, rifa_id: uuid.UUID, version: int) -> asyncio.Queue:
+        """
+        `version`: a assinatura já viu tudo abaixo dela (a versão do hello ou
+        do backlog que o cliente recebeu).
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(rifa_id, set()).add(queue)
+        self._rewind = version if self._rewind is None else min(self._rewind, version)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    def unsubscribe(self, rifa_id: uuid.UUID, queue: asyncio.Queue):
+        queues = self._subscribers.get(rifa_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[rifa_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(q) for q in self._subscribers.values())
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def _take_cursor(self) -> Optional[int]:
+        cursor, rewind = self._cursor, self._rewind
+        self._rewind = None
+        if rewind is None:
+            return cursor
+        return rewind if cursor is None else min(cursor, rewind)
+
+    def _fetch(self, cursor: Optional[int], seen: Set[int]):
+        db = SessionLocal()
+        try:
+            # Horizonte antes da leitura: tudo abaixo dele já está visível nela
+            horizon = latest_version(db)
+            if cursor is None:
+                return horizon, set(), []
+            changes = db.query(RifaNumeroChange).filter(
+                RifaNumeroChange.txid >= cursor
+            ).order_by(RifaNumeroChange.id).all()
+            fresh = [c for c in changes if c.id not in seen]
+            still_open = {c.id for c in changes if c.txid >= horizon}
+            return horizon, still_open, fresh
+        finally:
+            db.close()
+
+    def _dispatch(self, cursor: int, changes: List[RifaNumeroChange]):
+        for change in changes:
+            queues = self._subscribers.get(change.rifa_id)
+            if not queues:
+                continue
+            event = (cursor, change_event(change))
+            for queue in list(queues):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    queues.discard(queue)
+                    # Abre espaço para o aviso de resync
+                    queue.get_nowait()
+                    queue.put_nowait(RESYNC)
+
+    async def _run(self):
+        while self._subscribers:
+            try:
+                cursor = self._take_cursor()
+                self._cursor, self._seen, changes = await run_in_threadpool(self._fetch, cursor, self._seen)
+                self._dispatch(cursor, changes)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error polling number changes: {e}")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        # Sem clientes: a próxima assinatura recomeça da versão que ela informar
+        self._cursor = None
+        self._seen = set()
+        self._rewind = None
+
+
+numero_broadcaster = NumeroChangeBroadcaster()
@@ -0,0 +1,153 @@
+import base64
+import uuid
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import String, cast, func, insert, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models.rifa import Rifa, RifaTipo
+from app.models.rifa_numero import RifaNumero, NumeroStatus, PremioStatus
+
+# Espaço de números por tipo de rifa: (primeiro, quantidade, dígitos)
+# MILHAR: 0000..9999 | CENTENA: 000..999 | DEZENA: 00..99 | GRUPO: 01..25
+NUMERO_SPACE: Dict[RifaTipo, Tuple[int, int, int]] = {
+    RifaTipo.MILHAR: (0, 10000, 4),
+    RifaTipo.CENTENA: (0, 1000, 3),
+    RifaTipo.DEZENA: (0, 100, 2),
+    RifaTipo.GRUPO: (1, 25, 2),
+}
+
+# Código de 1 byte por status, usado na grade compacta.
+# LIVRE precisa ser 0 para que a grade comece zerada.
+STATUS_CODES: Dict[NumeroStatus, int] = {
+    NumeroStatus.LIVRE: 0,
+    NumeroStatus.RESERVADO: 1,
+    NumeroStatus.PAGO: 2,
+    NumeroStatus.EXPIRADO: 3,
+    NumeroStatus.CANCELADO: 4,
+}
+
+
+def numero_space(tipo: RifaTipo) -> Tuple[int, int, int]:
+    return NUMERO_SPACE[RifaTipo(tipo)]
+
+
+def numero_index(tipo: RifaTipo, numero: str) -> int:
+    """
+    Posição do número na grade (ordem numérica), ou -1 se fora do espaço do tipo.
+    """
+    primeiro, quantidade, _ = numero_space(tipo)
+    try:
+        idx = int(numero) - primeiro
+    except (TypeError, ValueError):
+        return -1
+    # Rifas antigas gravavam o zero como "100"/"1000"/"10000"
+    if idx == quantidade and primeiro == 0:
+        return 0
+    if idx < 0 or idx >= quantidade:
+        return -1
+    return idx
+
+
+def build_status_grid(tipo: RifaTipo, rows: Iterable[Tuple[str, NumeroStatus]]) -> bytearray:
+    """
+    Monta a grade de status (1 byte por número) a partir de pares (numero, status).
+    Números sem linha são considerados LIVRE.
+    """
+    _, quantidade, _ = numero_space(tipo)
+    grid = bytearray(quantidade)
+    for numero, status in rows:
+        idx = numero_index(tipo, numero)
+        if idx >= 0:
+            grid[idx] = STATUS_CODES[NumeroStatus(status)]
+    return grid
+
+
+def encode_grid(grid: bytes) -> str:
+    return base64.b64encode(bytes(grid)).decode("ascii")
+
+
+def numeros_do_tipo(tipo: RifaTipo) -> List[str]:
+    """
+    Todos os números do tipo, já formatados ("0000".."9999", "01".."25"...).
+    """
+    primeiro, quantidade, digitos = numero_space(tipo)
+    return [f"{i:0{digitos}d}" for i in range(primeiro, primeiro + quantidade)]
+
+
+def numero_valido(tipo: RifaTipo, numero: str) -> bool:
+    _, _, digitos = numero_space(tipo)
+    return (
+        isinstance(numero, str) and len(numero) == digitos and numero.isdigit()
+        and numero_index(tipo, numero) >= 0
+    )
+
+
+def virtual_numero_id(rifa_id: uuid.UUID, numero: str) -> uuid.UUID:
+    """
+    Id determinístico de um número de rifa com numeração preguiçosa.
+    O mesmo id é usado quando a linha é materializada, então ids listados
+    antes e depois da primeira reserva continuam valendo.
+    """
+    return uuid.uuid5(rifa_id, numero)
+
+
+def numero_from_virtual_id(rifa: Rifa, numero_id: uuid.UUID):
+    # uuid5 não é reversível: percorre o espaço do tipo (no máximo 10k hashes)
+    for numero in numeros_do_tipo(rifa.tipo_rifa):
+        if virtual_numero_id(rifa.id, numero) == numero_id:
+            return numero
+    return None
+
+
+def materialize_numeros(db: Session, rifa: Rifa, numeros: Iterable[str]):
+    """
+    Garante que os números tenham linha em rifa_numeros (como LIVRE).
+    Em rifas com lazy_numeros um número só ganha linha quando sai de LIVRE;
+    até lá ele é implícito. Idempotente (ON CONFLICT DO NOTHING em
+    rifa_id+numero) e roda na transação do chamador, que deve em seguida
+    travar as linhas com SELECT ... FOR UPDATE. Números fora do espaço do
+    tipo são ignorados.
+    """
+    if not rifa.lazy_numeros:
+        return
+    rows = [
+        dict(
+            id=virtual_numero_id(rifa.id, numero),
+            rifa_id=rifa.id,
+            tipo=rifa.tipo_rifa,
+            numero=numero,
+            status=NumeroStatus.LIVRE,
+            premio_status=PremioStatus.PENDING,
+            tenant_id=rifa.tenant_id
+        )
+        for numero in dict.fromkeys(numeros) if numero_valido(rifa.tipo_rifa, numero)
+    ]
+    if rows:
+        db.execute(
+            pg_insert(RifaNumero).values(rows).on_conflict_do_nothing(index_elements=["rifa_id", "numero"])
+        )
+
+
+def generate_numeros(db: Session, rifa: Rifa):
+    """
+    Cria todas as linhas LIVRE da rifa num único INSERT ... SELECT generate_series,
+    montado no servidor: nada de objetos ORM nem de 10k linhas trafegando.
+    Roda na transação do chamador. Para rifas com numeração eager
+    (lazy_numeros=False); rifas preguiçosas não precisam disso.
+    """
+    primeiro, quantidade, digitos = numero_space(rifa.tipo_rifa)
+    i = func.generate_series(primeiro, primeiro + quantidade - 1).table_valued("value").render_derived(name="i")
+    db.execute(
+        insert(RifaNumero).from_select(
+            ["id", "rifa_id", "tipo", "numero", "status", "premio_status", "tenant_id"],
+            select(
+                func.gen_random_uuid(),
+                cast(literal(rifa.id), RifaNumero.rifa_id.type),
+                cast(literal(RifaTipo(rifa.tipo_rifa).name), RifaNumero.tipo.type),
+                func.lpad(cast(i.c.value, String), digitos, "0"),
+                cast(literal(NumeroStatus.LIVRE.name), RifaNumero.status.type),
+                cast(literal(PremioStatus.PENDING.name), RifaNumero.premio_status.type),
+                cast(literal(rifa.tenant_id), RifaNumero.tenant_id.type)
+            ).select_from(i)
+        )
+    )
@@ -0,0 +1,347 @@
+import logging
+import queue
+import threading
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import List
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.core.audit import AuditLogger
+from app.core.config import settings
+from app.core.numero_changes import record_numero_change
+from app.core.payment_hooks import apply_payment_log
+from app.db.session import SessionLocal
+from app.models.audit_finance import PaymentLog, PaymentLogMethod, PaymentLogStatus
+from app.models.payment_event import PaymentEvent
+from app.models.payment_intent import PaymentIntent
+from app.models.rifa import Rifa
+from app.models.rifa_numero import RifaNumero, NumeroStatus
+
+logger = logging.getLogger(__name__)
+
+# Eventos que confirmam / cancelam o pagamento, por provedor
+CONFIRM_EVENTS = {"PAYMENT_RECEIVED", "PAYMENT_CONFIRMED", "paid"}
+CANCEL_EVENTS = {"canceled"}
+# Eventos "received" mais velhos que isso são reenfileirados pelo scheduler
+REQUEUE_AFTER_SECONDS = 30
+
+
+def _lock_numeros(db: Session, payment_ref: str):
+    # Preço vem no mesmo SELECT (sem lazy-load de rn.rifa por linha);
+    # coberto por ix_rifa_numeros_payment_id. populate_existing: números já
+    # carregados na sessão são relidos com os valores travados, não os antigos
+    return db.query(RifaNumero, Rifa.preco_numero).join(
+        Rifa, Rifa.id == RifaNumero.rifa_id
+    ).filter(
+        RifaNumero.payment_id == payment_ref
+    ).with_for_update(of=RifaNumero).populate_existing().all()
+
+
+def confirm_payment(
+    db: Session,
+    payment_ref: str,
+    action: str,
+    ip_address: str = None,
+    user_agent: str = None
+) -> int:
+    """
+    Marca como PAGO todos os números do payment_id, com PaymentLog e agregados
+    (apply_payment_log), na transação do chamador. Idempotente: números já
+    pagos são ignorados. Usado pelos webhooks e pela verificação manual.
+    """
+    confirmed = []
+    locked = _lock_numeros(db, payment_ref)
+    for rn, preco in locked:
+        if rn.status == NumeroStatus.PAGO:
+            continue
+        old_status = rn.status
+        rn.status = NumeroStatus.PAGO
+        rn.reserved_until = None
+        record_numero_change(db, rn)
+
+        pay_log = PaymentLog(
+            rifa_id=rn.rifa_id,
+            numero_id=rn.id,
+            user_id=rn.user_id,
+            payment_id=payment_ref,
+            valor=preco or 0,
+            metodo=PaymentLogMethod.PIX,
+            status=PaymentLogStatus.PAGO,
+            tenant_id=rn.tenant_id
+        )
+        db.add(pay_log)
+        apply_payment_log(db, pay_log)
+        confirmed.append((rn, old_status))
+
+    if locked:
+        # Todos os números do pagamento estão PAGO agora
+        from app.core.payment_reconciliation import payment_status_cache
+        payment_status_cache.put_after_commit(db, payment_ref, locked[0][0].user_id, "paid")
+    if confirmed:
+        db.query(PaymentIntent).filter(
+            PaymentIntent.id == _as_uuid(payment_ref)
+        ).update({"status": "paid"}, synchronize_session=False)
+        AuditLogger.log_many(db, (
+            dict(
+                action=action,
+                entity_type="RifaNumero",
+                entity_id=str(rn.id),
+                actor_id=None, # System/Webhook
+                actor_role="system",
+                old_value={"status": str(old_status)},
+                new_value={"status": "pago", "payment_id": payment_ref},
+                ip_address=ip_address,
+                user_agent=user_agent,
+                tenant_id=rn.tenant_id
+            )
+            for rn, old_status in confirmed
+        ))
+    return len(confirmed)
+
+
+def cancel_payment(
+    db: Session,
+    payment_ref: str,
+    action: str,
+    ip_address: str = None,
+    user_agent: str = None
+) -> int:
+    """
+    Marca como CANCELADO os números do payment_id, com PaymentLog CANCELADO.
+    Não faz commit.
+    """
+    canceled = []
+    for rn, preco in _lock_numeros(db, payment_ref):
+        if rn.status == NumeroStatus.CANCELADO:
+            continue
+        old_status = rn.status
+        rn.status = NumeroStatus.CANCELADO
+        rn.reserved_until = None
+        record_numero_change(db, rn)
+
+        pay_log = PaymentLog(
+            rifa_id=rn.rifa_id,
+            numero_id=rn.id,
+            user_id=rn.user_id,
+            payment_id=payment_ref,
+            valor=preco or 0,
+            metodo=PaymentLogMethod.PIX,
+            status=PaymentLogStatus.CANCELADO,
+            tenant_id=rn.tenant_id
+        )
+        db.add(pay_log)
+        apply_payment_log(db, pay_log, old_status)
+        canceled.append((rn, old_status))
+    if canceled:
+        from app.core.payment_reconciliation import payment_status_cache
+        payment_status_cache.invalidate_after_commit(db, payment_ref)
+
+    AuditLogger.log_many(db, (
+        dict(
+            action=action,
+            entity_type="RifaNumero",
+            entity_id=str(rn.id),
+            actor_id=None,
+            actor_role="system",
+            old_value={"status": str(old_status)},
+            new_value={"status": "cancelado"},
+            ip_address=ip_address,
+            user_agent=user_agent,
+            tenant_id=rn.tenant_id
+        )
+        for rn, old_status in canceled
+    ))
+    return len(canceled)
+
+
+def _as_uuid(value: str):
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def ingest_payment_event(
+    db: Session,
+    provider: str,
+    event_id: str,
+    event: str,
+    payment_ref: str,
+    payload: dict,
+    ip_address: str = None,
+    user_agent: str = None
+) -> bool:
+    """
+    Grava o evento (uma vez por (provider, event_id)) e o entrega aos workers.
+    Devolve False se era uma reentrega. Faz commit.
+    """
+    stmt = pg_insert(PaymentEvent).values(
+        provider=provider,
+        event_id=event_id,
+        event=event,
+        payment_ref=payment_ref,
+        payload=payload,
+        ip_address=ip_address,
+        user_agent=user_agent,
+        status="received",
+        attempts=0
+    ).on_conflict_do_nothing(constraint="uq_payment_events_provider_event").returning(PaymentEvent.id)
+    event_pk = db.execute(stmt).scalar()
+    db.commit()
+    if event_pk is None:
+        return False
+    payment_event_worker.submit(event_pk, payment_ref)
+    return True
+
+
+def apply_payment_event(db: Session, event: PaymentEvent) -> int:
+    # Mesmas ações de auditoria de antes da fila, para os dois provedores
+    if event.event in CONFIRM_EVENTS:
+        return confirm_payment(
+            db, event.payment_ref, "PAYMENT_CONFIRMED_WEBHOOK",
+            event.ip_address, event.user_agent
+        )
+    if event.event in CANCEL_EVENTS:
+        return cancel_payment(
+            db, event.payment_ref, "PAYMENT_CANCELED_WEBHOOK",
+            event.ip_address, event.user_agent
+        )
+    return 0
+
+
+class PaymentEventWorker:
+    """
+    Aplica payment_events em background, com PAYMENT_EVENT_WORKERS threads.
+    Cada payment_ref cai sempre na mesma thread (crc32 % n) e pagamentos
+    diferentes rodam em paralelo. Eventos de um mesmo pagamento são aplicados
+    estritamente por id: um evento espera ("received") enquanto houver um
+    anterior do mesmo payment_ref ainda "received".
+    Falhas ficam "received" e voltam pela varredura do scheduler (em ordem de
+    id) até PAYMENT_EVENT_MAX_ATTEMPTS; depois, "failed".
+    """
+
+    def __init__(self):
+        self._queues: List[queue.Queue] = []
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def running(self) -> bool:
+        return bool(self._threads) and all(t.is_alive() for t in self._threads)
+
+    def start(self):
+        with self._start_lock:
+            if self.running():
+                return
+            self._stop.clear()
+            self._queues = [queue.Queue() for _ in range(max(1, settings.PAYMENT_EVENT_WORKERS))]
+            self._threads = [
+                threading.Thread(target=self._run, args=(q,), name=f"payment-events-{i}", daemon=True)
+                for i, q in enumerate(self._queues)
+            ]
+            for thread in self._threads:
+                thread.start()
+        # Eventos recebidos antes de um restart
+        self.requeue_pending(older_than_seconds=0)
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        for q in self._queues:
+            q.put(None)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def submit(self, event_pk: int, payment_ref: str):
+        if not self.running():
+            self.start()
+        self._queue_for(payment_ref).put(event_pk)
+
+    def _queue_for(self, payment_ref: str) -> queue.Queue:
+        return self._queues[zlib.crc32(payment_ref.encode()) % len(self._queues)]
+
+    def requeue_pending(self, older_than_seconds: int = REQUEUE_AFTER_SECONDS) -> int:
+        db = SessionLocal()
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=older_than_seconds)
+            pending = db.query(PaymentEvent.id, PaymentEvent.payment_ref).filter(
+                PaymentEvent.status == "received",
+                PaymentEvent.received_at <= cutoff
+            ).order_by(PaymentEvent.id).all()
+        finally:
+            db.close()
+        for event_pk, payment_ref in pending:
+            self.submit(event_pk, payment_ref)
+        return len(pending)
+
+    def _run(self, q: queue.Queue):
+        while not self._stop.is_set():
+            event_pk = q.get()
+            if event_pk is None:
+                return
+            self._process(event_pk)
+
+    def _process(self, event_pk: int):
+        db = SessionLocal()
+        try:
+            event = db.query(PaymentEvent).filter(
+                PaymentEvent.id == event_pk
+            ).with_for_update(skip_locked=True).first()
+            if event is None or event.status != "received":
+                return
+            # Um anterior que falhou (e aguarda nova tentativa) vai antes;
+            # a varredura reenfileira os dois, em ordem de id
+            earlier = db.query(PaymentEvent.id).filter(
+                PaymentEvent.payment_ref == event.payment_ref,
+                PaymentEvent.id < event.id,
+                PaymentEvent.status == "received"
+            ).first()
+            if earlier is not None:
+                db.rollback()
+                return
+            applied = apply_payment_event(db, event)
+            event.status = "processed"
+            event.attempts += 1
+            event.processed_at = datetime.now(timezone.utc)
+            db.commit()
+            if applied:
+                logger.info(f"Payment event {event.provider}/{event.event_id}: {applied} numbers updated (Ref: {event.payment_ref})")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error applying payment event {event_pk}: {e}")
+            self._record_failure(event_pk, e)
+        finally:
+            db.close()
+
+    def _record_failure(self, event_pk: int, error: Exception):
+        db = SessionLocal()
+        try:
+            event = db.query(PaymentEvent).get(event_pk)
+            if event is None:
+                return
+            event.attempts += 1
+            event.error = str(error)
+            if event.attempts >= settings.PAYMENT_EVENT_MAX_ATTEMPTS:
+                event.status = "failed"
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error recording payment event failure {event_pk}: {e}")
+        finally:
+            db.close()
+
+
+payment_event_worker = PaymentEventWorker()
+
+
+def requeue_payment_events():
+    """
+    Job do scheduler: reenfileira eventos que ainda não foram aplicados
+    (falha anterior ou perdidos num restart).
+    """
+    try:
+        if payment_event_worker.running():
+            payment_event_worker.requeue_pending()
+    except Exception as e:
+        logger.error(f"Error requeueing payment events: {e}")
@@ -0,0 +1,18 @@
+from sqlalchemy.orm import Session
+from app.models.audit_finance import PaymentLog
+from app.models.rifa_numero import NumeroStatus
+from app.core.user_stats import apply_payment_to_user
+from app.core.tenant_metrics import apply_payment_to_tenant
+from app.core.revenue_rollups import apply_payment_to_rollups
+
+
+def apply_payment_log(db: Session, log: PaymentLog, old_status: NumeroStatus = None):
+    """
+    Hook único para PaymentLog recém-criado: atualiza os agregados derivados
+    (user_stats, tenant_metrics, revenue_rollups) na transação do chamador.
+    Chamar junto do db.add(log), antes do commit. `old_status` é o status do
+    número antes da mudança (importa para cancelamento de número pago).
+    """
+    apply_payment_to_user(db, log, old_status)
+    apply_payment_to_tenant(db, log)
+    apply_payment_to_rollups(db, log)
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from zoneinfo import ZoneInfo
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+from sqlalchemy import String, cast, event, func
+from sqlalchemy.orm import Session
+from app.core.audit import AuditLogger
+from app.core.config import settings
+from app.core.payment_events import confirm_payment
+from app.db.session import SessionLocal
+from app.models.payment_intent import PaymentIntent
+from app.models.rifa_numero import RifaNumero, NumeroStatus
+from app.services.asaas_service import AsaasService
+
+logger = logging.getLogger(__name__)
+
+# Status do Asaas que contam como pago
+PAID_STATUSES = ("RECEIVED", "CONFIRMED")
+# Datas de filtro do Asaas (dateCreated) são no horário de Brasília
+ASAAS_TZ = ZoneInfo("America/Sao_Paulo")
+# A cobrança é criada no Asaas pouco antes da PaymentIntent ser gravada
+CREATED_AT_SLACK = timedelta(minutes=5)
+# Tamanho dos IN (...) ao cruzar as referências com o banco
+MATCH_BATCH_SIZE = 1000
+
+
+class PaymentStatusCache:
+    """
+    Cache curto (PAYMENT_STATUS_CACHE_SECONDS) payment_id -> (user_id, status)
+    para o /pagamentos/check: cliques repetidos não voltam ao banco. Todo
+    status expira (um pagamento confirmado ainda pode ser cancelado).
+    Quem muda o status de um pagamento chama put_after_commit/invalidate_after_commit
+    na própria sessão: o cache só muda depois do commit (ver listeners abaixo).
+    """
+
+    def __init__(self, ttl_seconds: int = settings.PAYMENT_STATUS_CACHE_SECONDS, max_size: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, object, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, payment_id: str) -> Optional[Tuple[object, str]]:
+        with self._lock:
+            entry = self._entries.get(payment_id)
+            if entry is None:
+                return None
+            expires_at, user_id, status = entry
+            if expires_at <= time.monotonic():
+                del self._entries[payment_id]
+                return None
+            self._entries.move_to_end(payment_id)
+            return user_id, status
+
+    def put(self, payment_id: str, user_id, status: str):
+        with self._lock:
+            self._entries[payment_id] = (time.monotonic() + self.ttl_seconds, user_id, status)
+            self._entries.move_to_end(payment_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, payment_id: str):
+        with self._lock:
+            self._entries.pop(payment_id, None)
+
+    def put_after_commit(self, db: Session, payment_id: str, user_id, status: str):
+        db.info.setdefault("payment_status_updates", []).append((payment_id, (user_id, status)))
+
+    def invalidate_after_commit(self, db: Session, payment_id: str):
+        db.info.setdefault("payment_status_updates", []).append((payment_id, None))
+
+
+payment_status_cache = PaymentStatusCache()
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_payment_status_updates(session):
+    for payment_id, value in session.info.pop("payment_status_updates", ()):
+        if value is None:
+            payment_status_cache.invalidate(payment_id)
+        else:
+            payment_status_cache.put(payment_id, *value)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_payment_status_updates(session):
+    session.info.pop("payment_status_updates", None)
+
+
+def _batches(items: list):
+    for i in range(0, len(items), MATCH_BATCH_SIZE):
+        yield items[i:i + MATCH_BATCH_SIZE]
+
+
+def _as_uuids(refs: Iterable[str]) -> list:
+    uuids = []
+    for ref in refs:
+        try:
+            uuids.append(uuid.UUID(ref))
+        except (TypeError, ValueError):
+            pass
+    return uuids
+
+
+def oldest_pending_intent(db: Session, since: datetime, reserved_only: bool = False) -> Optional[datetime]:
+    """
+    created_at da cobrança pendente mais antiga criada desde `since`
+    (None se não há nenhuma). Com `reserved_only`, só cobranças cujos números
+    ainda estão RESERVADO: uma reserva que expirou sem pagamento deixa a intent
+    "pending", mas não tem mais o que confirmar. Pelo
+    ix_payment_intents_status_created e pelo ix_rifa_numeros_payment_id.
+    """
+    query = db.query(func.min(PaymentIntent.created_at)).filter(
+        PaymentIntent.status == "pending",
+        PaymentIntent.created_at >= since
+    )
+    if reserved_only:
+        query = query.filter(
+            db.query(RifaNumero.id).filter(
+                RifaNumero.payment_id == cast(PaymentIntent.id, String),
+                RifaNumero.status == NumeroStatus.RESERVADO
+            ).exists()
+        )
+    return query.scalar()
+
+
+def open_payment_refs(db: Session, refs: Iterable[str]) -> set:
+    """
+    Referências que ainda têm números reservados (não pagos) no banco.
+    Uma consulta por lote, pelo ix_rifa_numeros_payment_id.
+    """
+    open_refs = set()
+    for batch in _batches(list(refs)):
+        open_refs.update(ref for (ref,) in db.query(RifaNumero.payment_id).filter(
+            RifaNumero.payment_id.in_(batch),
+            RifaNumero.status == NumeroStatus.RESERVADO
+        ).distinct())
+    return open_refs
+
+
+def _created_before(payment: dict, moment: datetime) -> bool:
+    """
+    True se a cobrança com certeza foi criada antes de `moment`. dateCreated
+    vem como data (às vezes data e hora) no horário de Brasília; só com a data,
+    a cobrança pode ser de qualquer hora do dia e só é "antes" em dia anterior.
+    """
+    value = payment.get("dateCreated")
+    if not value:
+        return False
+    try:
+        if len(value) > 10:
+            created = datetime.fromisoformat(value.replace(" ", "T"))
+            if created.tzinfo is None:
+                created = created.replace(tzinfo=ASAAS_TZ)
+            return created < moment
+        return date.fromisoformat(value) < moment.astimezone(ASAAS_TZ).date()
+    except ValueError:
+        return False
+
+
+async def fetch_paid_payments(service: AsaasService, since: date, not_before: Optional[datetime] = None) -> Dict[str, dict]:
+    """
+    Cobranças pagas no Asaas criadas desde `since`, por externalReference.
+    Uma listagem paginada por status pago. Com `not_before`, ignora as criadas
+    antes disso e para de paginar numa página só com elas (a listagem do Asaas
+    vem da mais recente para a mais antiga).
+    """
+    paid = {}
+    for status in PAID_STATUSES:
+        async for page in service.iter_payments(status=status, **{"dateCreated[ge]": since.isoformat()}):
+            recentes = [p for p in page if not (not_before and _created_before(p, not_before))]
+            for payment in recentes:
+                ref = payment.get("externalReference")
+                if ref:
+                    paid[ref] = payment
+            if not recentes:
+                break
+    return paid
+
+
+def apply_reconciliation(db: Session, paid: Dict[str, dict], sweep_expired: bool = False) -> int:
+    """
+    Confirma, numa transação só, todos os pagamentos de `paid` que ainda têm
+    números reservados. Com `sweep_expired`, cobranças pagas cuja reserva já
+    expirou (intent pendente sem números) ficam como "paid_expired" e vão para
+    a auditoria, para estorno ou realocação manual. Faz commit.
+    """
+    confirmed = 0
+    for ref in sorted(open_payment_refs(db, paid.keys())):
+        confirmed += confirm_payment(db, ref, "PAYMENT_CONFIRMED_RECONCILIATION")
+
+    # confirm_payment já marcou como "paid" as intents com números
+    for batch in _batches(_as_uuids(paid.keys()) if sweep_expired else []):
+        orphans = db.query(PaymentIntent).filter(
+            PaymentIntent.id.in_(batch),
+            PaymentIntent.status == "pending"
+        ).all()
+        for intent in orphans:
+            intent.status = "paid_expired"
+            logger.warning(f"Payment {intent.id} received after its reservation expired (Asaas: {intent.asaas_payment_id})")
+        AuditLogger.log_many(db, (
+            dict(
+                action="PAYMENT_RECEIVED_AFTER_EXPIRY",
+                entity_type="PaymentIntent",
+                entity_id=str(intent.id),
+                actor_id=None,
+                actor_role="system",
+                new_value={
+                    "asaas_payment_id": intent.asaas_payment_id,
+                    "numeros": intent.numeros,
+                    "amount": str(intent.amount)
+                },
+                tenant_id=intent.tenant_id
+            )
+            for intent in orphans
+        ))
+    db.commit()
+    return confirmed
+
+
+async def _fetch_paid(since: date, not_before: datetime) -> Dict[str, dict]:
+    # Roda na thread do scheduler, fora do event loop do servidor:
+    # usa um cliente próprio em vez do asaas_service compartilhado
+    async with AsaasService() as service:
+        return await fetch_paid_payments(service, since, not_before)
+
+
+def _reconcile(window_start: datetime, sweep_expired: bool):
+    db = SessionLocal()
+    try:
+        # A conciliação rápida só olha cobranças que ainda têm números reservados;
+        # a varredura de expiradas precisa justamente das que não têm
+        oldest = oldest_pending_intent(db, window_start, reserved_only=not sweep_expired)
+    finally:
+        db.close()
+    if oldest is None:
+        return
+
+    # dateCreated[ge] só aceita data: a listagem começa à meia-noite desse dia
+    # e o corte fino (not_before) é feito nas páginas
+    since = oldest.astimezone(ASAAS_TZ).date()
+    try:
+        paid = asyncio.run(_fetch_paid(since, oldest - CREATED_AT_SLACK))
+    except Exception as e:
+        logger.error(f"Error listing Asaas payments for reconciliation: {e}")
+        return
+
+    db = SessionLocal()
+    try:
+        confirmed = apply_reconciliation(db, paid, sweep_expired=sweep_expired)
+        if confirmed:
+            logger.info(f"Reconciliation confirmed {confirmed} numbers from {len(paid)} paid Asaas payments")
+    except Exception as e:
+        logger.error(f"Error applying payment reconciliation: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def reconcile_pending_payments():
+    """
+    Job do scheduler: rede de segurança para webhooks perdidos. Lista no Asaas
+    as cobranças pagas desde a cobrança pendente mais antiga (no máximo
+    PAYMENT_RECONCILE_WINDOW_MINUTES atrás) e confirma as que ainda estão
+    reservadas aqui, antes que a reserva expire.
+    """
+    now = datetime.now(timezone.utc)
+    _reconcile(now - timedelta(minutes=settings.PAYMENT_RECONCILE_WINDOW_MINUTES), sweep_expired=False)
+
+
+def reconcile_expired_payments():
+    """
+    Job do scheduler (mais lento): cobranças dos últimos
+    PAYMENT_RECONCILE_LOOKBACK_DAYS pagas depois de a reserva expirar viram
+    "paid_expired", para estorno ou realocação manual.
+    """
+    now = datetime.now(timezone.utc)
+    _reconcile(now - timedelta(days=settings.PAYMENT_RECONCILE_LOOKBACK_DAYS), sweep_expired=True)
@@ -0,0 +1,88 @@
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+from sqlalchemy import delete, func, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models.audit_finance import PaymentLog, PaymentLogStatus
+from app.models.revenue_rollup import RevenueRollup
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_TZ_NAME = "America/Sao_Paulo"
+ROLLUP_TZ = ZoneInfo(ROLLUP_TZ_NAME)
+GRANULARIDADES = {"hora": "hour", "dia": "day"}
+
+
+def bucket_start(moment: datetime, granularidade: str) -> datetime:
+    """
+    Início do período (hora/dia de São Paulo) que contém `moment`.
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    local = moment.astimezone(ROLLUP_TZ).replace(minute=0, second=0, microsecond=0)
+    if granularidade == "dia":
+        local = local.replace(hour=0)
+    return local
+
+
+def apply_payment_to_rollups(db: Session, log: PaymentLog, moment: datetime = None):
+    """
+    Soma um PaymentLog PAGO nos períodos de hora e de dia, na transação do chamador.
+    """
+    if log.status != PaymentLogStatus.PAGO or not log.tenant_id:
+        return
+    moment = moment or log.created_at or datetime.now(timezone.utc)
+    valor = Decimal(str(log.valor or 0))
+    for granularidade in GRANULARIDADES:
+        stmt = pg_insert(RevenueRollup).values(
+            tenant_id=log.tenant_id,
+            rifa_id=log.rifa_id,
+            metodo=log.metodo,
+            granularidade=granularidade,
+            bucket_start=bucket_start(moment, granularidade),
+            total=valor,
+            quantidade=1
+        )
+        db.execute(stmt.on_conflict_do_update(
+            constraint="uq_revenue_rollups_bucket",
+            set_={
+                "total": RevenueRollup.total + stmt.excluded.total,
+                "quantidade": RevenueRollup.quantidade + stmt.excluded.quantidade
+            }
+        ))
+
+
+def rebuild_revenue_rollups(db: Session) -> int:
+    """
+    Recalcula revenue_rollups inteiro a partir de payment_logs (uma transação).
+    """
+    db.execute(delete(RevenueRollup))
+    total_rows = 0
+    for granularidade, unit in GRANULARIDADES.items():
+        # date_trunc no horário local e volta para timestamptz
+        bucket = func.timezone(
+            ROLLUP_TZ_NAME,
+            func.date_trunc(unit, func.timezone(ROLLUP_TZ_NAME, PaymentLog.created_at))
+        )
+        source = select(
+            PaymentLog.tenant_id,
+            PaymentLog.rifa_id,
+            PaymentLog.metodo,
+            literal(granularidade),
+            bucket,
+            func.sum(PaymentLog.valor),
+            func.count(PaymentLog.id)
+        ).where(
+            PaymentLog.status == PaymentLogStatus.PAGO,
+            PaymentLog.tenant_id.isnot(None)
+        ).group_by(PaymentLog.tenant_id, PaymentLog.rifa_id, PaymentLog.metodo, bucket)
+        result = db.execute(pg_insert(RevenueRollup).from_select(
+            ["tenant_id", "rifa_id", "metodo", "granularidade", "bucket_start", "total", "quantidade"],
+            source
+        ))
+        total_rows += result.rowcount
+    db.commit()
+    logger.info(f"Rebuilt revenue_rollups ({total_rows} rows)")
+    return total_rows
@@ -1,13 +1,20 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from sqlalchemy.orm import Session
 from app.core.audit import AuditLogger
+from app.core.antifraud import blocklist
+from app.core.tenant_metrics import apply_rifa_status
+from app.core.numero_changes import record_numero_changes, prune_numero_changes
+from app.core.audit_partitions import maintain_audit_partitions
+from app.core.payment_events import requeue_payment_events
+from app.core.payment_reconciliation import reconcile_pending_payments, reconcile_expired_payments
+from app.core.config import settings
 from datetime import datetime, timezone, timedelta
 from app.models.rifa_numero import RifaNumero, NumeroStatus
 from app.models.rifa import Rifa, RifaStatus
 from app.db.session import SessionLocal
 from app.models.audit_finance import AuditLog
 from app.models.antifraud import BlockedEntity, BlockedEntityType
-from sqlalchemy import func, or_, and_
+from sqlalchemy import func, or_, and_, select, update
 import logging
 
 logger = logging.getLogger(__name__)
@@ -88,47 +95,88 @@ def run_antifraud_analysis():
                 db.add(blocked)
         
         db.commit()
+        blocklist.invalidate()
         
     except Exception as e:
         logger.error(f"Error in antifraud analysis: {e}")
     finally:
         db.close()
 
-def release_expired_reservations():
+# Reservas expiradas processadas por transação; limita o tempo de lock por lote
+EXPIRATION_BATCH_SIZE = 500
+
+def expire_reservations(db: Session, numero_ids: list = None, batch_size: int = EXPIRATION_BATCH_SIZE) -> int:
     """
-    Check for expired reservations and set them to EXPIRADO.
+    Libera reservas vencidas com UPDATE ... RETURNING em lotes.
+    Cada lote custa 3 round-trips (update, auditoria, feed de mudanças) e um commit.
+    SKIP LOCKED evita esperar por números que estão sendo pagos/reservados agora.
+    Com `numero_ids`, considera só esses números (usado pela expiry wheel).
     """
-    db = SessionLocal()
-    try:
+    total = 0
+    while True:
         now = datetime.now(timezone.utc)
-        expired_numbers = db.query(RifaNumero).filter(
+        expired = select(RifaNumero.id, RifaNumero.user_id).where(
             RifaNumero.status == NumeroStatus.RESERVADO,
-            RifaNumero.reserved_until < now
+            RifaNumero.reserved_until <= now
+        )
+        if numero_ids is not None:
+            expired = expired.where(RifaNumero.id.in_(numero_ids))
+        expired = expired.limit(batch_size).with_for_update(skip_locked=True).subquery()
+
+        released = db.execute(
+            update(RifaNumero)
+            .where(RifaNumero.id == expired.c.id)
+            .values(
+                status=NumeroStatus.LIVRE,
+                user_id=None, # Prompt explicitly asks to clean user_id
+                payment_id=None,
+                reserved_until=None,
+                updated_at=now
+            )
+            .returning(RifaNumero.id, RifaNumero.rifa_id, RifaNumero.numero, RifaNumero.tenant_id, expired.c.user_id)
+            .execution_options(synchronize_session=False)
         ).all()
-        
-        if expired_numbers:
-            logger.info(f"Found {len(expired_numbers)} expired reservations. Expiring...")
-            for num in expired_numbers:
-                old_status = num.status
-                old_user_id = num.user_id
 
-                num.status = NumeroStatus.LIVRE
-                num.user_id = None # Prompt explicitly asks to clean user_id
-                num.payment_id = None
-                num.reserved_until = None
-                
-                AuditLogger.log(
-                    db=db,
-                    action="RESERVATION_EXPIRED_JOB",
-                    entity_type="RifaNumero",
-                    entity_id=str(num.id),
-                    actor_id=str(old_user_id) if old_user_id else None,
-                    actor_role="system",
-                    old_value={"status": str(old_status)},
-                    new_value={"status": "livre"},
-                    tenant_id=num.tenant_id
-                )
-            db.commit()
+        if not released:
+            break
+
+        AuditLogger.log_many(db, (
+            dict(
+                action="RESERVATION_EXPIRED_JOB",
+                entity_type="RifaNumero",
+                entity_id=str(row.id),
+                actor_id=row.user_id,
+                actor_role="system",
+                old_value={"status": str(NumeroStatus.RESERVADO)},
+                new_value={"status": "livre"},
+                tenant_id=row.tenant_id
+            ) for row in released
+        ))
+        record_numero_changes(db, (
+            dict(
+                rifa_id=row.rifa_id,
+                numero=row.numero,
+                status=NumeroStatus.LIVRE,
+                user_id=None,
+                tenant_id=row.tenant_id
+            ) for row in released
+        ))
+        db.commit()
+
+        total += len(released)
+        if len(released) < batch_size:
+            break
+    return total
+
+def release_expired_reservations():
+    """
+    Check for expired reservations and set them back to LIVRE.
+    """
+    db = SessionLocal()
+    try:
+        released = expire_reservations(db)
+        if released:
+            logger.info(f"Released {released} expired reservations.")
     except Exception as e:
         logger.error(f"Error releasing expired reservations: {e}")
         db.rollback()
@@ -164,6 +212,7 @@ def close_expired_rifas():
             for rifa in expired_rifas:
                 old_status = rifa.status
                 rifa.status = RifaStatus.ENCERRADA
+                apply_rifa_status(db, rifa, old_status)
                 
                 AuditLogger.log(
                     db=db,
@@ -183,6 +232,13 @@ def close_expired_rifas():
         db.close()
 
 scheduler = BackgroundScheduler()
-scheduler.add_job(release_expired_reservations, 'interval', minutes=1)
+# Rede de segurança: a expiração precisa é feita pela expiry wheel (app/core/expiry_wheel.py)
+scheduler.add_job(release_expired_reservations, 'interval', minutes=10)
 scheduler.add_job(close_expired_rifas, 'interval', minutes=1)
 scheduler.add_job(run_antifraud_analysis, 'interval', minutes=5)
+scheduler.add_job(prune_numero_changes, 'interval', minutes=10)
+scheduler.add_job(maintain_audit_partitions, 'interval', hours=6)
+scheduler.add_job(requeue_payment_events, 'interval', minutes=1)
+# Webhooks perdidos: conciliação com a listagem do Asaas
+scheduler.add_job(reconcile_pending_payments, 'interval', seconds=settings.PAYMENT_RECONCILE_INTERVAL_SECONDS)
+scheduler.add_job(reconcile_expired_payments, 'interval', minutes=settings.PAYMENT_RECONCILE_EXPIRED_INTERVAL_MINUTES)
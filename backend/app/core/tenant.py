@@ -1,55 +1,142 @@
-from fastapi import Request, HTTPException, Depends
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional
+from fastapi import Request, HTTPException
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from app.db.session import SessionLocal
 from app.models.tenant import Tenant
+import threading
+import time
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Tenant principal: localhost e tarefas internas (bot) caem nele
+MAIN_TENANT_DOMAIN = "imperiodasrifas.app.br"
+LOCAL_HOSTS = ("127.0.0.1", "localhost")
+# Tenants alterados fora deste processo (scripts, SQL direto) aparecem no máximo depois disso
+TENANT_REGISTRY_TTL_SECONDS = 300
 
-def get_tenant_by_host(request: Request, db: Session = Depends(get_db)) -> Tenant:
+@dataclass(frozen=True)
+class TenantSnapshot:
+    """
+    Cópia imutável de uma linha de tenants, desligada de qualquer sessão.
+    Mesmos atributos do model Tenant (sem os relacionamentos).
+    """
+    id: uuid.UUID
+    name: str
+    domain: str
+    logo_url: Optional[str] = None
+    primary_color: Optional[str] = None
+    secondary_color: Optional[str] = None
+    pix_key: Optional[str] = None
+    picpay_config: Optional[Mapping] = None
+
+    @classmethod
+    def from_model(cls, tenant: Tenant) -> "TenantSnapshot":
+        return cls(
+            id=tenant.id,
+            name=tenant.name,
+            domain=tenant.domain,
+            logo_url=tenant.logo_url,
+            primary_color=tenant.primary_color,
+            secondary_color=tenant.secondary_color,
+            pix_key=tenant.pix_key,
+            picpay_config=MappingProxyType(dict(tenant.picpay_config)) if tenant.picpay_config else None
+        )
+
+
+class TenantRegistry:
+    """
+    Todos os tenants em memória, por domínio (a tabela é pequena e quase não muda).
+    Recarregado quando expira (TTL) ou quando `invalidate()` é chamado; commits
+    que inserem/alteram/removem um Tenant pelo ORM invalidam sozinhos (ver
+    listeners abaixo). UPDATE em massa ou SQL direto dependem do TTL.
+    """
+
+    def __init__(self, ttl_seconds: int = TENANT_REGISTRY_TTL_SECONDS):
+        self.ttl = ttl_seconds
+        self._by_domain: Dict[str, TenantSnapshot] = {}
+        self._first: Optional[TenantSnapshot] = None
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _load(self):
+        db = SessionLocal()
+        try:
+            tenants = db.query(Tenant).order_by(Tenant.created_at, Tenant.id).all()
+            snapshots = [TenantSnapshot.from_model(t) for t in tenants]
+        finally:
+            db.close()
+        return {s.domain: s for s in snapshots}, (snapshots[0] if snapshots else None)
+
+    def _current(self) -> Dict[str, TenantSnapshot]:
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._by_domain
+            # Carrega segurando o lock: evita várias requisições recarregando juntas
+            self._by_domain, self._first = self._load()
+            self._loaded_at = time.monotonic()
+            return self._by_domain
+
+    def get(self, domain: str) -> Optional[TenantSnapshot]:
+        return self._current().get(domain)
+
+    def resolve_host(self, host: str) -> Optional[TenantSnapshot]:
+        by_domain = self._current()
+        if host in LOCAL_HOSTS:
+            # Force production tenant on localhost for development to access production data;
+            # if it is not seeded, fall back to a tenant registered for the host or for "localhost"
+            for domain in (MAIN_TENANT_DOMAIN, host, "localhost"):
+                if domain in by_domain:
+                    return by_domain[domain]
+            return None
+        return by_domain.get(host)
+
+    def default(self) -> Optional[TenantSnapshot]:
+        by_domain = self._current()
+        return by_domain.get(MAIN_TENANT_DOMAIN) or self._first
+
+
+tenant_registry = TenantRegistry()
+
+
+# Invalidação: marca a sessão quando um Tenant é gravado e só limpa o registro
+# depois do commit (antes disso outra requisição recarregaria o valor antigo).
+# Uma marca que sobra de um rollback só causa um recarregamento a mais.
+def _mark_tenants_changed(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info["tenants_changed"] = True
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(Tenant, _event_name, _mark_tenants_changed)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("tenants_changed", False):
+        tenant_registry.invalidate()
+
+
+def get_tenant_by_host(request: Request) -> TenantSnapshot:
     host = request.headers.get("host", "").split(":")[0] # Remove port if present
-    
-    # Force production tenant on localhost for development to access production data
-    if host == "127.0.0.1" or host == "localhost":
-        tenant = db.query(Tenant).filter(Tenant.domain == "imperiodasrifas.app.br").first()
-        if tenant:
-            return tenant
-
-    tenant = db.query(Tenant).filter(Tenant.domain == host).first()
-    
-    if not tenant:
-        # Fallback for localhost development:
-        # Redirect localhost to the main production tenant ("Imperio das Rifas")
-        # so we can see/manage production data locally.
-        if host == "127.0.0.1" or host == "localhost":
-             tenant = db.query(Tenant).filter(Tenant.domain == "imperiodasrifas.app.br").first()
-             
-        # If still not found (e.g. production tenant domain changed or not seeded), 
-        # try finding the specific "localhost" tenant as a last resort
-        if not tenant and (host == "127.0.0.1" or host == "localhost"):
-             tenant = db.query(Tenant).filter(Tenant.domain == "localhost").first()
-    
+
+    tenant = tenant_registry.resolve_host(host)
+
     if not tenant:
-        # Final fallback: default tenant? Or 404?
-        # "White-label" usually implies strict domain matching.
-        # But for ease of testing, let's grab the first one if strict fails?
-        # No, safer to return 404 to verify isolation.
+        # "White-label" usually implies strict domain matching:
+        # return 404 instead of a default tenant to verify isolation.
         raise HTTPException(status_code=404, detail=f"Tenant not found for domain {host}")
-        
+
     return tenant
 
-def get_tenant_by_host_or_default(db: Session = Depends(get_db)) -> Tenant:
+def get_tenant_by_host_or_default() -> Optional[TenantSnapshot]:
     # This function is used for internal tasks or webhooks where we might default to the main tenant
-    # For now, hardcode the main tenant for the bot
-    tenant = db.query(Tenant).filter(Tenant.domain == "imperiodasrifas.app.br").first()
-    if not tenant:
-        # Fallback to first tenant
-        tenant = db.query(Tenant).first()
-    return tenant
+    # (falls back to the first tenant)
+    return tenant_registry.default()
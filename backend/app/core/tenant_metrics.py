@@ -0,0 +1,142 @@
+import logging
+from decimal import Decimal
+from sqlalchemy import delete, func, select, union
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models.audit_finance import AuditLog, PaymentLog, PaymentLogStatus
+from app.models.rifa import Rifa, RifaStatus
+from app.models.rifa_numero import RifaNumero, NumeroStatus
+from app.models.tenant import Tenant
+from app.models.tenant_metrics import TenantMetrics
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Status de rifa que têm contador próprio
+RIFA_STATUS_COUNTERS = {
+    RifaStatus.ATIVA: "rifas_ativas",
+    RifaStatus.ENCERRADA: "rifas_encerradas",
+}
+
+
+def bump_tenant_metrics(db: Session, tenant_id, **deltas):
+    """
+    Soma os deltas nos contadores do tenant (criando a linha se preciso),
+    na transação do chamador. Ex.: bump_tenant_metrics(db, tid, total_reservas=3)
+    """
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not tenant_id or not deltas:
+        return
+    stmt = pg_insert(TenantMetrics).values(tenant_id=tenant_id, **deltas)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[TenantMetrics.tenant_id],
+        set_={
+            **{k: getattr(TenantMetrics, k) + v for k, v in deltas.items()},
+            "updated_at": func.now()
+        }
+    ))
+
+
+def apply_payment_to_tenant(db: Session, log: PaymentLog):
+    valor = Decimal(str(log.valor or 0))
+    if log.status == PaymentLogStatus.PAGO:
+        bump_tenant_metrics(db, log.tenant_id, total_arrecadado=valor, total_pago_count=1)
+    elif log.status == PaymentLogStatus.CANCELADO:
+        bump_tenant_metrics(db, log.tenant_id, total_cancelado=valor)
+
+
+def apply_rifa_status(db: Session, rifa: Rifa, old_status=None):
+    """
+    Chamar depois de mudar rifa.status (old_status=None para rifa nova).
+    """
+    old = RifaStatus(old_status) if old_status else None
+    new = RifaStatus(rifa.status)
+    if old == new:
+        return
+    deltas = {}
+    if old in RIFA_STATUS_COUNTERS:
+        deltas[RIFA_STATUS_COUNTERS[old]] = -1
+    if new in RIFA_STATUS_COUNTERS:
+        deltas[RIFA_STATUS_COUNTERS[new]] = deltas.get(RIFA_STATUS_COUNTERS[new], 0) + 1
+    bump_tenant_metrics(db, rifa.tenant_id, **deltas)
+
+
+def apply_user_active(db: Session, tenant_id, old_active: bool, new_active: bool):
+    """
+    old_active=False para usuário novo; new_active=False para usuário removido.
+    """
+    if bool(old_active) != bool(new_active):
+        bump_tenant_metrics(db, tenant_id, usuarios_ativos=1 if new_active else -1)
+
+
+def apply_reservas(db: Session, tenant_id, quantidade: int = 1):
+    bump_tenant_metrics(db, tenant_id, total_reservas=quantidade)
+
+
+def rebuild_tenant_metrics(db: Session) -> int:
+    """
+    Recalcula tenant_metrics inteiro a partir das tabelas de origem (uma transação).
+
+    total_reservas é aproximado: reservas que expiraram só deixam rastro em
+    audit_logs (RESERVE_NUMBER), e os meses arquivados saem de lá. Usa o maior
+    entre a contagem da auditoria e os números que ainda mostram ter sido
+    reservados (rifa_numeros reservados/pagos/cancelados e payment_logs), que
+    não dependem da retenção. Os demais contadores são exatos.
+    """
+    pagamentos = select(
+        PaymentLog.tenant_id,
+        func.sum(PaymentLog.valor).filter(PaymentLog.status == PaymentLogStatus.PAGO).label("total_arrecadado"),
+        func.sum(PaymentLog.valor).filter(PaymentLog.status == PaymentLogStatus.CANCELADO).label("total_cancelado"),
+        func.count(PaymentLog.id).filter(PaymentLog.status == PaymentLogStatus.PAGO).label("total_pago_count")
+    ).group_by(PaymentLog.tenant_id).subquery()
+    rifas = select(
+        Rifa.tenant_id,
+        func.count(Rifa.id).filter(Rifa.status == RifaStatus.ATIVA).label("rifas_ativas"),
+        func.count(Rifa.id).filter(Rifa.status == RifaStatus.ENCERRADA).label("rifas_encerradas")
+    ).group_by(Rifa.tenant_id).subquery()
+    usuarios = select(
+        User.tenant_id,
+        func.count(User.id).label("usuarios_ativos")
+    ).where(User.is_active == True).group_by(User.tenant_id).subquery()
+    reservas_auditadas = select(
+        AuditLog.tenant_id,
+        func.count(AuditLog.id).label("total_reservas")
+    ).where(AuditLog.action == "RESERVE_NUMBER").group_by(AuditLog.tenant_id).subquery()
+    numeros_reservados = union(
+        select(RifaNumero.tenant_id, RifaNumero.id.label("numero_id")).where(
+            RifaNumero.status.in_([NumeroStatus.RESERVADO, NumeroStatus.PAGO, NumeroStatus.CANCELADO])
+        ),
+        select(PaymentLog.tenant_id, PaymentLog.numero_id)
+    ).subquery()
+    reservas_numeros = select(
+        numeros_reservados.c.tenant_id,
+        func.count().label("total_reservas")
+    ).group_by(numeros_reservados.c.tenant_id).subquery()
+
+    source = select(
+        Tenant.id,
+        func.coalesce(pagamentos.c.total_arrecadado, 0),
+        func.coalesce(pagamentos.c.total_cancelado, 0),
+        func.coalesce(pagamentos.c.total_pago_count, 0),
+        func.coalesce(rifas.c.rifas_ativas, 0),
+        func.coalesce(rifas.c.rifas_encerradas, 0),
+        func.coalesce(usuarios.c.usuarios_ativos, 0),
+        func.greatest(
+            func.coalesce(reservas_auditadas.c.total_reservas, 0),
+            func.coalesce(reservas_numeros.c.total_reservas, 0)
+        )
+    ).outerjoin(pagamentos, pagamentos.c.tenant_id == Tenant.id) \
+     .outerjoin(rifas, rifas.c.tenant_id == Tenant.id) \
+     .outerjoin(usuarios, usuarios.c.tenant_id == Tenant.id) \
+     .outerjoin(reservas_auditadas, reservas_auditadas.c.tenant_id == Tenant.id) \
+     .outerjoin(reservas_numeros, reservas_numeros.c.tenant_id == Tenant.id)
+
+    db.execute(delete(TenantMetrics))
+    result = db.execute(pg_insert(TenantMetrics).from_select(
+        ["tenant_id", "total_arrecadado", "total_cancelado", "total_pago_count",
+         "rifas_ativas", "rifas_encerradas", "usuarios_ativos", "total_reservas"],
+        source
+    ))
+    db.commit()
+    logger.info(f"Rebuilt tenant_metrics for {result.rowcount} tenants")
+    return result.rowcount
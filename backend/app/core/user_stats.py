@@ -0,0 +1,114 @@
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models.audit_finance import PaymentLog, PaymentLogStatus
+from app.models.rifa_ganhador import RifaGanhador
+from app.models.rifa_numero import RifaNumero, NumeroStatus
+from app.models.user import User
+from app.models.user_stats import UserStats
+
+logger = logging.getLogger(__name__)
+
+# ultima_compra de quem nunca comprou (a coluna é NOT NULL para caber no índice do ranking)
+NUNCA_COMPROU = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def create_user_stats(db: Session, user: User):
+    """
+    Linha zerada para um usuário recém-criado (o ranking só lê user_stats).
+    Na transação do chamador; faz flush para ter o id do usuário.
+    """
+    db.flush()
+    db.execute(pg_insert(UserStats).values(
+        user_id=user.id,
+        tenant_id=user.tenant_id
+    ).on_conflict_do_nothing(index_elements=[UserStats.user_id]))
+
+
+def _bump(db: Session, user_id, tenant_id, total_gasto=0, numeros_comprados=0, vitorias=0, ultima_compra=None):
+    """
+    Soma os deltas na linha do usuário (criando-a se preciso), na transação do chamador.
+    """
+    if not user_id:
+        return
+    stmt = pg_insert(UserStats).values(
+        user_id=user_id,
+        tenant_id=tenant_id,
+        total_gasto=total_gasto,
+        numeros_comprados=max(numeros_comprados, 0),
+        vitorias=vitorias,
+        ultima_compra=ultima_compra or NUNCA_COMPROU
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[UserStats.user_id],
+        set_={
+            "total_gasto": UserStats.total_gasto + total_gasto,
+            "numeros_comprados": func.greatest(UserStats.numeros_comprados + numeros_comprados, 0),
+            "vitorias": UserStats.vitorias + vitorias,
+            "ultima_compra": func.greatest(UserStats.ultima_compra, stmt.excluded.ultima_compra),
+            "updated_at": func.now()
+        }
+    ))
+
+
+def apply_payment_to_user(db: Session, log: PaymentLog, old_status: NumeroStatus = None):
+    """
+    PAGO soma valor e número; CANCELADO de um número que estava PAGO tira o número
+    (o total gasto segue a soma dos logs PAGO, como o relatório sempre fez).
+    """
+    if log.status == PaymentLogStatus.PAGO:
+        _bump(
+            db, log.user_id, log.tenant_id,
+            total_gasto=Decimal(str(log.valor or 0)),
+            numeros_comprados=1,
+            ultima_compra=datetime.now(timezone.utc)
+        )
+    elif log.status == PaymentLogStatus.CANCELADO and old_status == NumeroStatus.PAGO:
+        _bump(db, log.user_id, log.tenant_id, numeros_comprados=-1)
+
+
+def apply_ganhador(db: Session, ganhador: RifaGanhador):
+    _bump(db, ganhador.user_id, ganhador.tenant_id, vitorias=1)
+
+
+def rebuild_user_stats(db: Session) -> int:
+    """
+    Recalcula user_stats inteiro a partir das tabelas de origem (uma transação).
+    Todo usuário ganha linha, inclusive quem nunca comprou.
+    """
+    gastos = select(
+        PaymentLog.user_id,
+        func.sum(PaymentLog.valor).label("total_gasto"),
+        func.max(PaymentLog.created_at).label("ultima_compra")
+    ).where(PaymentLog.status == PaymentLogStatus.PAGO).group_by(PaymentLog.user_id).subquery()
+    comprados = select(
+        RifaNumero.user_id,
+        func.count(RifaNumero.id).label("numeros_comprados")
+    ).where(RifaNumero.status == NumeroStatus.PAGO).group_by(RifaNumero.user_id).subquery()
+    vitorias = select(
+        RifaGanhador.user_id,
+        func.count(RifaGanhador.id).label("vitorias")
+    ).group_by(RifaGanhador.user_id).subquery()
+
+    source = select(
+        User.id,
+        User.tenant_id,
+        func.coalesce(gastos.c.total_gasto, 0),
+        func.coalesce(comprados.c.numeros_comprados, 0),
+        func.coalesce(vitorias.c.vitorias, 0),
+        func.coalesce(gastos.c.ultima_compra, NUNCA_COMPROU)
+    ).outerjoin(gastos, gastos.c.user_id == User.id) \
+     .outerjoin(comprados, comprados.c.user_id == User.id) \
+     .outerjoin(vitorias, vitorias.c.user_id == User.id)
+
+    db.execute(delete(UserStats))
+    result = db.execute(pg_insert(UserStats).from_select(
+        ["user_id", "tenant_id", "total_gasto", "numeros_comprados", "vitorias", "ultima_compra"],
+        source
+    ))
+    db.commit()
+    logger.info(f"Rebuilt user_stats for {result.rowcount} users")
+    return result.rowcount
@@ -5,6 +5,7 @@ from app.models.user import User
 from app.core.security import get_password_hash
 from app.models.tenant import Tenant
 from app.core.config import settings
+from app.core.audit_partitions import is_partitioned, ensure_partitions
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +18,77 @@ def init_db(db: Session) -> None:
     if "whatsapp_opt_in" not in cols:
         db.execute(text("ALTER TABLE users ADD COLUMN whatsapp_opt_in BOOLEAN NOT NULL DEFAULT FALSE"))
         db.commit()
+    if "asaas_customer_id" not in cols:
+        db.execute(text("ALTER TABLE users ADD COLUMN asaas_customer_id VARCHAR NULL"))
+        db.commit()
+    rifa_cols = [c["name"] for c in inspector.get_columns("rifas")]
+    if "lazy_numeros" not in rifa_cols:
+        db.execute(text("ALTER TABLE rifas ADD COLUMN lazy_numeros BOOLEAN NOT NULL DEFAULT FALSE"))
+        db.commit()
+    change_cols = [c["name"] for c in inspector.get_columns("rifa_numero_changes")]
+    if "txid" not in change_cols:
+        # Linhas existentes ficam com o txid do ALTER: clientes com versões antigas recebem snapshot
+        db.execute(text(
+            "ALTER TABLE rifa_numero_changes ADD COLUMN txid BIGINT NOT NULL "
+            "DEFAULT (pg_current_xact_id()::text)::bigint"
+        ))
+        db.commit()
+    stats_cols = {c["name"]: c for c in inspector.get_columns("user_stats")}
+    if stats_cols["ultima_compra"]["nullable"]:
+        # Ranking ordena pela coluna crua: quem nunca comprou vira 1970-01-01 (NUNCA_COMPROU)
+        db.execute(text("UPDATE user_stats SET ultima_compra = '1970-01-01 00:00:00+00' WHERE ultima_compra IS NULL"))
+        db.execute(text("ALTER TABLE user_stats ALTER COLUMN ultima_compra SET DEFAULT '1970-01-01 00:00:00+00'"))
+        db.execute(text("ALTER TABLE user_stats ALTER COLUMN ultima_compra SET NOT NULL"))
+        db.commit()
+    # Índices declarados nos models mas ausentes em bancos criados antes deles
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_rifa_numeros_user_id_status ON rifa_numeros (user_id, status)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_rifa_numeros_payment_id ON rifa_numeros (payment_id)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_rifa_numero_changes_rifa_id_txid ON rifa_numero_changes (rifa_id, txid)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_rifa_numero_changes_txid ON rifa_numero_changes (txid)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_payment_intents_status_created ON payment_intents (status, created_at)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_payment_events_payment_ref_id ON payment_events (payment_ref, id)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_user_stats_tenant_total_gasto ON user_stats (tenant_id, total_gasto, user_id)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_user_stats_tenant_numeros_comprados ON user_stats (tenant_id, numeros_comprados, user_id)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_user_stats_tenant_vitorias ON user_stats (tenant_id, vitorias, user_id)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_user_stats_tenant_ultima_compra ON user_stats (tenant_id, ultima_compra, user_id)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_logs_tenant_created ON audit_logs (tenant_id, created_at, id)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_logs_tenant_action_created ON audit_logs (tenant_id, action, created_at, id)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_logs_tenant_actor_created ON audit_logs (tenant_id, actor_id, created_at, id)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_logs_tenant_entity_created ON audit_logs (tenant_id, entity_type, entity_id, created_at, id)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_logs_tenant_entity_id_created ON audit_logs (tenant_id, entity_id, created_at, id)"))
+    db.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_logs_tenant_ip_created ON audit_logs (tenant_id, ip_address, created_at, id)"))
+    db.commit()
+    # audit_logs particionada: garante default + partições do mês atual e seguintes
+    if is_partitioned(db):
+        ensure_partitions(db)
+        db.commit()
+    else:
+        logger.warning("audit_logs is not partitioned; run scripts/partition_audit_logs.py")
+    # user_stats recém-criada num banco com histórico: preenche a partir das tabelas de origem
+    if db.execute(text("SELECT NOT EXISTS (SELECT 1 FROM user_stats) AND EXISTS (SELECT 1 FROM payment_logs)")).scalar():
+        from app.core.user_stats import rebuild_user_stats
+        rebuild_user_stats(db)
+    # Todo usuário tem linha (o ranking não faz LEFT JOIN): completa os que faltam zerados
+    db.execute(text(
+        "INSERT INTO user_stats (user_id, tenant_id) "
+        "SELECT u.id, u.tenant_id FROM users u "
+        "WHERE NOT EXISTS (SELECT 1 FROM user_stats s WHERE s.user_id = u.id) "
+        "ON CONFLICT DO NOTHING"
+    ))
+    db.commit()
+    if db.execute(text("SELECT NOT EXISTS (SELECT 1 FROM tenant_metrics) AND EXISTS (SELECT 1 FROM tenants)")).scalar():
+        from app.core.tenant_metrics import rebuild_tenant_metrics
+        rebuild_tenant_metrics(db)
+    if db.execute(text("SELECT NOT EXISTS (SELECT 1 FROM revenue_rollups) AND EXISTS (SELECT 1 FROM payment_logs)")).scalar():
+        from app.core.revenue_rollups import rebuild_revenue_rollups
+        rebuild_revenue_rollups(db)
+    try:
+        db.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_rifa_numeros_rifa_id_numero ON rifa_numeros (rifa_id, numero)"))
+        db.commit()
+    except Exception as e:
+        # Bancos antigos podem ter números duplicados; rifas preguiçosas dependem desse índice
+        db.rollback()
+        logger.error(f"Could not create uq_rifa_numeros_rifa_id_numero (duplicated numbers?): {e}")
     # tenant = db.query(Tenant).filter(Tenant.domain == "localhost").first()
     # if not tenant:
     #     logger.info("Creating default localhost tenant...")
@@ -7,6 +7,12 @@ from app.db.base import Base
 from app.routers import auth, rifas, webhooks, admin, dashboard, payments, sorteios, admin_settings, whatsapp_bot
 from app.db.init_db import init_db
 from app.core.scheduler import scheduler
+from app.core.expiry_wheel import expiry_wheel
+from app.core.numero_stream import numero_broadcaster
+from app.core.audit import audit_writer
+from app.core.broadcast import broadcast_engine
+from app.core.payment_events import payment_event_worker
+from app.services.asaas_service import asaas_service
 import logging
 
 # Configure logging
@@ -50,14 +56,53 @@ def on_startup():
     finally:
         db.close()
     
+    logger.info("Starting audit writer...")
+    audit_writer.start()
+
     # Start Scheduler
     logger.info("Starting background scheduler...")
     scheduler.start()
 
+    logger.info("Starting reservation expiry wheel...")
+    try:
+        expiry_wheel.start()
+    except Exception as e:
+        logger.error(f"Error starting expiry wheel: {e}")
+
+    logger.info("Starting broadcast engine...")
+    try:
+        broadcast_engine.start()
+    except Exception as e:
+        logger.error(f"Error starting broadcast engine: {e}")
+
+    logger.info("Starting payment event workers...")
+    try:
+        payment_event_worker.start()
+    except Exception as e:
+        logger.error(f"Error starting payment event workers: {e}")
+
 @app.on_event("shutdown")
 def on_shutdown():
     logger.info("Shutting down background scheduler...")
     scheduler.shutdown()
+    expiry_wheel.shutdown()
+    broadcast_engine.stop()
+    payment_event_worker.stop()
+    logger.info("Flushing audit writer...")
+    audit_writer.stop()
+
+@app.on_event("shutdown")
+async def stop_numero_stream():
+    await numero_broadcaster.stop()
+
+# Cliente HTTP do Asaas: criado no event loop do servidor e reaproveitado entre requisições
+@app.on_event("startup")
+async def start_asaas_client():
+    await asaas_service.start()
+
+@app.on_event("shutdown")
+async def close_asaas_client():
+    await asaas_service.close()
 
 # --- Routers ---
 app.include_router(auth.router, prefix="/api/v1", tags=["auth"])
@@ -1,6 +1,6 @@
 import uuid
 import enum
-from sqlalchemy import Column, String, Integer, Numeric, DateTime, ForeignKey, Enum, Text, JSON
+from sqlalchemy import Column, String, Integer, Numeric, DateTime, ForeignKey, Enum, Text, JSON, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -34,6 +34,18 @@ class PaymentLog(Base):
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        # Navegação por cursor (created_at, id) com os filtros do /admin/auditoria
+        Index("ix_audit_logs_tenant_created", "tenant_id", "created_at", "id"),
+        Index("ix_audit_logs_tenant_action_created", "tenant_id", "action", "created_at", "id"),
+        Index("ix_audit_logs_tenant_actor_created", "tenant_id", "actor_id", "created_at", "id"),
+        Index("ix_audit_logs_tenant_entity_created", "tenant_id", "entity_type", "entity_id", "created_at", "id"),
+        # entity_id sem entity_type (inclusive o parâmetro antigo `entity`)
+        Index("ix_audit_logs_tenant_entity_id_created", "tenant_id", "entity_id", "created_at", "id"),
+        Index("ix_audit_logs_tenant_ip_created", "tenant_id", "ip_address", "created_at", "id"),
+        # Particionada por mês (app/core/audit_partitions.py); a PK precisa conter created_at
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     actor_id = Column(UUID(as_uuid=True), nullable=True) # Nullable for system actions? Or use specific system ID
@@ -49,4 +61,4 @@ class AuditLog(Base):
     user_agent = Column(String, nullable=True)
     tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=True)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
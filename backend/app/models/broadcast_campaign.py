@@ -0,0 +1,32 @@
+import uuid
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class BroadcastCampaign(Base):
+    """
+    Um disparo de WhatsApp para vários usuários (ex.: nova rifa).
+    Os destinatários são as linhas de notification_deliveries com o mesmo
+    (tenant_id, kind, rifa_id); as "claimed" ainda não foram enviadas e são
+    retomadas após um restart. sent/failed são o progresso da campanha.
+    """
+    __tablename__ = "broadcast_campaigns"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+    rifa_id = Column(UUID(as_uuid=True), ForeignKey("rifas.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(32), nullable=False)
+
+    status = Column(String(16), nullable=False, default="pending")  # pending | running | done
+    total = Column(Integer, nullable=False, default=0, server_default="0")
+    sent = Column(Integer, nullable=False, default=0, server_default="0")
+    failed = Column(Integer, nullable=False, default=0, server_default="0")
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "kind", "rifa_id", name="uq_broadcast_campaigns_key"),
+    )
@@ -0,0 +1,30 @@
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class NotificationDelivery(Base):
+    """
+    Uma linha por notificação enviada (ou em envio) a um usuário.
+    A chave única é o que garante a idempotência: quem insere primeiro envia
+    (app.core.notifications.claim_deliveries). `numero` é '' quando a
+    notificação não é de um número específico.
+    """
+    __tablename__ = "notification_deliveries"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(32), nullable=False)  # "new_rifa" | "winner"
+    rifa_id = Column(UUID(as_uuid=True), ForeignKey("rifas.id", ondelete="CASCADE"), nullable=False)
+    numero = Column(String, nullable=False, default="", server_default="")
+
+    status = Column(String(16), nullable=False, default="claimed")  # claimed | sent | failed
+    message_id = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "user_id", "kind", "rifa_id", "numero",
+                         name="uq_notification_deliveries_key"),
+    )
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, String, Integer, Text, DateTime, JSON, UniqueConstraint, Index
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class PaymentEvent(Base):
+    """
+    Evento bruto de webhook de pagamento (Asaas, PicPay), gravado antes de
+    responder ao gateway. (provider, event_id) é único: reentregas do mesmo
+    evento não geram nada novo. Aplicado depois por app.core.payment_events.
+    """
+    __tablename__ = "payment_events"
+    __table_args__ = (
+        UniqueConstraint("provider", "event_id", name="uq_payment_events_provider_event"),
+        Index("ix_payment_events_status_id", "status", "id"),
+        Index("ix_payment_events_payment_ref_id", "payment_ref", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    provider = Column(String(16), nullable=False)  # "asaas" | "picpay"
+    event_id = Column(String, nullable=False)
+    event = Column(String, nullable=False)  # PAYMENT_RECEIVED, paid, canceled...
+    payment_ref = Column(String, nullable=False)  # nosso payment_id (externalReference)
+    payload = Column(JSON, nullable=True)
+    ip_address = Column(String, nullable=True)
+    user_agent = Column(String, nullable=True)
+
+    status = Column(String(16), nullable=False, default="received")  # received | processed | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
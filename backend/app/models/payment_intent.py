@@ -0,0 +1,34 @@
+import uuid
+from sqlalchemy import Column, String, Text, Numeric, DateTime, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class PaymentIntent(Base):
+    """
+    Cobrança Pix gerada no /checkout. `id` é o payment_id (externalReference)
+    gravado nos números; guarda o id do Asaas e o QR para replays do checkout
+    e consultas de status sem busca por referência.
+    """
+    __tablename__ = "payment_intents"
+    __table_args__ = (
+        Index("ix_payment_intents_user_rifa", "user_id", "rifa_id"),
+        # Cobranças em aberto mais antigas (janela da conciliação)
+        Index("ix_payment_intents_status_created", "status", "created_at"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    rifa_id = Column(UUID(as_uuid=True), ForeignKey("rifas.id", ondelete="CASCADE"), nullable=False)
+    numeros = Column(Text, nullable=False)  # números ordenados, separados por vírgula
+
+    asaas_payment_id = Column(String, nullable=True, unique=True)
+    asaas_customer_id = Column(String, nullable=True)
+    pix_code = Column(Text, nullable=True)
+    qr_code = Column(Text, nullable=True)  # imagem base64 devolvida pelo Asaas
+    amount = Column(Numeric(12, 2), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+
+    status = Column(String(16), nullable=False, default="pending")  # pending | paid | paid_expired (pago após a reserva expirar)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
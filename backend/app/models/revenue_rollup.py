@@ -0,0 +1,27 @@
+from sqlalchemy import Column, String, Integer, Numeric, DateTime, ForeignKey, Enum, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from app.db.base import Base
+from app.models.audit_finance import PaymentLogMethod
+
+class RevenueRollup(Base):
+    """
+    Arrecadação (PaymentLog PAGO) somada por tenant, rifa, método e período.
+    Períodos de "hora" e "dia" no fuso America/Sao_Paulo; bucket_start é o
+    início do período (timestamptz). Mantida por app.core.revenue_rollups.
+    """
+    __tablename__ = "revenue_rollups"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"), nullable=False)
+    rifa_id = Column(UUID(as_uuid=True), ForeignKey("rifas.id", ondelete="CASCADE"), nullable=False)
+    metodo = Column(Enum(PaymentLogMethod), nullable=False)
+    granularidade = Column(String(4), nullable=False)  # "hora" | "dia"
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+
+    total = Column(Numeric(14, 2), nullable=False, default=0)
+    quantidade = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "granularidade", "bucket_start", "rifa_id", "metodo",
+                         name="uq_revenue_rollups_bucket"),
+    )
@@ -1,6 +1,6 @@
 import uuid
 import enum
-from sqlalchemy import Column, String, Integer, Numeric, DateTime, ForeignKey, Enum, Text
+from sqlalchemy import Column, String, Integer, Numeric, DateTime, ForeignKey, Enum, Text, Boolean, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -57,6 +57,9 @@ class Rifa(Base):
     tipo_resultado = Column(Enum(RifaTipoResultado), nullable=True) # Usually same as tipo_rifa but explicit
     resultado = Column(String, nullable=True)
 
+    # True: números LIVRE não têm linha em rifa_numeros (ver app.core.numeros)
+    lazy_numeros = Column(Boolean, nullable=False, default=False, server_default=text("false"))
+
     owner_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
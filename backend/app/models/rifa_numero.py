@@ -1,6 +1,6 @@
 import uuid
 import enum
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Enum, Boolean
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Enum, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -21,6 +21,14 @@ class PremioStatus(str, enum.Enum):
 
 class RifaNumero(Base):
     __tablename__ = "rifa_numeros"
+    __table_args__ = (
+        # Reservas ativas por usuário (antifraude)
+        Index("ix_rifa_numeros_user_id_status", "user_id", "status"),
+        # Um número por rifa; alvo do ON CONFLICT da materialização preguiçosa
+        Index("uq_rifa_numeros_rifa_id_numero", "rifa_id", "numero", unique=True),
+        # Números de um pagamento (webhooks, verificação manual)
+        Index("ix_rifa_numeros_payment_id", "payment_id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     rifa_id = Column(UUID(as_uuid=True), ForeignKey("rifas.id"), nullable=False)
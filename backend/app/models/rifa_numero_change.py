@@ -0,0 +1,29 @@
+from sqlalchemy import Column, String, BigInteger, DateTime, ForeignKey, Enum, Index, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from app.db.base import Base
+from app.models.rifa_numero import NumeroStatus
+
+class RifaNumeroChange(Base):
+    __tablename__ = "rifa_numero_changes"
+
+    # O id identifica a mudança (clientes deduplicam por ele). Não serve de versão:
+    # ids são distribuídos no INSERT, não na ordem de commit.
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    rifa_id = Column(UUID(as_uuid=True), ForeignKey("rifas.id", ondelete="CASCADE"), nullable=False)
+    numero = Column(String, nullable=False)
+    status = Column(Enum(NumeroStatus), nullable=False)
+    user_id = Column(UUID(as_uuid=True), nullable=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=True)
+
+    # Transação que gravou a mudança; a versão do feed é um horizonte de txid
+    # (ver app/core/numero_changes.py)
+    txid = Column(BigInteger, nullable=False, server_default=text("(pg_current_xact_id()::text)::bigint"))
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    __table_args__ = (
+        Index("ix_rifa_numero_changes_rifa_id_id", "rifa_id", "id"),
+        Index("ix_rifa_numero_changes_rifa_id_txid", "rifa_id", "txid"),
+        Index("ix_rifa_numero_changes_txid", "txid"),
+    )
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, BigInteger, Numeric, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class TenantMetrics(Base):
+    """
+    Contadores do resumo do dashboard, mantidos na mesma transação das mudanças
+    (app.core.tenant_metrics). Recalculáveis com scripts/rebuild_tenant_metrics.py;
+    total_reservas só aproximadamente (ver rebuild_tenant_metrics).
+    """
+    __tablename__ = "tenant_metrics"
+
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id", ondelete="CASCADE"), primary_key=True)
+
+    total_arrecadado = Column(Numeric(14, 2), nullable=False, default=0, server_default="0")
+    total_cancelado = Column(Numeric(14, 2), nullable=False, default=0, server_default="0")
+    total_pago_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+    rifas_ativas = Column(Integer, nullable=False, default=0, server_default="0")
+    rifas_encerradas = Column(Integer, nullable=False, default=0, server_default="0")
+    usuarios_ativos = Column(Integer, nullable=False, default=0, server_default="0")
+    total_reservas = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
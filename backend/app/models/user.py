@@ -21,6 +21,7 @@ class User(Base):
     phone = Column(String, nullable=True)
     whatsapp_opt_in = Column(Boolean, default=False)
     avatar_url = Column(String, nullable=True)
+    asaas_customer_id = Column(String, nullable=True) # Cliente no Asaas, criado no primeiro checkout
     created_at = Column(TIMESTAMP(timezone=True), server_default=text('now()'))
     
     tenant = relationship("Tenant", back_populates="users")
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, Numeric, DateTime, ForeignKey, Index, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class UserStats(Base):
+    """
+    Totais por usuário mantidos incrementalmente (app.core.user_stats).
+    Recalculáveis a partir de payment_logs, rifa_numeros e rifa_ganhadores
+    com scripts/rebuild_user_stats.py.
+    Todo usuário tem linha (zerada ao ser criado), sem NULLs nas colunas do
+    ranking: /dashboard/usuarios ordena direto pelos índices abaixo.
+    """
+    __tablename__ = "user_stats"
+    __table_args__ = (
+        Index("ix_user_stats_tenant_total_gasto", "tenant_id", "total_gasto", "user_id"),
+        Index("ix_user_stats_tenant_numeros_comprados", "tenant_id", "numeros_comprados", "user_id"),
+        Index("ix_user_stats_tenant_vitorias", "tenant_id", "vitorias", "user_id"),
+        Index("ix_user_stats_tenant_ultima_compra", "tenant_id", "ultima_compra", "user_id"),
+    )
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    tenant_id = Column(UUID(as_uuid=True), ForeignKey("tenants.id"), nullable=True, index=True)
+
+    total_gasto = Column(Numeric(12, 2), nullable=False, default=0, server_default="0")
+    numeros_comprados = Column(Integer, nullable=False, default=0, server_default="0")
+    vitorias = Column(Integer, nullable=False, default=0, server_default="0")
+    # Quem nunca comprou fica com 1970-01-01 (NUNCA_COMPROU em app.core.user_stats)
+    ultima_compra = Column(DateTime(timezone=True), nullable=False, server_default=text("'1970-01-01 00:00:00+00'"))
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Body
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select, tuple_
 from typing import List, Optional, Dict, Any
+import base64
+import json
 import uuid
 from datetime import datetime
 
@@ -16,10 +18,15 @@ from app.models.audit_finance import PaymentLog, AuditLog
 from app.models.rifa_resultado import RifaResultado
 from app.models.rifa_ganhador import RifaGanhador
 from app.core.audit import AuditLogger
+from app.core.user_stats import apply_ganhador
+from app.core.tenant_metrics import apply_rifa_status, apply_user_active
 from app.schemas.rifa import RifaResultadoCreate
 from services.whatsapp_service import whatsapp_service
 from app.db.session import SessionLocal
 from fastapi import BackgroundTasks
+from fastapi.responses import StreamingResponse
+from app.core.exports import stream_export, export_filename, FORMATOS
+from app.core.notifications import claim_deliveries, mark_delivery, KIND_WINNER
 
 def notify_winners_task(rifa_id: uuid.UUID, tenant_id: uuid.UUID):
     db = SessionLocal()
@@ -33,42 +40,42 @@ def notify_winners_task(rifa_id: uuid.UUID, tenant_id: uuid.UUID):
             RifaGanhador.tenant_id == tenant_id
         ).all()
         
+        destinatarios = []
         for ganhador in ganhadores:
             user = db.query(User).get(ganhador.user_id)
             numero = db.query(RifaNumero).get(ganhador.rifa_numero_id)
-            
-            if user and user.phone and user.whatsapp_opt_in:
-                try:
-                    # Idempotency: skip if already notified
-                    already = db.query(AuditLog).filter(
-                        AuditLog.action == "WHATSAPP_NOTIFIED_GANHADOR",
-                        AuditLog.entity_type == "user",
-                        AuditLog.entity_id == str(user.id),
-                        AuditLog.tenant_id == tenant_id,
-                        AuditLog.new_value['rifa_id'].astext == str(rifa.id),
-                        AuditLog.new_value['numero'].astext == str(numero.numero)
-                    ).first()
-                    if already:
-                        continue
-                    whatsapp_service.send_winner_notification(
-                        user_phone=user.phone,
-                        rifa_nome=rifa.titulo,
-                        numero_sorteado=numero.numero
-                    )
-                    AuditLogger.log(
-                        db=db,
-                        action="WHATSAPP_NOTIFIED_GANHADOR",
-                        entity_type="user",
-                        entity_id=str(user.id),
-                        actor_id="system",
-                        actor_role="system",
-                        old_value=None,
-                        new_value={"rifa_id": str(rifa.id), "numero": numero.numero},
-                        tenant_id=tenant_id
-                    )
-                    db.commit()
-                except Exception as e:
-                    print(f"Error notifying winner {user.id}: {e}")
+            if user and numero and user.phone and user.whatsapp_opt_in:
+                destinatarios.append((user, numero.numero))
+
+        # Idempotency: claim every (user, numero) in one INSERT ... ON CONFLICT
+        claimed = claim_deliveries(db, tenant_id, KIND_WINNER, rifa.id, ((u.id, n) for u, n in destinatarios))
+        db.commit()
+
+        for user, numero in destinatarios:
+            if (user.id, numero) not in claimed:
+                continue
+            sid = None
+            try:
+                sid = whatsapp_service.send_winner_notification(
+                    user_phone=user.phone,
+                    rifa_nome=rifa.titulo,
+                    numero_sorteado=numero
+                )
+                AuditLogger.log(
+                    db=db,
+                    action="WHATSAPP_NOTIFIED_GANHADOR",
+                    entity_type="user",
+                    entity_id=str(user.id),
+                    actor_id="system",
+                    actor_role="system",
+                    old_value=None,
+                    new_value={"rifa_id": str(rifa.id), "numero": numero},
+                    tenant_id=tenant_id
+                )
+            except Exception as e:
+                print(f"Error notifying winner {user.id}: {e}")
+            mark_delivery(db, tenant_id, KIND_WINNER, rifa.id, user.id, numero, message_id=sid, sent=bool(sid))
+            db.commit()
                     
     finally:
         db.close()
@@ -98,6 +105,7 @@ def update_user(
         raise HTTPException(status_code=404, detail="User not found")
         
     if user_in.is_active is not None:
+        apply_user_active(db, user.tenant_id, user.is_active, user_in.is_active)
         user.is_active = user_in.is_active
     if user_in.role is not None:
         user.role = user_in.role
@@ -130,6 +138,7 @@ def delete_user(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
+    apply_user_active(db, user.tenant_id, user.is_active, False)
     db.delete(user)
     db.commit()
     return None
@@ -218,35 +227,167 @@ def get_financeiro_rifa(
         "logs": logs
     }
 
+def _encode_audit_cursor(created_at, log_id) -> str:
+    raw = json.dumps([created_at.isoformat(), str(log_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_audit_cursor(cursor: str):
+    try:
+        created_at, log_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), uuid.UUID(log_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
 @router.get("/auditoria")
 def get_audit_logs(
     entity_type: Optional[str] = None,
     action: Optional[str] = None,
-    user_id: Optional[str] = None,
-    entity: Optional[str] = None,
-    id: Optional[str] = None,
-    limit: int = 100,
+    actor_id: Optional[uuid.UUID] = None,
+    entity_id: Optional[str] = None,
+    ip_address: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    user_id: Optional[uuid.UUID] = Query(None, deprecated=True),
+    entity: Optional[str] = Query(None, deprecated=True),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_superuser),
     current_tenant: Tenant = Depends(get_tenant_by_host)
 ):
     """
-    Lista logs de auditoria.
+    Lista logs de auditoria, do mais recente para o mais antigo.
+    Paginação por cursor (created_at, id): passe `next_cursor` da resposta
+    anterior. Cada filtro tem um índice (tenant_id, filtro, created_at, id),
+    então qualquer página custa o mesmo que a primeira.
+    `user_id` e `entity` são os nomes antigos de `actor_id` e `entity_id`.
     """
+    actor_id = actor_id or user_id
+    entity_id = entity_id or entity
+
     query = db.query(AuditLog).filter(AuditLog.tenant_id == current_tenant.id)
     
     if entity_type:
         query = query.filter(AuditLog.entity_type == entity_type)
     if action:
         query = query.filter(AuditLog.action == action)
-    if user_id:
-        query = query.filter(AuditLog.user_id == user_id)
-    if entity:
-        query = query.filter(AuditLog.entity_id == entity)
+    if actor_id:
+        query = query.filter(AuditLog.actor_id == actor_id)
+    if entity_id:
+        query = query.filter(AuditLog.entity_id == entity_id)
+    if ip_address:
+        query = query.filter(AuditLog.ip_address == ip_address)
+    if start_date:
+        query = query.filter(AuditLog.created_at >= start_date)
+    if end_date:
+        query = query.filter(AuditLog.created_at <= end_date)
+    if cursor:
+        created_at, log_id = _decode_audit_cursor(cursor)
+        query = query.filter(tuple_(AuditLog.created_at, AuditLog.id) < tuple_(created_at, log_id))
         
-    logs = query.order_by(AuditLog.created_at.desc()).limit(limit).all()
+    logs = query.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).limit(limit + 1).all()
+    has_more = len(logs) > limit
+    logs = logs[:limit]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = _encode_audit_cursor(logs[-1].created_at, logs[-1].id)
     
-    return logs
+    return {"items": logs, "next_cursor": next_cursor}
+
+def _export_response(stmt, formato: str, prefixo: str) -> StreamingResponse:
+    return StreamingResponse(
+        stream_export(stmt, formato),
+        media_type=FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(prefixo, formato)}"'}
+    )
+
+@router.get("/export/pagamentos")
+def export_payment_logs(
+    formato: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    rifa_id: Optional[uuid.UUID] = None,
+    current_user: User = Depends(get_current_active_superuser),
+    current_tenant: Tenant = Depends(get_tenant_by_host)
+):
+    """
+    Exporta todos os PaymentLogs do tenant (stream CSV/NDJSON, sem limite de linhas).
+    """
+    stmt = select(
+        PaymentLog.id, PaymentLog.created_at, PaymentLog.rifa_id, Rifa.titulo.label("rifa"),
+        PaymentLog.numero_id, PaymentLog.user_id, PaymentLog.payment_id,
+        PaymentLog.valor, PaymentLog.metodo, PaymentLog.status
+    ).outerjoin(Rifa, Rifa.id == PaymentLog.rifa_id).where(PaymentLog.tenant_id == current_tenant.id)
+
+    if start_date:
+        stmt = stmt.where(PaymentLog.created_at >= start_date)
+    if end_date:
+        stmt = stmt.where(PaymentLog.created_at <= end_date)
+    if rifa_id:
+        stmt = stmt.where(PaymentLog.rifa_id == rifa_id)
+
+    return _export_response(stmt.order_by(PaymentLog.created_at), formato, "pagamentos")
+
+@router.get("/export/auditoria")
+def export_audit_logs(
+    formato: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    entity_type: Optional[str] = None,
+    action: Optional[str] = None,
+    current_user: User = Depends(get_current_active_superuser),
+    current_tenant: Tenant = Depends(get_tenant_by_host)
+):
+    """
+    Exporta os logs de auditoria do tenant (stream CSV/NDJSON).
+    """
+    stmt = select(
+        AuditLog.id, AuditLog.created_at, AuditLog.actor_id, AuditLog.actor_role,
+        AuditLog.action, AuditLog.entity_type, AuditLog.entity_id,
+        AuditLog.old_value, AuditLog.new_value, AuditLog.ip_address, AuditLog.user_agent
+    ).where(AuditLog.tenant_id == current_tenant.id)
+
+    if start_date:
+        stmt = stmt.where(AuditLog.created_at >= start_date)
+    if end_date:
+        stmt = stmt.where(AuditLog.created_at <= end_date)
+    if entity_type:
+        stmt = stmt.where(AuditLog.entity_type == entity_type)
+    if action:
+        stmt = stmt.where(AuditLog.action == action)
+
+    return _export_response(stmt.order_by(AuditLog.created_at), formato, "auditoria")
+
+@router.get("/export/rifas/{rifa_id}/compradores")
+def export_rifa_compradores(
+    rifa_id: uuid.UUID,
+    formato: str = Query("csv", pattern="^(csv|ndjson)$"),
+    incluir_reservados: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser),
+    current_tenant: Tenant = Depends(get_tenant_by_host)
+):
+    """
+    Exporta os compradores (números pagos, opcionalmente reservados) de uma rifa.
+    """
+    rifa = db.query(Rifa.id).filter(Rifa.id == rifa_id, Rifa.tenant_id == current_tenant.id).first()
+    if not rifa:
+        raise HTTPException(status_code=404, detail="Rifa not found")
+
+    status_list = [NumeroStatus.PAGO]
+    if incluir_reservados:
+        status_list.append(NumeroStatus.RESERVADO)
+
+    stmt = select(
+        RifaNumero.numero, RifaNumero.status, RifaNumero.payment_id, RifaNumero.updated_at,
+        User.id.label("user_id"), User.name, User.email, User.phone
+    ).join(User, User.id == RifaNumero.user_id).where(
+        RifaNumero.rifa_id == rifa_id,
+        RifaNumero.status.in_(status_list)
+    ).order_by(RifaNumero.numero)
+
+    return _export_response(stmt, formato, f"compradores-{rifa_id}")
 
 
 @router.post("/rifas/{rifa_id}/fechar")
@@ -268,6 +409,7 @@ def close_rifa(
         
     old_status = rifa.status
     rifa.status = RifaStatus.ENCERRADA
+    apply_rifa_status(db, rifa, old_status)
     
     AuditLogger.log(
         db=db,
@@ -349,6 +491,7 @@ def apurar_rifa(
                 tenant_id=current_tenant.id
             )
             db.add(ganhador)
+            apply_ganhador(db, ganhador)
             AuditLogger.log(
                 db=db,
                 action="GANHADOR_DEFINIDO",
@@ -371,6 +514,7 @@ def apurar_rifa(
     resultado.apurado = True
     old_status = rifa.status
     rifa.status = RifaStatus.APURADA
+    apply_rifa_status(db, rifa, old_status)
 
     AuditLogger.log(
         db=db,
@@ -132,6 +132,8 @@ def login_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Ses
 
 from app.models.tenant import Tenant
 from app.core.tenant import get_tenant_by_host
+from app.core.tenant_metrics import apply_user_active
+from app.core.user_stats import create_user_stats
 
 @router.post("/users", response_model=UserResponse)
 def create_user(
@@ -164,6 +166,8 @@ def create_user(
         name=user_in.name
     )
     db.add(user)
+    create_user_stats(db, user)
+    apply_user_active(db, current_tenant.id, False, True)
     db.commit()
     db.refresh(user)
     return user
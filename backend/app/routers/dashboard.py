@@ -1,15 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, cast, Date
-from typing import List, Dict, Any
-from datetime import datetime, timedelta
+from sqlalchemy import func, cast, Date, tuple_
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+import base64
+import json
+import uuid
 
 from app.db.session import get_db
 from app.models.user import User
 from app.models.rifa import Rifa, RifaStatus
 from app.models.rifa_numero import RifaNumero, NumeroStatus
-from app.models.audit_finance import PaymentLog, PaymentLogStatus, AuditLog
+from app.models.audit_finance import PaymentLog, PaymentLogStatus
 from app.models.tenant import Tenant
+from app.models.user_stats import UserStats
+from app.models.tenant_metrics import TenantMetrics
+from app.models.revenue_rollup import RevenueRollup
+from app.core.revenue_rollups import bucket_start, ROLLUP_TZ
+from app.core.user_stats import NUNCA_COMPROU
 from app.api.deps import get_current_active_superuser
 from app.core.tenant import get_tenant_by_host
 
@@ -21,186 +30,254 @@ def get_dashboard_resumo(
     current_user: User = Depends(get_current_active_superuser),
     current_tenant: Tenant = Depends(get_tenant_by_host)
 ):
-    # Total Arrecadado
-    total_arrecadado = db.query(func.sum(PaymentLog.valor)).filter(
-        PaymentLog.status == PaymentLogStatus.PAGO,
-        PaymentLog.tenant_id == current_tenant.id
-    ).scalar() or 0
-    
-    # Total Cancelado
-    total_cancelado = db.query(func.sum(PaymentLog.valor)).filter(
-        PaymentLog.status == PaymentLogStatus.CANCELADO,
-        PaymentLog.tenant_id == current_tenant.id
-    ).scalar() or 0
-    
-    # Total Pago (Count)
-    total_pago_count = db.query(func.count(PaymentLog.id)).filter(
-        PaymentLog.status == PaymentLogStatus.PAGO,
-        PaymentLog.tenant_id == current_tenant.id
-    ).scalar() or 0
-    
-    # Rifas Ativas
-    rifas_ativas = db.query(func.count(Rifa.id)).filter(
-        Rifa.status == RifaStatus.ATIVA,
-        Rifa.tenant_id == current_tenant.id
-    ).scalar() or 0
-    
-    # Rifas Encerradas
-    rifas_encerradas = db.query(func.count(Rifa.id)).filter(
-        Rifa.status == RifaStatus.ENCERRADA,
-        Rifa.tenant_id == current_tenant.id
-    ).scalar() or 0
-    
-    # Usuarios Ativos
-    usuarios_ativos = db.query(func.count(User.id)).filter(
-        User.is_active == True,
-        User.tenant_id == current_tenant.id
-    ).scalar() or 0
+    # Contadores mantidos incrementalmente (app/core/tenant_metrics.py)
+    metrics = db.query(TenantMetrics).get(current_tenant.id)
+    if not metrics:
+        metrics = TenantMetrics(
+            total_arrecadado=0, total_cancelado=0, total_pago_count=0, rifas_ativas=0,
+            rifas_encerradas=0, usuarios_ativos=0, total_reservas=0
+        )
     
     # Taxa de Conversao (Paid / Total Reservations)
-    # Total Reservations = Count of "RESERVE_NUMBER" in AuditLog
-    total_reservations = db.query(func.count(AuditLog.id)).filter(
-        AuditLog.action == "RESERVE_NUMBER",
-        AuditLog.tenant_id == current_tenant.id
-    ).scalar() or 0
-    
     taxa_conversao = 0
-    if total_reservations > 0:
-        taxa_conversao = (total_pago_count / total_reservations) * 100
+    if metrics.total_reservas > 0:
+        taxa_conversao = (metrics.total_pago_count / metrics.total_reservas) * 100
         
     return {
-        "total_arrecadado": total_arrecadado,
-        "total_cancelado": total_cancelado,
-        "total_pago_count": total_pago_count,
-        "rifas_ativas": rifas_ativas,
-        "rifas_encerradas": rifas_encerradas,
-        "usuarios_ativos": usuarios_ativos,
+        "total_arrecadado": metrics.total_arrecadado,
+        "total_cancelado": metrics.total_cancelado,
+        "total_pago_count": metrics.total_pago_count,
+        "rifas_ativas": metrics.rifas_ativas,
+        "rifas_encerradas": metrics.rifas_encerradas,
+        "usuarios_ativos": metrics.usuarios_ativos,
         "taxa_conversao": round(taxa_conversao, 2)
     }
 
 @router.get("/financeiro")
 def get_dashboard_financeiro(
+    inicio: Optional[datetime] = None,
+    fim: Optional[datetime] = None,
+    granularidade: str = Query("dia", pattern="^(dia|hora)$"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_superuser),
     current_tenant: Tenant = Depends(get_tenant_by_host)
 ):
-    # Agrupado por Dia
-    por_dia = db.query(
-        cast(PaymentLog.created_at, Date).label('data'),
-        func.sum(PaymentLog.valor).label('total')
-    ).filter(
-        PaymentLog.status == PaymentLogStatus.PAGO,
-        PaymentLog.tenant_id == current_tenant.id
-    ).group_by(cast(PaymentLog.created_at, Date)).all()
+    """
+    Arrecadação a partir de revenue_rollups (períodos no fuso de São Paulo).
+    inicio/fim filtram pelo início do período; sem `inicio`, granularidade
+    "hora" mostra os últimos 7 dias.
+    """
+    if granularidade == "hora" and not inicio:
+        inicio = datetime.now(timezone.utc) - timedelta(days=7)
+
+    def rollups(gran: str):
+        query = db.query(RevenueRollup).filter(
+            RevenueRollup.tenant_id == current_tenant.id,
+            RevenueRollup.granularidade == gran
+        )
+        if inicio:
+            query = query.filter(RevenueRollup.bucket_start >= bucket_start(inicio, gran))
+        if fim:
+            query = query.filter(RevenueRollup.bucket_start < fim)
+        return query
+
+    dias = rollups("dia").subquery()
+
+    # Agrupado por Periodo
+    periodos = rollups(granularidade).subquery() if granularidade == "hora" else dias
+    por_periodo = db.query(
+        periodos.c.bucket_start,
+        func.sum(periodos.c.total).label('total')
+    ).group_by(periodos.c.bucket_start).order_by(periodos.c.bucket_start).all()
     
     # Agrupado por Rifa
     por_rifa = db.query(
         Rifa.titulo,
-        func.sum(PaymentLog.valor).label('total')
-    ).join(Rifa, PaymentLog.rifa_id == Rifa.id).filter(
-        PaymentLog.status == PaymentLogStatus.PAGO,
-        PaymentLog.tenant_id == current_tenant.id
-    ).group_by(Rifa.titulo).all()
+        func.sum(dias.c.total).label('total')
+    ).join(Rifa, dias.c.rifa_id == Rifa.id).group_by(Rifa.titulo).all()
     
     # Agrupado por Metodo
     por_metodo = db.query(
-        PaymentLog.metodo,
-        func.sum(PaymentLog.valor).label('total')
-    ).filter(
-        PaymentLog.status == PaymentLogStatus.PAGO,
-        PaymentLog.tenant_id == current_tenant.id
-    ).group_by(PaymentLog.metodo).all()
+        dias.c.metodo,
+        func.sum(dias.c.total).label('total')
+    ).group_by(dias.c.metodo).all()
     
-    return {
-        "por_dia": [{"data": str(d[0]), "total": d[1]} for d in por_dia],
+    por_periodo = [
+        {"inicio": b.astimezone(ROLLUP_TZ).isoformat(), "total": total}
+        for b, total in por_periodo
+    ]
+    result = {
+        "granularidade": granularidade,
+        "por_periodo": por_periodo,
         "por_rifa": [{"rifa": d[0], "total": d[1]} for d in por_rifa],
         "por_metodo": [{"metodo": d[0], "total": d[1]} for d in por_metodo]
     }
+    if granularidade == "dia":
+        # Formato antigo, agora em dias de São Paulo
+        result["por_dia"] = [{"data": p["inicio"][:10], "total": p["total"]} for p in por_periodo]
+    return result
 
 @router.get("/rifas")
 def get_dashboard_rifas(
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    status: Optional[RifaStatus] = None,
+    data_inicio: Optional[datetime] = None,
+    data_fim: Optional[datetime] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_superuser),
     current_tenant: Tenant = Depends(get_tenant_by_host)
 ):
-    rifas = db.query(Rifa).filter(Rifa.tenant_id == current_tenant.id).all()
+    """
+    Relatório por rifa (mais recentes primeiro).
+    data_inicio/data_fim filtram pela data de criação da rifa.
+    Número fixo de consultas por página: rifas + um agregado de números + um de pagamentos.
+    """
+    query = db.query(Rifa).filter(Rifa.tenant_id == current_tenant.id)
+    if status:
+        query = query.filter(Rifa.status == status)
+    if data_inicio:
+        query = query.filter(Rifa.created_at >= data_inicio)
+    if data_fim:
+        query = query.filter(Rifa.created_at < data_fim)
+    rifas = query.order_by(Rifa.created_at.desc(), Rifa.id).offset(skip).limit(limit).all()
+    if not rifas:
+        return []
+    rifa_ids = [rifa.id for rifa in rifas]
+
+    # Numeros Vendidos (PAGO)
+    vendidos = dict(db.query(
+        RifaNumero.rifa_id,
+        func.count(RifaNumero.id)
+    ).filter(
+        RifaNumero.rifa_id.in_(rifa_ids),
+        RifaNumero.status == NumeroStatus.PAGO,
+        RifaNumero.tenant_id == current_tenant.id
+    ).group_by(RifaNumero.rifa_id).all())
+
+    # Arrecadacao, cancelamentos e total de pagamentos numa passada só
+    pagamentos = {
+        row.rifa_id: row for row in db.query(
+            PaymentLog.rifa_id,
+            func.coalesce(func.sum(PaymentLog.valor).filter(PaymentLog.status == PaymentLogStatus.PAGO), 0).label("arrecadacao"),
+            func.count(PaymentLog.id).filter(PaymentLog.status == PaymentLogStatus.CANCELADO).label("cancelados"),
+            func.count(PaymentLog.id).label("total")
+        ).filter(
+            PaymentLog.rifa_id.in_(rifa_ids),
+            PaymentLog.tenant_id == current_tenant.id
+        ).group_by(PaymentLog.rifa_id).all()
+    }
+
     results = []
-    
     for rifa in rifas:
-        # Numeros Vendidos (PAGO)
-        numeros_vendidos = db.query(func.count(RifaNumero.id)).filter(
-            RifaNumero.rifa_id == rifa.id,
-            RifaNumero.status == NumeroStatus.PAGO,
-            RifaNumero.tenant_id == current_tenant.id
-        ).scalar() or 0
-        
-        # Arrecadacao
-        arrecadacao = db.query(func.sum(PaymentLog.valor)).filter(
-            PaymentLog.rifa_id == rifa.id,
-            PaymentLog.status == PaymentLogStatus.PAGO,
-            PaymentLog.tenant_id == current_tenant.id
-        ).scalar() or 0
+        pag = pagamentos.get(rifa.id)
+        arrecadacao = pag.arrecadacao if pag else 0
         
         # Taxa de Cancelamento
-        # (Cancelled Payments / Total Payments) or (Cancelled Numbers / Total Reserved)?
-        # Let's use PaymentLog cancellations
-        cancelled_payments = db.query(func.count(PaymentLog.id)).filter(
-            PaymentLog.rifa_id == rifa.id,
-            PaymentLog.status == PaymentLogStatus.CANCELADO,
-            PaymentLog.tenant_id == current_tenant.id
-        ).scalar() or 0
-        
-        total_payments = db.query(func.count(PaymentLog.id)).filter(
-            PaymentLog.rifa_id == rifa.id,
-            PaymentLog.tenant_id == current_tenant.id
-        ).scalar() or 0
-        
+        # (Cancelled Payments / Total Payments), via PaymentLog
         taxa_cancelamento = 0
-        if total_payments > 0:
-            taxa_cancelamento = (cancelled_payments / total_payments) * 100
+        if pag and pag.total > 0:
+            taxa_cancelamento = (pag.cancelados / pag.total) * 100
             
         results.append({
             "id": rifa.id,
             "titulo": rifa.titulo,
             "status": rifa.status,
-            "numeros_vendidos": numeros_vendidos,
+            "numeros_vendidos": vendidos.get(rifa.id, 0),
             "arrecadacao": arrecadacao,
             "taxa_cancelamento": round(taxa_cancelamento, 2)
         })
         
     return results
 
+# Colunas cruas (sem coalesce): cada uma tem índice (tenant_id, coluna, user_id)
+USUARIOS_SORT_FIELDS = {
+    "total_gasto": UserStats.total_gasto,
+    "numeros_comprados": UserStats.numeros_comprados,
+    "vitorias": UserStats.vitorias,
+    # Quem nunca comprou (NUNCA_COMPROU) fica no fim (desc) / começo (asc)
+    "ultima_compra": UserStats.ultima_compra,
+}
+
+def _encode_cursor(value, user_id) -> str:
+    raw = json.dumps([str(value), str(user_id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str, sort: str):
+    try:
+        value, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if sort == "ultima_compra":
+            value = datetime.fromisoformat(value)
+        elif sort == "total_gasto":
+            value = Decimal(value)
+        else:
+            value = int(value)
+        return value, uuid.UUID(user_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
 @router.get("/usuarios")
 def get_dashboard_usuarios(
+    sort: str = Query("total_gasto", pattern="^(total_gasto|numeros_comprados|vitorias|ultima_compra)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_superuser),
     current_tenant: Tenant = Depends(get_tenant_by_host)
 ):
-    users = db.query(User).filter(User.tenant_id == current_tenant.id).limit(100).all()
-    results = []
-    
-    for user in users:
-        # Total Spent
-        total_gasto = db.query(func.sum(PaymentLog.valor)).filter(
-            PaymentLog.user_id == user.id,
-            PaymentLog.status == PaymentLogStatus.PAGO,
-            PaymentLog.tenant_id == current_tenant.id
-        ).scalar() or 0
-        
-        # Numeros Comprados
-        numeros_comprados = db.query(func.count(RifaNumero.id)).filter(
-            RifaNumero.user_id == user.id,
-            RifaNumero.status == NumeroStatus.PAGO,
-            RifaNumero.tenant_id == current_tenant.id
-        ).scalar() or 0
-        
-        results.append({
-            "id": user.id,
-            "email": user.email,
-            "role": user.role,
-            "is_active": user.is_active,
-            "total_gasto": total_gasto,
-            "numeros_comprados": numeros_comprados
-        })
-        
-    return results
+    """
+    Ranking de usuários a partir de user_stats (mantido a cada pagamento),
+    com paginação por cursor: passe `next_cursor` da página anterior em `cursor`.
+    Cada página é uma leitura de índice (tenant_id, coluna, user_id), sem ordenar
+    todos os jogadores do tenant.
+    """
+    sort_expr = USUARIOS_SORT_FIELDS[sort]
+    query = db.query(
+        UserStats.user_id.label("id"),
+        User.email,
+        User.role,
+        User.is_active,
+        UserStats.total_gasto,
+        UserStats.numeros_comprados,
+        UserStats.vitorias,
+        UserStats.ultima_compra,
+        sort_expr.label("sort_value")
+    ).join(User, User.id == UserStats.user_id).filter(
+        UserStats.tenant_id == current_tenant.id
+    )
+
+    if cursor:
+        value, user_id = _decode_cursor(cursor, sort)
+        if order == "desc":
+            query = query.filter(tuple_(sort_expr, UserStats.user_id) < tuple_(value, user_id))
+        else:
+            query = query.filter(tuple_(sort_expr, UserStats.user_id) > tuple_(value, user_id))
+
+    if order == "desc":
+        query = query.order_by(sort_expr.desc(), UserStats.user_id.desc())
+    else:
+        query = query.order_by(sort_expr.asc(), UserStats.user_id.asc())
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = [{
+        "id": row.id,
+        "email": row.email,
+        "role": row.role,
+        "is_active": row.is_active,
+        "total_gasto": row.total_gasto,
+        "numeros_comprados": row.numeros_comprados,
+        "vitorias": row.vitorias,
+        "ultima_compra": None if row.ultima_compra == NUNCA_COMPROU else row.ultima_compra
+    } for row in rows]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        sort_value = last.sort_value.isoformat() if isinstance(last.sort_value, datetime) else last.sort_value
+        next_cursor = _encode_cursor(sort_value, last.id)
+
+    return {"items": items, "next_cursor": next_cursor}
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends, Request, BackgroundTasks
 from sqlalchemy.orm import Session
+from sqlalchemy import update
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
 import logging
@@ -8,15 +9,20 @@ import uuid
 import qrcode
 import io
 import base64
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from starlette.concurrency import run_in_threadpool
 
 from app.db.session import get_db
 from app.models.rifa_numero import RifaNumero, NumeroStatus
 from app.models.rifa import Rifa, RifaStatus
 from app.models.user import User
-from app.services.asaas_service import asaas_service
+from app.models.payment_intent import PaymentIntent
+from app.services.asaas_service import asaas_service, customer_ids
 from app.api.deps import get_current_active_user
 from app.core.config import settings
+from app.core.expiry_wheel import expiry_wheel
+from app.core.payment_events import ingest_payment_event
+from app.core.payment_reconciliation import payment_status_cache
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -38,16 +44,66 @@ def generate_valid_cpf():
     cpf.append(calculate_digit(cpf))
     return "".join(map(str, cpf))
 
+async def resolve_asaas_customer_id(user: Dict[str, Any]) -> str:
+    """
+    Id do cliente Asaas do usuário: LRU do processo, depois users.asaas_customer_id;
+    só no primeiro checkout o cliente é buscado/criado no Asaas.
+    `user` são valores já lidos do User (name, email, phone, asaas_customer_id,
+    tenant_id, id), lidos antes de a sessão ir para o threadpool.
+    """
+    key = (user["tenant_id"], user["id"])
+    customer_id = customer_ids.get(key) or user["asaas_customer_id"]
+    if customer_id:
+        customer_ids.put(key, customer_id)
+        return customer_id
+
+    # Note: We need a CPF. Using a dummy if not available, or trying to find by email.
+    # Ideally User model should have CPF.
+    payer_cpf = user.get("cpf") or generate_valid_cpf()
+    customer = await asaas_service.create_customer(
+        name=user["name"] or "Cliente",
+        cpf_cnpj=payer_cpf,
+        email=user["email"],
+        phone=user["phone"]
+    )
+    return customer["id"]
+
+def remember_asaas_customer_id(db: Session, user: User, customer_id: str) -> str:
+    """
+    Grava o id do cliente no usuário (o primeiro gravado vence, para checkouts
+    simultâneos) e no LRU. Devolve o id que ficou gravado.
+    """
+    if user.asaas_customer_id != customer_id:
+        db.execute(update(User).where(
+            User.id == user.id,
+            User.asaas_customer_id.is_(None)
+        ).values(asaas_customer_id=customer_id))
+        db.commit()
+        db.refresh(user)
+        customer_id = user.asaas_customer_id or customer_id
+    customer_ids.put((user.tenant_id, user.id), customer_id)
+    return customer_id
+
 class CheckoutRequest(BaseModel):
     rifa_id: str
     numeros: List[str]
 
-@router.post("/checkout")
-async def create_checkout_payment(
-    request: CheckoutRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
-):
+def _intent_response(intent: PaymentIntent) -> Dict[str, Any]:
+    return {
+        "payment_id": str(intent.id), # We keep using our UUID as the main reference for frontend
+        "asaas_id": intent.asaas_payment_id,
+        "pix_code": intent.pix_code,
+        "qr_code": intent.qr_code,
+        "amount": float(intent.amount),
+        "expires_at": intent.expires_at
+    }
+
+def _prepare_checkout(db: Session, request: CheckoutRequest, current_user: User):
+    """
+    Parte síncrona do checkout (roda no threadpool): valida rifa e números e
+    devolve a intenção existente (replay) ou grava o novo payment_id nos números.
+    Retorna (rifa, numeros_db, intent_existente, payment_id, reserved_until).
+    """
     # 1. Validate Rifa
     rifa = db.query(Rifa).filter(Rifa.id == request.rifa_id).first()
     if not rifa:
@@ -79,35 +135,68 @@ async def create_checkout_payment(
     if not numeros_db:
         raise HTTPException(status_code=400, detail="Nenhum número válido para pagamento.")
 
-    # 3. Calculate Total Amount
-    total_amount = float(rifa.preco_numero) * len(numeros_db)
-    
+    # 3. Replay: mesmo conjunto já cobrado e ainda reservado -> mesma cobrança
+    payment_ids = {n.payment_id for n in numeros_db}
+    if len(payment_ids) == 1 and None not in payment_ids:
+        try:
+            intent = db.query(PaymentIntent).get(uuid.UUID(payment_ids.pop()))
+        except ValueError:
+            intent = None
+        if (
+            intent
+            and intent.status == "pending"
+            and intent.asaas_payment_id
+            and intent.numeros == ",".join(sorted(found_numeros_set))
+        ):
+            return rifa, numeros_db, intent, None, None
+
     # 4. Generate Unified Payment ID (Internal Reference)
     master_payment_id = str(uuid.uuid4())
     
     # 5. Update all numbers to use this Payment ID
+    reserved_until = datetime.utcnow() + timedelta(minutes=15)
     for num in numeros_db:
         num.payment_id = master_payment_id
         # Refresh expiry time (optional but good practice)
-        num.reserved_until = datetime.utcnow() + timedelta(minutes=15) 
+        num.reserved_until = reserved_until
+    numero_ids = [num.id for num in numeros_db]
     
     db.commit() # Save the payment_id update before calling API
+    for numero_id in numero_ids:
+        expiry_wheel.schedule(numero_id, reserved_until)
+    return rifa, numeros_db, None, master_payment_id, reserved_until
+
+@router.post("/checkout")
+async def create_checkout_payment(
+    request: CheckoutRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    # Lido antes de a sessão ir para o threadpool (o cliente Asaas é resolvido depois)
+    user_snapshot = {
+        "id": current_user.id,
+        "tenant_id": current_user.tenant_id,
+        "name": current_user.name,
+        "email": current_user.email,
+        "phone": current_user.phone,
+        "asaas_customer_id": current_user.asaas_customer_id,
+        "cpf": getattr(current_user, 'cpf', None),
+    }
+    rifa, numeros_db, intent, master_payment_id, reserved_until = await run_in_threadpool(
+        _prepare_checkout, db, request, current_user
+    )
+
+    if intent:
+        return _intent_response(intent)
+
+    # 3. Calculate Total Amount
+    total_amount = float(rifa.preco_numero) * len(numeros_db)
     
     # 6. Call Asaas
     try:
-        # Get or Create Customer
-        # Note: We need a CPF. Using a dummy if not available, or trying to find by email.
-        # Ideally User model should have CPF.
-        payer_cpf = getattr(current_user, 'cpf', None) or generate_valid_cpf()
-        
-        customer = await asaas_service.create_customer(
-            name=current_user.name or "Cliente",
-            cpf_cnpj=payer_cpf,
-            email=current_user.email,
-            phone=current_user.phone
-        )
-        
-        customer_id = customer["id"]
+        # Get or Create Customer (cached per user). Só depois da validação: um
+        # checkout recusado não cria no Asaas um cliente que nunca seria gravado
+        customer_id = remember_asaas_customer_id(db, current_user, await resolve_asaas_customer_id(user_snapshot))
         
         # Create Payment
         description = f"Pagamento Rifa: {rifa.titulo} - {len(numeros_db)} numeros"
@@ -126,17 +215,23 @@ async def create_checkout_payment(
         # Get QR Code
         qr_data = await asaas_service.get_pix_qrcode(asaas_payment_id)
         
-        pix_code = qr_data.get("payload")
-        qr_code_base64 = qr_data.get("encodedImage")
+        intent = PaymentIntent(
+            id=uuid.UUID(master_payment_id),
+            tenant_id=rifa.tenant_id,
+            user_id=current_user.id,
+            rifa_id=rifa.id,
+            numeros=",".join(sorted(n.numero for n in numeros_db)),
+            asaas_payment_id=asaas_payment_id,
+            asaas_customer_id=customer_id,
+            pix_code=qr_data.get("payload"),
+            qr_code=qr_data.get("encodedImage"),
+            amount=total_amount,
+            expires_at=reserved_until.replace(tzinfo=timezone.utc)
+        )
+        db.add(intent)
+        db.commit()
         
-        return {
-            "payment_id": master_payment_id, # We keep using our UUID as the main reference for frontend
-            "asaas_id": asaas_payment_id,
-            "pix_code": pix_code,
-            "qr_code": qr_code_base64,
-            "amount": total_amount,
-            "expires_at": numeros_db[0].reserved_until
-        }
+        return _intent_response(intent)
         
     except HTTPException as e:
         raise e
@@ -172,56 +267,37 @@ async def generate_pix_payment(
 
 
 @router.post("/check/{payment_id}")
-async def check_payment_status_manual(
+def check_payment_status_manual(
     payment_id: str,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Endpoint para verificação manual de pagamento pelo usuário.
-    Força uma consulta no Asaas para ver se o pagamento já consta.
+    Responde com o status local (webhooks + conciliação periódica com o Asaas,
+    app/core/payment_reconciliation.py), sem consulta ao gateway. Função
+    síncrona: o FastAPI a roda no threadpool, fora do event loop.
     """
-    # Find reservation
-    rifa_numeros = db.query(RifaNumero).filter(RifaNumero.payment_id == payment_id).all()
-    
-    if not rifa_numeros:
-        raise HTTPException(status_code=404, detail="Pagamento não encontrado")
+    cached = payment_status_cache.get(payment_id)
+    if cached is None:
+        rifa_numeros = db.query(RifaNumero.user_id, RifaNumero.status).filter(
+            RifaNumero.payment_id == payment_id
+        ).all()
         
-    # Check if already paid
-    if all(rn.status == NumeroStatus.PAGO for rn in rifa_numeros):
-        return {"status": "paid", "message": "Pagamento já confirmado!"}
+        if not rifa_numeros:
+            raise HTTPException(status_code=404, detail="Pagamento não encontrado")
         
+        status = "paid" if all(rn.status == NumeroStatus.PAGO for rn in rifa_numeros) else "pending"
+        cached = (rifa_numeros[0].user_id, status)
+        payment_status_cache.put(payment_id, *cached)
+    
+    owner_id, status = cached
     # Check ownership
-    if rifa_numeros[0].user_id != current_user.id:
+    if owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Acesso negado")
-
-    # We need to find the Asaas Payment ID.
-    # Since we didn't store it in a dedicated column (we used payment_id for our UUID),
-    # we can try to search Asaas by externalReference.
-    
-    try:
-        payment_data = await asaas_service.get_payment_by_external_reference(payment_id)
         
-        if payment_data:
-            status = payment_data.get("status")
-            if status in ["RECEIVED", "CONFIRMED", "PAID"]:
-                # Update DB immediately
-                confirmed_count = 0
-                for rn in rifa_numeros:
-                    if rn.status != NumeroStatus.PAGO:
-                        rn.status = NumeroStatus.PAGO
-                        rn.updated_at = datetime.now()
-                        confirmed_count += 1
-                        # PaymentLog logic could be added here too, but let's keep it simple for now or extract to function
-                
-                if confirmed_count > 0:
-                    db.commit()
-                    return {"status": "paid", "message": "Pagamento confirmado com sucesso!"}
-            
-            return {"status": "pending", "message": f"Pagamento identificado, status atual: {status}"}
-            
-    except Exception as e:
-        logger.error(f"Erro no check manual Asaas: {e}")
+    if status == "paid":
+        return {"status": "paid", "message": "Pagamento já confirmado!"}
     
     return {"status": "pending", "message": "Aguardando confirmação do banco..."}
 
@@ -251,44 +327,26 @@ async def asaas_webhook(
                 logger.warning("Payment without externalReference")
                 return {"status": "ignored"}
                 
-            payment_id = external_reference # Our UUID
-            
-            # Update status
-            rifa_numeros = db.query(RifaNumero).filter(RifaNumero.payment_id == payment_id).all()
-            
-            confirmed_count = 0
-            for rn in rifa_numeros:
-                if rn.status != NumeroStatus.PAGO:
-                    rn.status = NumeroStatus.PAGO
-                    rn.updated_at = datetime.now()
-                    confirmed_count += 1
-                    
-                    # Log to PaymentLog
-                    try:
-                        from app.models.audit_finance import PaymentLog, PaymentLogMethod, PaymentLogStatus
-                        
-                        pay_log = PaymentLog(
-                            rifa_id=rn.rifa_id,
-                            numero_id=rn.id,
-                            user_id=rn.user_id,
-                            payment_id=payment_id,
-                            valor=float(rn.rifa.preco_numero),
-                            metodo=PaymentLogMethod.PIX,
-                            status=PaymentLogStatus.PAGO,
-                            tenant_id=rn.tenant_id
-                        )
-                        db.add(pay_log)
-                    except Exception as log_err:
-                        logger.error(f"Failed to create PaymentLog in webhook: {log_err}")
-
-            if confirmed_count > 0:
-                db.commit()
-                logger.info(f"Payment confirmed for {confirmed_count} numbers (Ref: {payment_id})")
-                
-            return {"status": "processed"}
+            # Grava o evento e responde; a aplicação é feita pelos workers
+            # (app/core/payment_events.py). Reentregas do mesmo id são ignoradas.
+            event_id = payload.get("id") or f"{event}:{payment.get('id')}"
+            created = await run_in_threadpool(
+                ingest_payment_event,
+                db,
+                "asaas",
+                event_id,
+                event,
+                external_reference, # Our UUID
+                payload,
+                request.client.host,
+                request.headers.get("user-agent")
+            )
+            return {"status": "received" if created else "duplicate"}
             
         return {"status": "ignored_event"}
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Webhook error: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from sqlalchemy import select, cast, Integer
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
 import uuid
 from jose import jwt, JWTError
@@ -11,85 +11,32 @@ from app.db.session import get_db
 from app.models.user import User
 from app.api.deps import get_current_active_user, get_current_active_superuser
 from app.schemas.rifa import RifaCreate, RifaResponse, RifaUpdate, RifaStatusUpdate, WinnerResponse
-from app.schemas.rifa_numero import RifaNumeroResponse
+from app.schemas.rifa_numero import (
+    RifaNumeroResponse, RifaNumeroGridResponse, RifaNumeroChangesResponse,
+    ReservaLoteRequest, ReservaLoteResponse
+)
 from app.models.rifa import Rifa, RifaStatus, RifaTipo
 from app.models.rifa_ganhador import RifaGanhador
 from app.models.rifa_numero import RifaNumero, NumeroStatus
 from app.models.admin_settings import AdminSettings
 from app.core.config import settings
 from app.core.audit import AuditLogger
-from services.whatsapp_service import whatsapp_service
-from app.models.audit_finance import AuditLog
+from app.core.numeros import (
+    numero_space, build_status_grid, encode_grid, STATUS_CODES,
+    numeros_do_tipo, virtual_numero_id, numero_from_virtual_id, materialize_numeros, generate_numeros
+)
+from app.core.numero_changes import record_numero_change, latest_version, get_changes_since
+from app.core.expiry_wheel import expiry_wheel
+from app.core.broadcast import notify_users_new_rifa
+from app.core.payment_hooks import apply_payment_log
+from app.core.payment_reconciliation import payment_status_cache
+from app.core.tenant_metrics import apply_rifa_status, apply_reservas
+from app.core.numero_stream import numero_broadcaster, format_sse, change_event, RESYNC
 from app.db.session import SessionLocal
 import logging
 
 logger = logging.getLogger(__name__)
 
-def notify_users_new_rifa(rifa_id: uuid.UUID, tenant_id: uuid.UUID):
-    logger.info(f"Starting new raffle notification for Rifa {rifa_id} (Tenant {tenant_id})")
-    db = SessionLocal()
-    try:
-        rifa = db.query(Rifa).get(rifa_id)
-        if not rifa:
-            logger.error(f"Rifa {rifa_id} not found during notification")
-            return
-        
-        # Only notify if ATIVA
-        if rifa.status != RifaStatus.ATIVA:
-            logger.info(f"Rifa {rifa_id} is not ATIVA (Status: {rifa.status}). Skipping notification.")
-            return
-
-        users = db.query(User).filter(
-            User.tenant_id == tenant_id,
-            User.whatsapp_opt_in == True,
-            User.phone.isnot(None)
-        ).all()
-        
-        logger.info(f"Found {len(users)} users with WhatsApp Opt-In")
-        
-        count_sent = 0
-        for user in users:
-                try:
-                    already = db.query(AuditLog).filter(
-                        AuditLog.action == "WHATSAPP_NOTIFIED_RIFA",
-                        AuditLog.entity_type == "user",
-                        AuditLog.entity_id == str(user.id),
-                        AuditLog.tenant_id == tenant_id,
-                        AuditLog.new_value['rifa_id'].astext == str(rifa.id)
-                    ).first()
-                    if already:
-                        continue
-                    
-                    sid = whatsapp_service.send_new_raffle_notification(
-                        user_phone=user.phone,
-                        rifa_nome=rifa.titulo,
-                        data_sorteio=rifa.data_sorteio,
-                        tipo=rifa.tipo_rifa.value if hasattr(rifa.tipo_rifa, 'value') else str(rifa.tipo_rifa),
-                        rifa_id=str(rifa.id)
-                    )
-                    
-                    if sid:
-                        count_sent += 1
-                        AuditLogger.log(
-                            db=db,
-                            action="WHATSAPP_NOTIFIED_RIFA",
-                            entity_type="user",
-                            entity_id=str(user.id),
-                            actor_id="system",
-                            actor_role="system",
-                            old_value=None,
-                            new_value={"rifa_id": str(rifa.id), "titulo": rifa.titulo},
-                            tenant_id=tenant_id
-                        )
-                        db.commit()
-                except Exception as e:
-                    logger.error(f"Error notifying user {user.id}: {e}")
-        
-        logger.info(f"Finished notifications. Sent to {count_sent} users.")
-                
-    finally:
-        db.close()
-
 router = APIRouter()
 
 @router.get("/recent-winners", response_model=List[WinnerResponse])
@@ -158,8 +105,11 @@ def get_current_user_optional(
 
 from app.models.tenant import Tenant
 from app.core.tenant import get_tenant_by_host
-from app.core.antifraud import check_antifraud
-from fastapi import Request
+from app.core.antifraud import check_antifraud, check_reservation_limit
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio
 
 # ...
 
@@ -223,32 +173,23 @@ def create_rifa(
     current_user: User = Depends(get_current_active_superuser),
     current_tenant: Tenant = Depends(get_tenant_by_host)
 ):
-    rifa = Rifa(**rifa_in.dict(), owner_id=current_user.id, tenant_id=current_tenant.id)
+    rifa = Rifa(
+        **rifa_in.dict(),
+        owner_id=current_user.id,
+        tenant_id=current_tenant.id,
+        lazy_numeros=settings.LAZY_NUMEROS
+    )
     db.add(rifa)
+    db.flush()
+    apply_rifa_status(db, rifa)
     db.commit()
     db.refresh(rifa)
     
     # Generate numbers automatically
-    numeros = []
-    if rifa.tipo_rifa == RifaTipo.MILHAR:
-        numeros = [f"{i:04d}" for i in range(1, 10000)] + ["0000"]
-    elif rifa.tipo_rifa == RifaTipo.CENTENA:
-        numeros = [f"{i:03d}" for i in range(1, 1000)] + ["000"]
-    elif rifa.tipo_rifa == RifaTipo.DEZENA:
-        numeros = [f"{i:02d}" for i in range(1, 100)] + ["00"]
-    elif rifa.tipo_rifa == RifaTipo.GRUPO:
-        numeros = [f"{i:02d}" for i in range(1, 26)]
-        
-    db.bulk_save_objects([
-        RifaNumero(
-            rifa_id=rifa.id,
-            tipo=rifa.tipo_rifa,
-            numero=num,
-            status=NumeroStatus.LIVRE,
-            tenant_id=current_tenant.id
-        ) for num in numeros
-    ])
-    db.commit()
+    # (rifas preguiçosas só ganham linhas quando o número sai de LIVRE)
+    if not rifa.lazy_numeros:
+        generate_numeros(db, rifa)
+        db.commit()
     
     # Trigger notification if Active
     if rifa.status == RifaStatus.ATIVA:
@@ -268,8 +209,10 @@ def update_rifa(
     if not rifa:
         raise HTTPException(status_code=404, detail="Rifa not found")
         
+    old_status = rifa.status
     for field, value in rifa_in.dict(exclude_unset=True).items():
         setattr(rifa, field, value)
+    apply_rifa_status(db, rifa, old_status)
         
     db.commit()
     db.refresh(rifa)
@@ -290,6 +233,7 @@ def update_rifa_status(
         
     old_status = rifa.status
     rifa.status = status_in.status
+    apply_rifa_status(db, rifa, old_status)
     db.commit()
     db.refresh(rifa)
     
@@ -359,11 +303,364 @@ def read_rifa_numeros(
         
         num.is_owner = is_owner
         results.append(num)
-        
+
+    rifa = db.query(Rifa).filter(Rifa.id == rifa_id, Rifa.tenant_id == current_tenant.id).first()
+    if rifa and rifa.lazy_numeros:
+        # Numeração preguiçosa: números sem linha são LIVRE
+        by_numero = {num.numero: num for num in results}
+        results = [
+            by_numero.get(numero) or {
+                "id": virtual_numero_id(rifa.id, numero),
+                "rifa_id": rifa.id,
+                "numero": numero,
+                "tipo": rifa.tipo_rifa,
+                "status": NumeroStatus.LIVRE,
+                "created_at": rifa.created_at,
+                "is_owner": False
+            }
+            for numero in numeros_do_tipo(rifa.tipo_rifa)
+        ]
+
     return results
 
+def _load_grid_rows(db: Session, rifa_id: uuid.UUID, tenant_id: uuid.UUID):
+    # LIVRE é o código 0, então só as linhas ocupadas precisam vir do banco
+    return db.query(
+        RifaNumero.numero,
+        RifaNumero.status,
+        RifaNumero.user_id,
+        RifaNumero.payment_id,
+        RifaNumero.reserved_until
+    ).filter(
+        RifaNumero.rifa_id == rifa_id,
+        RifaNumero.tenant_id == tenant_id,
+        RifaNumero.status != NumeroStatus.LIVRE
+    ).all()
+
+def _grid_payload(rifa, rows, current_user: Optional[User], version: int) -> dict:
+    grid = build_status_grid(rifa.tipo_rifa, ((r.numero, r.status) for r in rows))
+    primeiro, total, digitos = numero_space(rifa.tipo_rifa)
+
+    meus_numeros = []
+    if current_user:
+        meus_numeros = [
+            {
+                "numero": r.numero,
+                "status": r.status,
+                "payment_id": r.payment_id,
+                "reserved_until": r.reserved_until
+            }
+            for r in rows if r.user_id == current_user.id
+        ]
+
+    return {
+        "rifa_id": rifa.id,
+        "tipo": rifa.tipo_rifa,
+        "primeiro": primeiro,
+        "total": total,
+        "digitos": digitos,
+        "encoding": "base64",
+        "status_codes": {status.value: code for status, code in STATUS_CODES.items()},
+        "grid": encode_grid(grid),
+        "meus_numeros": meus_numeros,
+        "version": version
+    }
+
+@router.get("/{rifa_id}/numeros/grid", response_model=RifaNumeroGridResponse)
+def read_rifa_numeros_grid(
+    rifa_id: uuid.UUID,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    current_tenant: Tenant = Depends(get_tenant_by_host)
+):
+    """
+    Grade compacta de status: 1 byte por número (ver status_codes), em base64.
+    Com `Accept: application/octet-stream` devolve os bytes crus.
+    Apenas os números do próprio usuário vêm detalhados em meus_numeros.
+    """
+    rifa = db.query(Rifa.id, Rifa.tipo_rifa).filter(
+        Rifa.id == rifa_id,
+        Rifa.tenant_id == current_tenant.id
+    ).first()
+    if not rifa:
+        raise HTTPException(status_code=404, detail="Rifa not found")
+
+    # Versão lida antes da grade: mudanças concorrentes serão reenviadas pelo feed
+    version = latest_version(db)
+    rows = _load_grid_rows(db, rifa_id, current_tenant.id)
+
+    if "application/octet-stream" in request.headers.get("accept", ""):
+        primeiro, _, digitos = numero_space(rifa.tipo_rifa)
+        grid = build_status_grid(rifa.tipo_rifa, ((r.numero, r.status) for r in rows))
+        return Response(
+            content=bytes(grid),
+            media_type="application/octet-stream",
+            headers={
+                "X-Rifa-Tipo": rifa.tipo_rifa.value,
+                "X-Rifa-Primeiro": str(primeiro),
+                "X-Rifa-Digitos": str(digitos),
+                "X-Rifa-Version": str(version),
+            }
+        )
+
+    return _grid_payload(rifa, rows, current_user, version)
+
+@router.get("/{rifa_id}/numeros/changes", response_model=RifaNumeroChangesResponse)
+def read_rifa_numeros_changes(
+    rifa_id: uuid.UUID,
+    since: int = 0,
+    db: Session = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    current_tenant: Tenant = Depends(get_tenant_by_host)
+):
+    """
+    Feed incremental: números que mudaram de status depois da versão `since`.
+    Se `since` for 0 ou antigo demais, devolve snapshot=True com a grade completa.
+    Uma mudança pode vir de novo na chamada seguinte; deduplicar pelo `version` dela.
+    """
+    rifa = db.query(Rifa.id, Rifa.tipo_rifa).filter(
+        Rifa.id == rifa_id,
+        Rifa.tenant_id == current_tenant.id
+    ).first()
+    if not rifa:
+        raise HTTPException(status_code=404, detail="Rifa not found")
+
+    feed = get_changes_since(db, rifa_id, since)
+
+    if feed is None:
+        version = latest_version(db)
+        rows = _load_grid_rows(db, rifa_id, current_tenant.id)
+        return {
+            "rifa_id": rifa.id,
+            "version": version,
+            "snapshot": True,
+            "grid": _grid_payload(rifa, rows, current_user, version)
+        }
+
+    version, changes = feed
+    return {
+        "rifa_id": rifa.id,
+        "version": version,
+        "snapshot": False,
+        "changes": [
+            {
+                "version": c.id,
+                "numero": c.numero,
+                "status": c.status,
+                "is_owner": bool(current_user and c.user_id == current_user.id)
+            }
+            for c in changes
+        ]
+    }
+
+STREAM_HEARTBEAT_SECONDS = 15
+
+def _stream_initial_events(rifa_id: uuid.UUID, since: Optional[int]) -> Tuple[List[str], int]:
+    """
+    Eventos iniciais do stream e a versão até onde eles cobrem
+    (a assinatura do broadcaster continua dela).
+    """
+    db = SessionLocal()
+    try:
+        if not since:
+            version = latest_version(db)
+            return [format_sse({"version": version}, "hello")], version
+        feed = get_changes_since(db, rifa_id, since)
+        if feed is None:
+            version = latest_version(db)
+            return [format_sse({"version": version}, "resync")], version
+        version, changes = feed
+        return [format_sse(change_event(c), "numero", version) for c in changes], version
+    finally:
+        db.close()
+
+@router.get("/{rifa_id}/stream")
+async def stream_rifa_numeros(
+    rifa_id: uuid.UUID,
+    request: Request,
+    since: Optional[int] = None,
+    current_tenant: Tenant = Depends(get_tenant_by_host)
+):
+    """
+    Server-Sent Events com as mudanças de status dos números da rifa.
+    Eventos: "hello" (versão atual), "numero" (mudança, id = versão para
+    retomar; pode repetir, deduplicar pelo `version` do dado) e
+    "resync" (cliente atrasado: recarregar /numeros/grid).
+    Reconexões usam Last-Event-ID (ou `since`) para recuperar o que perderam.
+    Sem sessão da requisição: a conexão do pool não fica presa enquanto o stream dura.
+    """
+    def rifa_exists():
+        db = SessionLocal()
+        try:
+            return db.query(Rifa.id).filter(Rifa.id == rifa_id, Rifa.tenant_id == current_tenant.id).first()
+        finally:
+            db.close()
+
+    rifa = await run_in_threadpool(rifa_exists)
+    if not rifa:
+        raise HTTPException(status_code=404, detail="Rifa not found")
+
+    last_event_id = request.headers.get("last-event-id", "")
+    if since is None and last_event_id.isdigit():
+        since = int(last_event_id)
+
+    async def event_stream():
+        # A assinatura continua da versão lida aqui (o broadcaster recua o cursor
+        # até ela): eventos repetidos são inofensivos, perdidos não
+        initial, version = await run_in_threadpool(_stream_initial_events, rifa_id, since)
+        queue = numero_broadcaster.subscribe(rifa_id, version)
+        try:
+            for event in initial:
+                yield event
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is RESYNC:
+                    yield format_sse({}, "resync")
+                    break
+                cursor, data = event
+                yield format_sse(data, "numero", cursor)
+        finally:
+            numero_broadcaster.unsubscribe(rifa_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # --- Purchase/Reservation Logic ---
 
+def _client_ip(request: Request) -> Optional[str]:
+    ip_address = request.headers.get("x-forwarded-for") or request.client.host
+    if ip_address and "," in ip_address:
+        ip_address = ip_address.split(",")[0].strip()
+    return ip_address
+
+@router.post("/{rifa_id}/reservar", response_model=ReservaLoteResponse)
+def reserve_numeros_lote(
+    rifa_id: uuid.UUID,
+    payload: ReservaLoteRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+    current_tenant: Tenant = Depends(get_tenant_by_host)
+):
+    """
+    Reserva vários números numa única transação, com um único payment_id.
+    parcial=False: se algum número estiver indisponível nada é reservado (409).
+    parcial=True: reserva os disponíveis e devolve os demais em `indisponiveis`.
+    """
+    # Mantém a ordem pedida, sem repetidos
+    numeros = list(dict.fromkeys(n.strip() for n in payload.numeros))
+
+    ip_address = _client_ip(request)
+    # Limite de reservas simultâneas checado depois, só com os números realmente novos
+    check_antifraud(db, current_user, ip_address, str(rifa_id), quantidade=None)
+
+    rifa = db.query(Rifa).filter(Rifa.id == rifa_id, Rifa.tenant_id == current_tenant.id).first()
+    if not rifa:
+        raise HTTPException(status_code=404, detail="Rifa not found")
+    if rifa.status != RifaStatus.ATIVA:
+        raise HTTPException(status_code=400, detail="Rifa não está ativa para compras")
+
+    admin_settings = db.query(AdminSettings).filter(AdminSettings.user_id == rifa.owner_id).first()
+    timeout_minutes = admin_settings.reservation_timeout_minutes if admin_settings else 20
+
+    try:
+        materialize_numeros(db, rifa, numeros)
+        # Ordem fixa de lock evita deadlock entre lotes concorrentes;
+        # linhas já travadas por outra compra são puladas e tratadas como indisponíveis
+        rows = db.query(RifaNumero).filter(
+            RifaNumero.rifa_id == rifa_id,
+            RifaNumero.tenant_id == current_tenant.id,
+            RifaNumero.numero.in_(numeros)
+        ).order_by(RifaNumero.numero).with_for_update(skip_locked=True).all()
+        by_numero = {row.numero: row for row in rows}
+
+        livres, ja_reservados, indisponiveis = [], [], []
+        for numero in numeros:
+            num_obj = by_numero.get(numero)
+            if num_obj is None:
+                indisponiveis.append(numero)
+            elif num_obj.status in [NumeroStatus.LIVRE, NumeroStatus.EXPIRADO]:
+                livres.append(num_obj)
+            elif num_obj.status == NumeroStatus.RESERVADO and num_obj.user_id == current_user.id:
+                ja_reservados.append(num_obj)
+            else:
+                indisponiveis.append(numero)
+
+        if indisponiveis and not payload.parcial:
+            raise HTTPException(status_code=409, detail=f"Números indisponíveis: {', '.join(indisponiveis)}")
+
+        if not livres:
+            if ja_reservados:
+                response = ReservaLoteResponse(
+                    message="Números já reservados por você",
+                    payment_id=ja_reservados[0].payment_id,
+                    expires_at=ja_reservados[0].reserved_until,
+                    ja_reservados=[n.numero for n in ja_reservados],
+                    indisponiveis=indisponiveis
+                )
+                db.rollback()
+                return response
+            raise HTTPException(status_code=409, detail="Nenhum número disponível")
+
+        check_reservation_limit(db, current_user, rifa_id, len(livres))
+
+        reservation_time = datetime.utcnow() + timedelta(minutes=timeout_minutes)
+        payment_id = str(uuid.uuid4())
+
+        for num_obj in livres:
+            num_obj.status = NumeroStatus.RESERVADO
+            num_obj.user_id = current_user.id
+            num_obj.reserved_until = reservation_time
+            num_obj.payment_id = payment_id
+            record_numero_change(db, num_obj)
+
+        AuditLogger.log_many(db, (
+            dict(
+                action="RESERVE_NUMBER",
+                entity_type="RifaNumero",
+                entity_id=str(num_obj.id),
+                actor_id=str(current_user.id),
+                actor_role=current_user.role,
+                old_value={"status": "livre"},
+                new_value={"status": "reservado", "payment_id": payment_id},
+                tenant_id=current_tenant.id,
+                ip_address=ip_address
+            )
+            for num_obj in livres
+        ))
+        apply_reservas(db, current_tenant.id, len(livres))
+
+        # Montada antes do commit, que expira os objetos da sessão
+        response = ReservaLoteResponse(
+            message="Números reservados com sucesso",
+            payment_id=payment_id,
+            expires_at=reservation_time,
+            reservados=[n.numero for n in livres],
+            ja_reservados=[n.numero for n in ja_reservados],
+            indisponiveis=indisponiveis
+        )
+        numero_ids = [n.id for n in livres]
+        db.commit()
+        for numero_uuid in numero_ids:
+            expiry_wheel.schedule(numero_uuid, reservation_time)
+
+        return response
+
+    except HTTPException as he:
+        db.rollback()
+        raise he
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/{rifa_id}/numeros/{numero_id}/reservar", response_model=dict)
 def reserve_numero(
     rifa_id: uuid.UUID,
@@ -374,10 +671,7 @@ def reserve_numero(
     current_tenant: Tenant = Depends(get_tenant_by_host)
 ):
     # Anti-Fraud Check
-    ip_address = request.headers.get("x-forwarded-for") or request.client.host
-    if ip_address and "," in ip_address:
-        ip_address = ip_address.split(",")[0].strip()
-        
+    ip_address = _client_ip(request)
     check_antifraud(db, current_user, ip_address, str(rifa_id))
 
     # 1. Get Rifa and check status
@@ -400,6 +694,11 @@ def reserve_numero(
         except ValueError:
             is_uuid = False
             
+        if rifa.lazy_numeros:
+            numero = numero_from_virtual_id(rifa, uuid_obj) if is_uuid else numero_id
+            if numero:
+                materialize_numeros(db, rifa, [numero])
+
         query = db.query(RifaNumero).filter(RifaNumero.rifa_id == rifa_id, RifaNumero.tenant_id == current_tenant.id)
         if is_uuid:
             query = query.filter(RifaNumero.id == uuid_obj)
@@ -433,6 +732,7 @@ def reserve_numero(
         num_obj.user_id = current_user.id
         num_obj.reserved_until = reservation_time
         num_obj.payment_id = payment_id
+        record_numero_change(db, num_obj)
         
         # Audit
         AuditLogger.log(
@@ -447,8 +747,10 @@ def reserve_numero(
             tenant_id=current_tenant.id,
             ip_address=ip_address
         )
+        apply_reservas(db, current_tenant.id)
 
         db.commit()
+        expiry_wheel.schedule(num_obj.id, reservation_time)
         
         return {
             "message": "Número reservado com sucesso",
@@ -507,6 +809,7 @@ def release_numero(
     num_obj.user_id = None
     num_obj.reserved_until = None
     num_obj.payment_id = None
+    record_numero_change(db, num_obj)
     
     # Audit
     AuditLogger.log(
@@ -522,6 +825,7 @@ def release_numero(
     )
     
     db.commit()
+    expiry_wheel.cancel(num_obj.id)
     
     return {"message": "Número liberado com sucesso", "numero": num_obj.numero}
 
@@ -537,6 +841,10 @@ def cancel_numero_admin(
     """
     Admin manually cancels a number reservation/purchase.
     """
+    rifa = db.query(Rifa).get(rifa_id)
+    if rifa:
+        materialize_numeros(db, rifa, [numero])
+
     num_obj = db.query(RifaNumero).filter(
         RifaNumero.rifa_id == rifa_id,
         RifaNumero.numero == numero
@@ -550,6 +858,7 @@ def cancel_numero_admin(
     # Keep history? Or clear? Prompt says "Manter histórico" generally for webhooks, 
     # but manual cancel usually implies voiding. Let's keep data but change status.
     num_obj.reserved_until = None
+    record_numero_change(db, num_obj)
     
     # Audit
     AuditLogger.log(
@@ -582,6 +891,8 @@ def cancel_numero_admin(
             status=PaymentLogStatus.CANCELADO
          )
          db.add(pay_log)
+         apply_payment_log(db, pay_log, old_status)
+         payment_status_cache.invalidate_after_commit(db, num_obj.payment_id)
 
     db.commit()
     return {"message": f"Número {numero} cancelado com sucesso"}
@@ -596,6 +907,10 @@ def pay_numero_admin(
     """
     Admin manually marks a number as PAID.
     """
+    rifa = db.query(Rifa).get(rifa_id)
+    if rifa:
+        materialize_numeros(db, rifa, [numero])
+
     num_obj = db.query(RifaNumero).filter(
         RifaNumero.rifa_id == rifa_id,
         RifaNumero.numero == numero
@@ -610,6 +925,7 @@ def pay_numero_admin(
     old_status = num_obj.status
     num_obj.status = NumeroStatus.PAGO
     num_obj.reserved_until = None
+    record_numero_change(db, num_obj)
     
     # Audit
     AuditLogger.log(
@@ -643,6 +959,8 @@ def pay_numero_admin(
         status=PaymentLogStatus.PAGO
     )
     db.add(pay_log)
+    apply_payment_log(db, pay_log)
+    payment_status_cache.invalidate_after_commit(db, num_obj.payment_id)
 
     db.commit()
     return {"message": f"Número {numero} marcado como PAGO com sucesso"}
@@ -10,6 +10,11 @@ from app.core.config import settings
 from services.whatsapp_service import whatsapp_service
 from app.core.security import get_password_hash
 from app.core.tenant import get_tenant_by_host_or_default
+from app.core.numero_changes import record_numero_change
+from app.core.expiry_wheel import expiry_wheel
+from app.core.numeros import numero_valido, virtual_numero_id, materialize_numeros
+from app.core.tenant_metrics import apply_user_active
+from app.core.user_stats import create_user_stats
 import logging
 import uuid
 import secrets
@@ -137,6 +142,8 @@ def create_user_from_whatsapp(db: Session, phone: str, name: str):
         tenant_id=tenant.id
     )
     db.add(new_user)
+    create_user_stats(db, new_user)
+    apply_user_active(db, tenant.id, False, True)
     db.commit()
     db.refresh(new_user)
     return new_user
@@ -279,17 +286,23 @@ async def process_message_logic(db: Session, session: WhatsappSession, incoming_
             RifaNumero.rifa_id == rifa_id,
             RifaNumero.numero == numero
         ).first()
-        
-        if not rifa_num:
-            whatsapp_service.send_text_message(sender, "Número inválido ou indisponível. Tente outro.")
-            return
+
+        if rifa_num:
+            numero_id = rifa_num.id
+        else:
+            # Rifa com numeração preguiçosa: número válido sem linha está LIVRE
+            rifa = db.query(Rifa).get(rifa_id)
+            if not (rifa and rifa.lazy_numeros and numero_valido(rifa.tipo_rifa, numero)):
+                whatsapp_service.send_text_message(sender, "Número inválido ou indisponível. Tente outro.")
+                return
+            numero_id = virtual_numero_id(rifa.id, numero)
             
-        if rifa_num.status != NumeroStatus.LIVRE and rifa_num.status != NumeroStatus.EXPIRADO:
+        if rifa_num and rifa_num.status != NumeroStatus.LIVRE and rifa_num.status != NumeroStatus.EXPIRADO:
              whatsapp_service.send_text_message(sender, "Este número já está reservado ou pago. Escolha outro.")
              return
 
         # Update session
-        update_session(db, session, "JOGAR_CONFIRMACAO", {"numero": numero, "numero_id": str(rifa_num.id)})
+        update_session(db, session, "JOGAR_CONFIRMACAO", {"numero": numero, "numero_id": str(numero_id)})
         
         # Show Confirmation
         data = session.temp_data
@@ -308,8 +321,11 @@ async def process_message_logic(db: Session, session: WhatsappSession, incoming_
             user = get_user_by_phone(db, sender)
             
             # Double check lock
-            rifa_num = db.query(RifaNumero).get(numero_id)
-            if rifa_num.status != NumeroStatus.LIVRE and rifa_num.status != NumeroStatus.EXPIRADO:
+            rifa = db.query(Rifa).get(session.temp_data.get("rifa_id"))
+            if rifa:
+                materialize_numeros(db, rifa, [session.temp_data.get("numero")])
+            rifa_num = db.query(RifaNumero).filter(RifaNumero.id == uuid.UUID(numero_id)).with_for_update().first()
+            if not rifa_num or (rifa_num.status != NumeroStatus.LIVRE and rifa_num.status != NumeroStatus.EXPIRADO):
                  whatsapp_service.send_text_message(sender, "Poxa, alguém acabou de pegar esse número! Tente outro.\n\n" + MSG_DIGITE_NUMERO)
                  update_session(db, session, "JOGAR_NUMERO")
                  return
@@ -317,10 +333,13 @@ async def process_message_logic(db: Session, session: WhatsappSession, incoming_
             # Reserve
             rifa_num.status = NumeroStatus.RESERVADO
             rifa_num.user_id = user.id
-            rifa_num.reserved_until = datetime.now() + timedelta(minutes=15)
+            reserved_until = datetime.utcnow() + timedelta(minutes=15)
+            rifa_num.reserved_until = reserved_until
             rifa_num.payment_id = str(uuid.uuid4())
+            record_numero_change(db, rifa_num)
             
             db.commit()
+            expiry_wheel.schedule(rifa_num.id, reserved_until)
             
             # Mock Pix
             pix_code = f"00020126580014BR.GOV.BCB.PIX...{rifa_num.numero}"
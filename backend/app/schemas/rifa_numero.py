@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, List
 from datetime import datetime
 from uuid import UUID
 from app.models.rifa import RifaTipo
@@ -32,3 +32,46 @@ class RifaNumeroResponse(RifaNumeroBase):
 
     class Config:
         from_attributes = True
+
+class MeuNumeroResponse(BaseModel):
+    numero: str
+    status: NumeroStatus
+    payment_id: Optional[str] = None
+    reserved_until: Optional[datetime] = None
+
+class RifaNumeroGridResponse(BaseModel):
+    rifa_id: UUID
+    tipo: RifaTipo
+    primeiro: int  # valor numérico do índice 0 da grade
+    total: int
+    digitos: int
+    encoding: str = "base64"
+    status_codes: Dict[str, int]
+    grid: str
+    meus_numeros: List[MeuNumeroResponse] = []
+    version: int = 0  # usar como `since` em /numeros/changes
+
+class RifaNumeroChangeResponse(BaseModel):
+    version: int  # id da mudança: pode vir repetida entre chamadas, deduplicar por ele
+    numero: str
+    status: NumeroStatus
+    is_owner: bool = False
+
+class RifaNumeroChangesResponse(BaseModel):
+    rifa_id: UUID
+    version: int
+    snapshot: bool = False  # True quando `since` é antigo demais e a grade vem completa
+    changes: List[RifaNumeroChangeResponse] = []
+    grid: Optional[RifaNumeroGridResponse] = None
+
+class ReservaLoteRequest(BaseModel):
+    numeros: List[str] = Field(..., min_length=1, max_length=100)
+    parcial: bool = False  # False: tudo ou nada; True: reserva o que estiver livre
+
+class ReservaLoteResponse(BaseModel):
+    message: str
+    payment_id: Optional[str] = None
+    expires_at: Optional[datetime] = None
+    reservados: List[str] = []
+    ja_reservados: List[str] = []  # já eram do usuário; mantêm o payment_id original
+    indisponiveis: List[str] = []
@@ -1,17 +1,90 @@
+import asyncio
 import httpx
 import logging
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Hashable, List, Optional
 from app.core.config import settings
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
 
+try:
+    import h2  # noqa: F401  (httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Timeouts por chamada: consultas são rápidas; criar cobrança/cliente pode demorar mais
+READ_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+WRITE_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+RETRY_BACKOFF_SECONDS = 0.3
+LIST_PAGE_SIZE = 100 # máximo aceito pelo Asaas em listagens
+
 class AsaasService:
+    """
+    Cliente da API do Asaas com um único httpx.AsyncClient (pool keep-alive,
+    HTTP/2 quando o pacote h2 está instalado), aberto/fechado junto com a app
+    (start/close, ou `async with`). Sem start() explícito o cliente é criado
+    no primeiro uso, no event loop atual.
+    """
+
     def __init__(self):
         self.base_url = settings.ASAAS_API_URL
         self.headers = {
             "access_token": settings.ASAAS_API_KEY,
             "Content-Type": "application/json"
         }
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                http2=HTTP2_AVAILABLE,
+                timeout=READ_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.ASAAS_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.ASAAS_MAX_CONNECTIONS,
+                    keepalive_expiry=60.0
+                )
+            )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _request(self, method: str, url: str, retries: int = 0, timeout: httpx.Timeout = READ_TIMEOUT, **kwargs) -> httpx.Response:
+        """
+        Requisição no cliente compartilhado. Falhas de conexão são repetidas até
+        `retries` vezes em qualquer método (a requisição não chegou ao Asaas);
+        429/5xx e timeouts de leitura só quando `method` é GET.
+        """
+        if self._client is None or self._client.is_closed:
+            await self.start()
+        for attempt in range(retries + 1):
+            last = attempt == retries
+            try:
+                response = await self._client.request(method, url, timeout=timeout, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if last:
+                    raise
+            except httpx.TransportError:
+                if last or method != "GET":
+                    raise
+            else:
+                if last or method != "GET" or response.status_code not in RETRY_STATUS_CODES:
+                    return response
+            await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
 
     async def create_pix_payment(self, customer_id: str, value: float, due_date: str, external_reference: str, description: str = None):
         """
@@ -29,21 +102,20 @@ class AsaasService:
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, headers=self.headers, timeout=30.0)
-                
-                if response.status_code != 200:
-                    logger.error(f"Erro ao criar pagamento Asaas: {response.text}")
-                    error_msg = "Erro na comunicação com Asaas"
-                    try:
-                        data = response.json()
-                        if "errors" in data and len(data["errors"]) > 0:
-                            error_msg = data["errors"][0].get("description", error_msg)
-                    except:
-                        pass
-                    raise HTTPException(status_code=400, detail=f"Erro Asaas: {error_msg}")
-                
-                return response.json()
+            response = await self._request("POST", url, retries=1, timeout=WRITE_TIMEOUT, json=payload)
+            
+            if response.status_code != 200:
+                logger.error(f"Erro ao criar pagamento Asaas: {response.text}")
+                error_msg = "Erro na comunicação com Asaas"
+                try:
+                    data = response.json()
+                    if "errors" in data and len(data["errors"]) > 0:
+                        error_msg = data["errors"][0].get("description", error_msg)
+                except:
+                    pass
+                raise HTTPException(status_code=400, detail=f"Erro Asaas: {error_msg}")
+            
+            return response.json()
         except httpx.RequestError as e:
             logger.error(f"Erro de conexão Asaas: {e}")
             raise HTTPException(status_code=503, detail="Erro de conexão com gateway de pagamento")
@@ -52,16 +124,15 @@ class AsaasService:
         """
         Busca um pagamento pelo externalReference (nosso ID interno).
         """
-        url = f"{self.base_url}/payments?externalReference={external_reference}"
+        url = f"{self.base_url}/payments"
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers, timeout=30.0)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get("totalCount", 0) > 0:
-                        return data["data"][0]
+            response = await self._request("GET", url, retries=2, params={"externalReference": external_reference})
+            
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("totalCount", 0) > 0:
+                    return data["data"][0]
             return None
         except Exception as e:
             logger.error(f"Erro ao buscar pagamento por referência: {e}")
@@ -74,14 +145,13 @@ class AsaasService:
         url = f"{self.base_url}/payments/{payment_id}/pixQrCode"
         
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers, timeout=30.0)
-                
-                if response.status_code != 200:
-                    logger.error(f"Erro ao obter QR Code Asaas: {response.text}")
-                    raise HTTPException(status_code=400, detail="Erro ao gerar QR Code")
-                
-                return response.json()
+            response = await self._request("GET", url, retries=2)
+            
+            if response.status_code != 200:
+                logger.error(f"Erro ao obter QR Code Asaas: {response.text}")
+                raise HTTPException(status_code=400, detail="Erro ao gerar QR Code")
+            
+            return response.json()
         except httpx.RequestError as e:
              raise HTTPException(status_code=503, detail="Erro de conexão ao buscar QR Code")
 
@@ -92,13 +162,12 @@ class AsaasService:
         """
         # Primeiro, tentar buscar cliente existente pelo CPF
         try:
-            search_url = f"{self.base_url}/customers?cpfCnpj={cpf_cnpj}"
-            async with httpx.AsyncClient() as client:
-                response = await client.get(search_url, headers=self.headers, timeout=30.0)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get("totalCount", 0) > 0:
-                        return data["data"][0]
+            search_url = f"{self.base_url}/customers"
+            response = await self._request("GET", search_url, retries=2, params={"cpfCnpj": cpf_cnpj})
+            if response.status_code == 200:
+                data = response.json()
+                if data.get("totalCount", 0) > 0:
+                    return data["data"][0]
         except Exception as e:
             logger.warning(f"Erro ao buscar cliente Asaas: {e}")
 
@@ -114,33 +183,85 @@ class AsaasService:
             payload["mobilePhone"] = phone # Asaas usa mobilePhone para celular
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, headers=self.headers, timeout=30.0)
-                
-                if response.status_code != 200:
-                    logger.error(f"Erro ao criar cliente Asaas: {response.text}")
-                    # Tenta extrair erro
-                    try:
-                        err_data = response.json()
-                        errors = err_data.get("errors", [])
-                        if errors:
-                            raise HTTPException(status_code=400, detail=f"Erro Asaas Cliente: {errors[0].get('description')}")
-                    except HTTPException:
-                        raise
-                    except:
-                        pass
-                    raise HTTPException(status_code=400, detail="Erro ao cadastrar cliente no pagamento")
-                
-                return response.json()
+            response = await self._request("POST", url, retries=1, timeout=WRITE_TIMEOUT, json=payload)
+            
+            if response.status_code != 200:
+                logger.error(f"Erro ao criar cliente Asaas: {response.text}")
+                # Tenta extrair erro
+                try:
+                    err_data = response.json()
+                    errors = err_data.get("errors", [])
+                    if errors:
+                        raise HTTPException(status_code=400, detail=f"Erro Asaas Cliente: {errors[0].get('description')}")
+                except HTTPException:
+                    raise
+                except:
+                    pass
+                raise HTTPException(status_code=400, detail="Erro ao cadastrar cliente no pagamento")
+            
+            return response.json()
         except httpx.RequestError:
              raise HTTPException(status_code=503, detail="Erro de conexão ao cadastrar cliente")
 
     async def get_payment_status(self, payment_id: str):
         url = f"{self.base_url}/payments/{payment_id}"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=self.headers)
-            if response.status_code == 200:
-                return response.json()
-            return None
+        response = await self._request("GET", url, retries=2)
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    async def iter_payments(self, **filters) -> AsyncIterator[List[dict]]:
+        """
+        Percorre GET /payments página a página (offset/limit, até hasMore=false),
+        devolvendo a lista `data` de cada página. `filters` vai direto como query
+        string, ex.: status="RECEIVED", **{"dateCreated[ge]": "2024-05-01"}.
+        Erros interrompem a listagem com exceção (o chamador decide repetir).
+        """
+        url = f"{self.base_url}/payments"
+        offset = 0
+        while True:
+            params = dict(filters, offset=offset, limit=LIST_PAGE_SIZE)
+            response = await self._request("GET", url, retries=2, params=params)
+            response.raise_for_status()
+            data = response.json()
+            page = data.get("data", [])
+            if page:
+                yield page
+            if not data.get("hasMore") or not page:
+                return
+            offset += len(page)
 
 asaas_service = AsaasService()
+
+
+class CustomerIdCache:
+    """
+    LRU em memória (tenant_id, user_id) -> id do cliente no Asaas, na frente
+    da coluna users.asaas_customer_id.
+    """
+
+    def __init__(self, max_size: int = settings.ASAAS_CUSTOMER_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            customer_id = self._entries.get(key)
+            if customer_id is not None:
+                self._entries.move_to_end(key)
+            return customer_id
+
+    def put(self, key: Hashable, customer_id: str):
+        with self._lock:
+            self._entries[key] = customer_id
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+customer_ids = CustomerIdCache()
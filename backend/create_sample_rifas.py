@@ -8,7 +8,9 @@ sys.path.append(os.getcwd())
 
 from app.db.session import SessionLocal
 from app.models.user import User
-from app.models.rifa import Rifa, RifaStatus
+from app.models.rifa import Rifa, RifaStatus, RifaTipo, RifaLocal
+from app.core.config import settings
+from app.core.numeros import generate_numeros
 
 def create_sample_rifas():
     db = SessionLocal()
@@ -25,7 +27,7 @@ def create_sample_rifas():
                 "titulo": "iPhone 15 Pro Max",
                 "descricao": "Sorteio de um iPhone 15 Pro Max 256GB. Cor Titânio Natural.",
                 "preco_numero": Decimal("0.50"),
-                "quantidade_numeros": 10000,
+                "tipo_rifa": RifaTipo.MILHAR,
                 "data_sorteio": datetime.now() + timedelta(days=7),
                 "status": RifaStatus.ATIVA
             },
@@ -33,7 +35,7 @@ def create_sample_rifas():
                 "titulo": "Honda CB 300F Twister",
                 "descricao": "Moto 0km, emplacada e com tanque cheio!",
                 "preco_numero": Decimal("1.00"),
-                "quantidade_numeros": 20000,
+                "tipo_rifa": RifaTipo.MILHAR,
                 "data_sorteio": datetime.now() + timedelta(days=15),
                 "status": RifaStatus.ATIVA
             },
@@ -41,7 +43,7 @@ def create_sample_rifas():
                 "titulo": "Pix de R$ 5.000,00",
                 "descricao": "Dinheiro na conta na hora!",
                 "preco_numero": Decimal("0.25"),
-                "quantidade_numeros": 50000,
+                "tipo_rifa": RifaTipo.CENTENA,
                 "data_sorteio": datetime.now() + timedelta(days=3),
                 "status": RifaStatus.RASCUNHO
             }
@@ -53,9 +55,15 @@ def create_sample_rifas():
             if not exists:
                 rifa = Rifa(
                     **data,
-                    owner_id=admin.id
+                    local_sorteio=RifaLocal.FEDERAL.value,
+                    owner_id=admin.id,
+                    tenant_id=admin.tenant_id,
+                    lazy_numeros=settings.LAZY_NUMEROS
                 )
                 db.add(rifa)
+                db.flush()
+                if not rifa.lazy_numeros:
+                    generate_numeros(db, rifa)
                 created_count += 1
                 print(f"➕ Criando Rifa: {data['titulo']}")
             else:
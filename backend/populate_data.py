@@ -12,6 +12,7 @@ from app.models.rifa import Rifa, RifaStatus, RifaTipo, RifaLocal
 from app.models.rifa_numero import RifaNumero, NumeroStatus
 from app.models.tenant import Tenant
 from app.models.user import User
+from app.core.numeros import generate_numeros
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -76,7 +77,8 @@ def populate():
                 data_sorteio=datetime.now(timezone.utc) + timedelta(hours=1),
                 local_sorteio=RifaLocal.PT_RJ,
                 owner_id=admin.id,
-                tenant_id=tenant.id
+                tenant_id=tenant.id,
+                lazy_numeros=False # Script reserva o 00 direto na linha
             )
             db.add(rifa)
             db.commit()
@@ -85,16 +87,7 @@ def populate():
             # Create numbers for rifa
             logger.info("Creating numbers...")
             # For Dezena, it's 00-99
-            for i in range(100):
-                num_str = f"{i:02d}"
-                n = RifaNumero(
-                    rifa_id=rifa.id, 
-                    numero=num_str, 
-                    status=NumeroStatus.LIVRE, 
-                    tipo=RifaTipo.DEZENA,
-                    tenant_id=tenant.id
-                )
-                db.add(n)
+            generate_numeros(db, rifa)
             db.commit()
         
         # 3. Reserve Number 00
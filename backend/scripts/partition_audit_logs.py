@@ -0,0 +1,49 @@
+import sys
+import os
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+import app.models  # noqa: F401  (registra os models)
+from app.db.session import SessionLocal
+from app.models.audit_finance import AuditLog
+from app.core.audit_partitions import is_partitioned, ensure_partitions
+
+# Converte audit_logs (tabela comum) em tabela particionada por mês.
+# Rode com a aplicação parada: tudo acontece numa transação só e as linhas
+# antigas são copiadas de uma vez.
+
+COLUMNS = "id, actor_id, actor_role, action, entity_type, entity_id, old_value, new_value, ip_address, user_agent, tenant_id"
+
+def main():
+    db = SessionLocal()
+    try:
+        if is_partitioned(db):
+            print("audit_logs is already partitioned.")
+            return
+
+        db.execute(text("ALTER TABLE audit_logs RENAME TO audit_logs_legacy"))
+        db.execute(text("ALTER TABLE audit_logs_legacy RENAME CONSTRAINT audit_logs_pkey TO audit_logs_legacy_pkey"))
+        for index in AuditLog.__table__.indexes:
+            db.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+        AuditLog.__table__.create(bind=db.connection())
+        oldest = db.execute(text("SELECT min(created_at) FROM audit_logs_legacy")).scalar()
+        ensure_partitions(db, since=oldest)
+
+        copied = db.execute(text(
+            f"INSERT INTO audit_logs ({COLUMNS}, created_at) "
+            f"SELECT {COLUMNS}, coalesce(created_at, now()) FROM audit_logs_legacy"
+        )).rowcount
+        db.execute(text("DROP TABLE audit_logs_legacy"))
+        db.commit()
+        print(f"audit_logs partitioned, {copied} rows copied.")
+    except Exception as e:
+        print(f"Error partitioning audit_logs: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import sys
+import os
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.models  # noqa: F401  (registra os models)
+from app.db.session import SessionLocal
+from app.core.revenue_rollups import rebuild_revenue_rollups
+
+def main():
+    db = SessionLocal()
+    try:
+        count = rebuild_revenue_rollups(db)
+        print(f"revenue_rollups rebuilt ({count} rows).")
+    except Exception as e:
+        print(f"Error rebuilding revenue_rollups: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
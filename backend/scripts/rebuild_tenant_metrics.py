@@ -0,0 +1,23 @@
+import sys
+import os
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.models  # noqa: F401  (registra os models)
+from app.db.session import SessionLocal
+from app.core.tenant_metrics import rebuild_tenant_metrics
+
+def main():
+    db = SessionLocal()
+    try:
+        count = rebuild_tenant_metrics(db)
+        print(f"tenant_metrics rebuilt for {count} tenants.")
+    except Exception as e:
+        print(f"Error rebuilding tenant_metrics: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import sys
+import os
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.models  # noqa: F401  (registra os models)
+from app.db.session import SessionLocal
+from app.core.user_stats import rebuild_user_stats
+
+def main():
+    db = SessionLocal()
+    try:
+        count = rebuild_user_stats(db)
+        print(f"user_stats rebuilt for {count} users.")
+    except Exception as e:
+        print(f"Error rebuilding user_stats: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
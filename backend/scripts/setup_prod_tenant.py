@@ -7,6 +7,8 @@ from sqlalchemy.orm import Session
 from app.db.session import SessionLocal
 from app.models.tenant import Tenant
 from app.models.user import User
+from app.models.user_stats import UserStats
+from app.core.user_stats import create_user_stats
 from app.core.security import get_password_hash
 
 def setup():
@@ -41,6 +43,7 @@ def setup():
                 tenant_id=tenant.id
             )
             db.add(user)
+            create_user_stats(db, user)
             db.commit()
             print(f"User created: {email} / admin123")
         else:
@@ -48,6 +51,9 @@ def setup():
             # Ensure tenant link
             if user.tenant_id != tenant.id:
                 user.tenant_id = tenant.id
+                db.query(UserStats).filter(UserStats.user_id == user.id).update(
+                    {"tenant_id": tenant.id}, synchronize_session=False
+                )
                 db.commit()
                 print(f"Updated user {email} to tenant {tenant.id}")
 
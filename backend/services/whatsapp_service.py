@@ -25,10 +25,11 @@ class WhatsAppService:
         if self.meta_enabled:
              logger.info("Meta WhatsApp Cloud API Enabled")
 
-    def _send_meta_message(self, to: str, template_name: str, variables: list):
-        if not self.meta_enabled:
-            return None
-            
+    def meta_request(self, to: str, template_name: str, variables: list):
+        """
+        URL, headers e payload de uma mensagem de template da Meta
+        (usado aqui e pelo envio assíncrono de app.core.broadcast).
+        """
         url = f"{settings.META_API_URL}/{settings.META_PHONE_NUMBER_ID}/messages"
         headers = {
             "Authorization": f"Bearer {settings.META_ACCESS_TOKEN}",
@@ -58,6 +59,13 @@ class WhatsAppService:
                 ]
             }
         }
+        return url, headers, payload
+
+    def _send_meta_message(self, to: str, template_name: str, variables: list):
+        if not self.meta_enabled:
+            return None
+            
+        url, headers, payload = self.meta_request(to, template_name, variables)
         
         try:
             response = requests.post(url, headers=headers, json=payload)
@@ -106,30 +114,36 @@ class WhatsAppService:
             logger.error(f"Error sending WhatsApp text to {to}: {e}")
             return None
 
+    def twilio_numbers(self, to: str):
+        """
+        (to, from) no formato "whatsapp:+55..." esperado pelo Twilio.
+        """
+        if not to.startswith("whatsapp:"):
+            # Remove spaces, dashes, parens
+            clean_number = "".join(filter(str.isdigit, to))
+            
+            # Brazil specific: If length is 10 or 11 (DDD + Number), add 55
+            if len(clean_number) in [10, 11]:
+                clean_number = f"55{clean_number}"
+
+            # If no +, add it.
+            if not to.startswith("+"):
+                 to = f"+{clean_number}"
+            to = f"whatsapp:{to}"
+        
+        # Ensure from_number has whatsapp: prefix
+        from_number = settings.TWILIO_FROM_NUMBER
+        if not from_number.startswith("whatsapp:"):
+            from_number = f"whatsapp:{from_number}"
+        return to, from_number
+
     def _send_twilio_message(self, to: str, content_sid: str, content_variables: dict):
         if not self.twilio_enabled or not self.client:
             logger.info(f"Twilio disabled or not initialized. Skipping message to {to}")
             return
 
         try:
-            # Format number (ensure whatsapp: prefix)
-            if not to.startswith("whatsapp:"):
-                # Remove spaces, dashes, parens
-                clean_number = "".join(filter(str.isdigit, to))
-                
-                # Brazil specific: If length is 10 or 11 (DDD + Number), add 55
-                if len(clean_number) in [10, 11]:
-                    clean_number = f"55{clean_number}"
-
-                # If no +, add it.
-                if not to.startswith("+"):
-                     to = f"+{clean_number}"
-                to = f"whatsapp:{to}"
-            
-            # Ensure from_number has whatsapp: prefix
-            from_number = settings.TWILIO_FROM_NUMBER
-            if not from_number.startswith("whatsapp:"):
-                from_number = f"whatsapp:{from_number}"
+            to, from_number = self.twilio_numbers(to)
 
             # Send using Content API (Templates)
             message = self.client.messages.create(
@@ -146,30 +160,35 @@ class WhatsAppService:
         except Exception as e:
             logger.error(f"Unexpected error sending WhatsApp to {to}: {e}")
 
+    def provider(self):
+        """
+        "meta", "twilio" ou None: a Meta tem prioridade quando as duas estão ativas.
+        """
+        if self.meta_enabled:
+            return "meta"
+        if self.twilio_enabled and self.client:
+            return "twilio"
+        return None
+
     def send_new_raffle_notification(self, user_phone: str, rifa_nome: str, data_sorteio: str, tipo: str, rifa_id: str):
         """
         Send notification about new raffle.
         """
+        variables = [rifa_nome, str(data_sorteio), tipo, rifa_id]
         # 1. Try Meta First
         if self.meta_enabled:
              return self._send_meta_message(
                  to=user_phone,
                  template_name=settings.META_TEMPLATE_NEW_RIFA,
-                 variables=[rifa_nome, str(data_sorteio), tipo, rifa_id]
+                 variables=variables
              )
         
         # 2. Fallback to Twilio
         if self.twilio_enabled:
-            variables = {
-                "1": rifa_nome,
-                "2": str(data_sorteio),
-                "3": tipo,
-                "4": rifa_id
-            }
             return self._send_twilio_message(
                 to=user_phone,
                 content_sid=settings.TWILIO_TEMPLATE_NEW_RIFA,
-                content_variables=variables
+                content_variables={str(i): v for i, v in enumerate(variables, start=1)}
             )
         
         logger.warning("No WhatsApp service enabled (Meta or Twilio). Notification skipped.")
@@ -0,0 +1,61 @@
+from app.core import antifraud
+from app.core.antifraud import SlidingWindowLimiter
+
+
+def test_limite_conta_tentativas_recusadas(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(antifraud.time, "monotonic", lambda: agora[0])
+    limiter = SlidingWindowLimiter(window_seconds=60)
+
+    assert all(limiter.hit("ip:1.2.3.4", 3) for _ in range(3))
+    assert not limiter.hit("ip:1.2.3.4", 3)
+    assert limiter.hit("ip:5.6.7.8", 3)
+
+    # Tentativas recusadas continuam na janela
+    agora[0] += 30
+    assert not limiter.hit("ip:1.2.3.4", 3)
+    assert limiter.count("ip:1.2.3.4") == 5
+
+
+def test_janela_desliza(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(antifraud.time, "monotonic", lambda: agora[0])
+    limiter = SlidingWindowLimiter(window_seconds=60)
+
+    for _ in range(3):
+        limiter.hit("user:1", 3)
+    limiter.hit("ip:x", 3)
+    agora[0] += 61
+    assert limiter.hit("user:1", 3)
+    assert limiter.count("user:1") == 1
+    # Chaves sem atividade na janela são descartadas
+    assert "ip:x" not in limiter._hits
+
+
+class _CountDB:
+    def __init__(self, active):
+        self.active = active
+
+    def query(self, *args):
+        return self
+
+    def filter(self, *args):
+        return self
+
+    def scalar(self):
+        return self.active
+
+
+def test_limite_do_lote_conta_so_numeros_novos():
+    import pytest
+    from types import SimpleNamespace
+    from fastapi import HTTPException
+    from app.core.antifraud import MAX_SIMULTANEOUS_RESERVATIONS, check_reservation_limit
+
+    user = SimpleNamespace(id=1, role="user")
+    # Lote de 20 sem reservas ativas passa; números já do usuário já estão em `active`
+    check_reservation_limit(_CountDB(0), user, "rifa", MAX_SIMULTANEOUS_RESERVATIONS)
+    check_reservation_limit(_CountDB(MAX_SIMULTANEOUS_RESERVATIONS), user, "rifa", 0)
+    with pytest.raises(HTTPException) as exc:
+        check_reservation_limit(_CountDB(MAX_SIMULTANEOUS_RESERVATIONS - 1), user, "rifa", 2)
+    assert exc.value.status_code == 429
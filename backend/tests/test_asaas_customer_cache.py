@@ -0,0 +1,21 @@
+from app.services.asaas_service import CustomerIdCache
+
+
+def test_lru_descarta_o_menos_usado():
+    cache = CustomerIdCache(max_size=2)
+    cache.put(("t", 1), "cus_1")
+    cache.put(("t", 2), "cus_2")
+
+    assert cache.get(("t", 1)) == "cus_1"
+    cache.put(("t", 3), "cus_3")
+
+    assert cache.get(("t", 2)) is None
+    assert cache.get(("t", 1)) == "cus_1"
+    assert cache.get(("t", 3)) == "cus_3"
+
+
+def test_invalidate():
+    cache = CustomerIdCache(max_size=2)
+    cache.put(("t", 1), "cus_1")
+    cache.invalidate(("t", 1))
+    assert cache.get(("t", 1)) is None
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+
+from app.core.audit_partitions import add_months, create_partition, month_start, partition_name
+
+
+BRT = timezone(timedelta(hours=-3))
+
+
+class ScriptedDB:
+    """
+    Responde os SELECTs de create_partition na ordem (existe?, há linhas na default?)
+    e guarda o SQL executado.
+    """
+
+    def __init__(self, *scalars):
+        self.scalars = list(scalars)
+        self.sql = []
+
+    def execute(self, stmt, params=None):
+        self.sql.append(str(stmt))
+        db = self
+
+        class Result:
+            rowcount = 0
+
+            def scalar(self):
+                return db.scalars.pop(0)
+
+        return Result()
+
+
+def test_month_start_em_utc():
+    assert month_start(datetime(2024, 5, 17, 13, 45, tzinfo=timezone.utc)) == datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+def test_month_start_sem_timezone_e_tratado_como_utc():
+    assert month_start(datetime(2024, 5, 31, 23, 59)) == datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+def test_month_start_converte_para_utc_antes_de_cortar():
+    # 31/12 22h em Brasília já é 01/01 01h UTC: o mês é janeiro do ano seguinte
+    assert month_start(datetime(2024, 12, 31, 22, 0, tzinfo=BRT)) == datetime(2025, 1, 1, tzinfo=timezone.utc)
+    # 01/01 00h30 em +05:00 ainda é dezembro em UTC
+    mais_cinco = timezone(timedelta(hours=5))
+    assert month_start(datetime(2025, 1, 1, 0, 30, tzinfo=mais_cinco)) == datetime(2024, 12, 1, tzinfo=timezone.utc)
+
+
+def test_add_months_atravessa_anos():
+    dez = datetime(2024, 12, 1, tzinfo=timezone.utc)
+    assert add_months(dez, 1) == datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert add_months(dez, 13) == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert add_months(datetime(2025, 1, 1, tzinfo=timezone.utc), -1) == dez
+    assert add_months(dez, -12) == datetime(2023, 12, 1, tzinfo=timezone.utc)
+    assert add_months(dez, 0) == dez
+
+
+def test_partition_name():
+    assert partition_name(datetime(2024, 5, 1, tzinfo=timezone.utc)) == "audit_logs_2024_05"
+    assert partition_name(datetime(2025, 12, 1, tzinfo=timezone.utc)) == "audit_logs_2025_12"
+
+
+def test_create_partition_limites_do_mes():
+    db = ScriptedDB(False, False)
+
+    assert create_partition(db, datetime(2024, 12, 1, tzinfo=timezone.utc)) is True
+
+    create = db.sql[-1]
+    assert create.startswith("CREATE TABLE audit_logs_2024_12 PARTITION OF audit_logs")
+    assert "FROM ('2024-12-01T00:00:00+00:00') TO ('2025-01-01T00:00:00+00:00')" in create
+
+
+def test_create_partition_com_linhas_na_default_anexa_com_os_mesmos_limites():
+    db = ScriptedDB(False, True)
+
+    assert create_partition(db, datetime(2025, 1, 1, tzinfo=timezone.utc)) is True
+
+    attach = db.sql[-1]
+    assert attach.startswith("ALTER TABLE audit_logs ATTACH PARTITION audit_logs_2025_01")
+    assert "FROM ('2025-01-01T00:00:00+00:00') TO ('2025-02-01T00:00:00+00:00')" in attach
+
+
+def test_create_partition_existente_nao_faz_nada():
+    db = ScriptedDB(True)
+
+    assert create_partition(db, datetime(2025, 1, 1, tzinfo=timezone.utc)) is False
+    assert len(db.sql) == 1
@@ -0,0 +1,31 @@
+import requests
+
+
+BASE_URL = "http://localhost:8000/api/v1"
+
+
+def test_auditoria_paginacao_por_cursor(token):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    primeira = requests.get(f"{BASE_URL}/admin/auditoria", params={"limit": 2}, headers=headers)
+    assert primeira.status_code == 200, primeira.text
+    data = primeira.json()
+    assert len(data["items"]) <= 2
+    if not data["next_cursor"]:
+        return
+
+    segunda = requests.get(
+        f"{BASE_URL}/admin/auditoria",
+        params={"limit": 2, "cursor": data["next_cursor"]},
+        headers=headers,
+    )
+    assert segunda.status_code == 200, segunda.text
+    ids = {log["id"] for log in data["items"]}
+    assert ids.isdisjoint(log["id"] for log in segunda.json()["items"])
+    assert segunda.json()["items"][0]["created_at"] <= data["items"][-1]["created_at"]
+
+
+def test_auditoria_cursor_invalido(token):
+    headers = {"Authorization": f"Bearer {token}"}
+    res = requests.get(f"{BASE_URL}/admin/auditoria", params={"cursor": "nao-e-cursor"}, headers=headers)
+    assert res.status_code == 400
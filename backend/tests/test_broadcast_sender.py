@@ -0,0 +1,69 @@
+import asyncio
+import httpx
+import pytest
+
+from app.core.broadcast import AsyncWhatsAppSender, RetryableSendError, TokenBucket, retry_delay
+
+
+MENSAGEM = {"meta_template": "nova_rifa", "twilio_content_sid": "HX1", "variables": ["Rifa", "hoje"]}
+
+
+def _sender(status_code, headers=None, body=None):
+    def handler(request):
+        return httpx.Response(status_code, headers=headers, json=body or {})
+    return AsyncWhatsAppSender(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+
+def test_429_e_repetivel_com_retry_after():
+    sender = _sender(429, headers={"Retry-After": "7"})
+    with pytest.raises(RetryableSendError) as exc:
+        asyncio.run(sender.send("meta", "11999999999", MENSAGEM))
+    assert exc.value.retry_after == 7
+
+
+def test_400_nao_e_repetivel():
+    sender = _sender(400)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(sender.send("twilio", "11999999999", MENSAGEM))
+
+
+def test_sucesso_devolve_id_da_mensagem():
+    sender = _sender(200, body={"messages": [{"id": "wamid.1"}]})
+    assert asyncio.run(sender.send("meta", "11999999999", MENSAGEM)) == "wamid.1"
+
+
+def test_token_bucket_limita_vazao(monkeypatch):
+    agora = [0.0]
+    esperas = []
+
+    async def fake_sleep(segundos):
+        esperas.append(segundos)
+        agora[0] += segundos
+
+    monkeypatch.setattr("app.core.broadcast.time.monotonic", lambda: agora[0])
+    monkeypatch.setattr("app.core.broadcast.asyncio.sleep", fake_sleep)
+
+    async def consumir():
+        bucket = TokenBucket(rate=5)
+        for _ in range(10):
+            await bucket.acquire()
+
+    asyncio.run(consumir())
+    # 5 fichas da rajada inicial, as outras 5 a 5/s
+    assert agora[0] == pytest.approx(1.0)
+
+
+def test_retry_after_e_respeitado_sem_jitter(monkeypatch):
+    monkeypatch.setattr("app.core.broadcast.random.random", lambda: 0.0)
+    # jitter no mínimo (metade do backoff): o Retry-After não pode encolher
+    assert retry_delay(0, retry_after=7) == 7
+    assert retry_delay(10, retry_after=7) == 30
+
+
+def test_backoff_com_jitter_sem_retry_after(monkeypatch):
+    monkeypatch.setattr("app.core.broadcast.random.random", lambda: 1.0)
+    assert retry_delay(0) == 1.0
+    assert retry_delay(3) == 8.0
+    assert retry_delay(20) == 60.0
+    monkeypatch.setattr("app.core.broadcast.random.random", lambda: 0.0)
+    assert retry_delay(3) == 4.0
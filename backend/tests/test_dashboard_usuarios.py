@@ -0,0 +1,35 @@
+import requests
+
+
+BASE_URL = "http://localhost:8000/api/v1"
+
+
+def test_usuarios_paginacao_por_cursor(token):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    completo = requests.get(
+        f"{BASE_URL}/admin/dashboard/usuarios", params={"limit": 500}, headers=headers
+    ).json()["items"]
+
+    vistos = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        res = requests.get(f"{BASE_URL}/admin/dashboard/usuarios", params=params, headers=headers)
+        assert res.status_code == 200, res.text
+        data = res.json()
+        vistos.extend(u["id"] for u in data["items"])
+        cursor = data["next_cursor"]
+        if not cursor or len(vistos) >= len(completo):
+            break
+
+    assert vistos == [u["id"] for u in completo][:len(vistos)]
+    assert len(vistos) == len(set(vistos))
+
+
+def test_usuarios_cursor_invalido(token):
+    headers = {"Authorization": f"Bearer {token}"}
+    res = requests.get(f"{BASE_URL}/admin/dashboard/usuarios", params={"cursor": "lixo"}, headers=headers)
+    assert res.status_code == 400
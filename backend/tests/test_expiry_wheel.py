@@ -0,0 +1,56 @@
+import random
+
+from app.core.expiry_wheel import HierarchicalTimerWheel
+
+
+START = 1_000_000_007
+
+
+def test_dispara_no_prazo_em_todos_os_niveis():
+    wheel = HierarchicalTimerWheel(START)
+    prazos = {"segundos": START + 5, "minutos": START + 125, "horas": START + 7300, "overflow": START + 90000}
+    for key, prazo in prazos.items():
+        wheel.schedule(key, prazo)
+
+    disparos = {}
+    for tick in range(START + 1, START + 90001):
+        for key in wheel.advance(tick):
+            disparos[key] = tick
+
+    assert disparos == prazos
+    assert len(wheel) == 0
+
+
+def test_reagendar_e_cancelar():
+    wheel = HierarchicalTimerWheel(START)
+    wheel.schedule("estendida", START + 10)
+    wheel.schedule("estendida", START + 900)
+    wheel.schedule("liberada", START + 10)
+    wheel.cancel("liberada")
+
+    assert wheel.advance(START + 899) == []
+    assert wheel.advance(START + 900) == ["estendida"]
+
+
+def test_prazo_passado_dispara_no_proximo_tick():
+    wheel = HierarchicalTimerWheel(START)
+    wheel.schedule("vencida", START - 30)
+    assert wheel.advance(START + 1) == ["vencida"]
+
+
+def test_avanco_em_saltos():
+    random.seed(7)
+    wheel = HierarchicalTimerWheel(START)
+    prazos = {i: START + random.randint(1, 200000) for i in range(2000)}
+    for key, prazo in prazos.items():
+        wheel.schedule(key, prazo)
+
+    disparos = {}
+    tick = START
+    while tick < START + 200000:
+        tick += random.randint(1, 50)
+        for key in wheel.advance(tick):
+            disparos[key] = tick
+
+    assert set(disparos) == set(prazos)
+    assert all(0 <= disparos[k] - prazos[k] < 50 for k in prazos)
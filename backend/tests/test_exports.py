@@ -0,0 +1,41 @@
+import csv
+import io
+import json
+import requests
+
+
+BASE_URL = "http://localhost:8000/api/v1"
+
+
+def test_export_pagamentos_csv(token):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    res = requests.get(f"{BASE_URL}/admin/export/pagamentos", headers=headers, stream=True)
+    assert res.status_code == 200, res.text
+    assert res.headers["content-type"].startswith("text/csv")
+    assert "attachment" in res.headers["content-disposition"]
+
+    rows = list(csv.reader(io.StringIO(res.text)))
+    assert rows[0] == ["id", "created_at", "rifa_id", "rifa", "numero_id", "user_id",
+                       "payment_id", "valor", "metodo", "status"]
+
+
+def test_export_auditoria_ndjson(token):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    res = requests.get(
+        f"{BASE_URL}/admin/export/auditoria",
+        params={"formato": "ndjson"},
+        headers=headers,
+        stream=True,
+    )
+    assert res.status_code == 200, res.text
+    for line in res.iter_lines():
+        if line:
+            assert "action" in json.loads(line)
+
+
+def test_export_formato_invalido(token):
+    headers = {"Authorization": f"Bearer {token}"}
+    res = requests.get(f"{BASE_URL}/admin/export/pagamentos", params={"formato": "xlsx"}, headers=headers)
+    assert res.status_code == 422
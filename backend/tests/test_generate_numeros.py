@@ -0,0 +1,26 @@
+import uuid
+from types import SimpleNamespace
+from sqlalchemy.dialects import postgresql
+
+import app.routers.rifas  # noqa: F401  (registra os models)
+from app.core.numeros import generate_numeros
+from app.models.rifa import RifaTipo
+
+
+class CaptureDB:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, stmt):
+        self.statements.append(stmt)
+
+
+def test_generate_series_nomeia_a_coluna_value():
+    db = CaptureDB()
+    rifa = SimpleNamespace(id=uuid.uuid4(), tipo_rifa=RifaTipo.DEZENA, tenant_id=uuid.uuid4())
+
+    generate_numeros(db, rifa)
+
+    sql = str(db.statements[0].compile(dialect=postgresql.dialect()))
+    assert "AS i(value)" in sql
+    assert "CAST(i.value AS VARCHAR)" in sql
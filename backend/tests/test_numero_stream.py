@@ -0,0 +1,84 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+from app.core import numero_stream
+from app.core.numero_stream import NumeroChangeBroadcaster
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+        self.cursor = None
+
+    def filter(self, criterion):
+        self.cursor = criterion.right.value
+        return self
+
+    def order_by(self, *args):
+        return self
+
+    def all(self):
+        return sorted((r for r in self.rows if r.txid >= self.cursor), key=lambda r: r.id)
+
+
+class FakeSession:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def query(self, *args):
+        return FakeQuery(self.rows)
+
+    def close(self):
+        pass
+
+
+def _change(id, txid):
+    return SimpleNamespace(id=id, txid=txid, rifa_id=uuid.UUID(int=1), numero=f"{id:02d}", status="reservado")
+
+
+def test_mudanca_commitada_fora_de_ordem_nao_se_perde(monkeypatch):
+    rows = []
+    horizons = iter([100, 100, 103])
+    monkeypatch.setattr(numero_stream, "SessionLocal", lambda: FakeSession(rows))
+    monkeypatch.setattr(numero_stream, "latest_version", lambda db: next(horizons))
+    broadcaster = NumeroChangeBroadcaster()
+
+    cursor, seen, fresh = broadcaster._fetch(None, set())
+    assert (cursor, fresh) == (100, [])
+
+    # Transação 101 (id 2) commita antes da 100 (id 1), que ainda está aberta
+    rows.append(_change(2, 101))
+    cursor, seen, fresh = broadcaster._fetch(cursor, seen)
+    assert [c.id for c in fresh] == [2]
+
+    # A 100 commita depois: o id menor ainda é entregue, o 2 não se repete
+    rows.append(_change(1, 100))
+    cursor, seen, fresh = broadcaster._fetch(cursor, seen)
+    assert [c.id for c in fresh] == [1]
+    assert cursor == 103 and seen == set()
+
+
+def test_assinatura_recua_o_cursor_ate_a_versao_do_cliente(monkeypatch):
+    rows = [_change(1, 95)]
+    monkeypatch.setattr(numero_stream, "SessionLocal", lambda: FakeSession(rows))
+    monkeypatch.setattr(numero_stream, "latest_version", lambda db: 100)
+    broadcaster = NumeroChangeBroadcaster()
+    monkeypatch.setattr(broadcaster, "_run", lambda: asyncio.sleep(0))
+
+    async def assinar():
+        broadcaster.subscribe(uuid.UUID(int=1), 95)
+        # Broadcaster já tinha avançado além do hello do novo cliente
+        broadcaster._cursor = 100
+        broadcaster.subscribe(uuid.UUID(int=1), 97)
+
+    asyncio.run(assinar())
+
+    cursor = broadcaster._take_cursor()
+    assert cursor == 95
+    # Mudança commitada entre o hello (95) e o horizonte do broadcaster (100)
+    _, _, fresh = broadcaster._fetch(cursor, set())
+    assert [c.id for c in fresh] == [1]
+    # Recuo aplicado uma vez só
+    broadcaster._cursor = 100
+    assert broadcaster._take_cursor() == 100
@@ -0,0 +1,95 @@
+import base64
+import requests
+from datetime import datetime, timedelta, timezone
+
+
+BASE_URL = "http://localhost:8000/api/v1"
+
+
+def _create_rifa(token_value: str) -> str:
+    headers = {"Authorization": f"Bearer {token_value}"}
+    now = datetime.now(timezone.utc)
+    payload = {
+        "titulo": f"Rifa Grade {now.timestamp()}",
+        "descricao": "Rifa criada para testes da grade compacta",
+        "preco_numero": 10.0,
+        "tipo_rifa": "dezena",
+        "data_sorteio": (now + timedelta(hours=1)).isoformat(),
+        "hora_encerramento": (now + timedelta(minutes=30)).isoformat(),
+        "local_sorteio": "PT-RJ",
+        "status": "ativa",
+    }
+    res = requests.post(f"{BASE_URL}/rifas/", json=payload, headers=headers)
+    assert res.status_code == 200, f"Falha ao criar rifa: {res.text}"
+    return res.json()["id"]
+
+
+def test_grid_dezena_livre(token):
+    rifa_id_local = _create_rifa(token)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    res = requests.get(f"{BASE_URL}/rifas/{rifa_id_local}/numeros/grid", headers=headers)
+    assert res.status_code == 200, res.text
+    data = res.json()
+
+    grid = base64.b64decode(data["grid"])
+    assert data["total"] == 100
+    assert len(grid) == 100
+    assert set(grid) == {data["status_codes"]["livre"]}
+    assert data["meus_numeros"] == []
+
+
+def test_grid_binario(token):
+    rifa_id_local = _create_rifa(token)
+    headers = {"Authorization": f"Bearer {token}", "Accept": "application/octet-stream"}
+
+    res = requests.get(f"{BASE_URL}/rifas/{rifa_id_local}/numeros/grid", headers=headers)
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/octet-stream"
+    assert len(res.content) == 100
+
+
+def test_changes_apos_reserva(token):
+    rifa_id_local = _create_rifa(token)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    snapshot = requests.get(f"{BASE_URL}/rifas/{rifa_id_local}/numeros/changes", headers=headers).json()
+    assert snapshot["snapshot"] is True
+    version = snapshot["version"]
+
+    reserva = requests.post(f"{BASE_URL}/rifas/{rifa_id_local}/numeros/07/reservar", headers=headers)
+    assert reserva.status_code == 200, reserva.text
+
+    res = requests.get(
+        f"{BASE_URL}/rifas/{rifa_id_local}/numeros/changes",
+        params={"since": version},
+        headers=headers,
+    )
+    assert res.status_code == 200
+    data = res.json()
+    if not data["snapshot"]:
+        assert [(c["numero"], c["status"], c["is_owner"]) for c in data["changes"]] == [("07", "reservado", True)]
+        assert data["version"] > version
+
+    grid = requests.get(f"{BASE_URL}/rifas/{rifa_id_local}/numeros/grid", headers=headers).json()
+    assert base64.b64decode(grid["grid"])[7] == grid["status_codes"]["reservado"]
+    assert [n["numero"] for n in grid["meus_numeros"]] == ["07"]
+
+
+def test_lista_completa_com_ids_estaveis(token):
+    rifa_id_local = _create_rifa(token)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    antes = requests.get(f"{BASE_URL}/rifas/{rifa_id_local}/numeros", headers=headers).json()
+    assert [n["numero"] for n in antes] == [f"{i:02d}" for i in range(100)]
+    id_33 = next(n["id"] for n in antes if n["numero"] == "33")
+
+    # Reservar pelo id listado funciona mesmo que o número ainda não tenha linha
+    reserva = requests.post(f"{BASE_URL}/rifas/{rifa_id_local}/numeros/{id_33}/reservar", headers=headers)
+    assert reserva.status_code == 200, reserva.text
+
+    depois = requests.get(f"{BASE_URL}/rifas/{rifa_id_local}/numeros", headers=headers).json()
+    num_33 = next(n for n in depois if n["numero"] == "33")
+    assert num_33["id"] == id_33
+    assert num_33["status"] == "reservado"
+    assert len(depois) == 100
@@ -0,0 +1,123 @@
+import queue
+from types import SimpleNamespace
+from app.core import payment_events
+from app.core.payment_events import PaymentEventWorker, ingest_payment_event
+
+
+class FakeResult:
+    def __init__(self, value):
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeDB:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+        self.commits = 0
+
+    def execute(self, stmt):
+        return FakeResult(self.inserted_id)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_mesmo_pagamento_sempre_na_mesma_fila():
+    worker = PaymentEventWorker()
+    worker._queues = [queue.Queue() for _ in range(4)]
+
+    assert worker._queue_for("pay-1") is worker._queue_for("pay-1")
+    assert len({id(worker._queue_for(f"pay-{i}")) for i in range(50)}) > 1
+
+
+def test_reentrega_nao_vai_para_os_workers(monkeypatch):
+    submitted = []
+    monkeypatch.setattr(payment_events.payment_event_worker, "submit", lambda pk, ref: submitted.append((pk, ref)))
+
+    db = FakeDB(inserted_id=7)
+    assert ingest_payment_event(db, "asaas", "evt_1", "PAYMENT_RECEIVED", "pay-1", {}) is True
+    assert submitted == [(7, "pay-1")]
+
+    db = FakeDB(inserted_id=None)
+    assert ingest_payment_event(db, "asaas", "evt_1", "PAYMENT_RECEIVED", "pay-1", {}) is False
+    assert submitted == [(7, "pay-1")]
+    assert db.commits == 1
+
+
+class ScriptedQuery:
+    def __init__(self, result):
+        self.result = result
+
+    def filter(self, *args):
+        return self
+
+    def with_for_update(self, **kwargs):
+        return self
+
+    def first(self):
+        return self.result
+
+
+class ScriptedSession:
+    """Cada db.query(...) devolve o próximo resultado de `results`."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.commits = 0
+        self.rollbacks = 0
+
+    def query(self, *entities):
+        return ScriptedQuery(self.results.pop(0))
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+
+def _event(pk):
+    return SimpleNamespace(
+        id=pk, provider="asaas", event_id=f"evt_{pk}", event="PAYMENT_RECEIVED", payment_ref="pay-1",
+        ip_address=None, user_agent=None, status="received", attempts=0, processed_at=None
+    )
+
+
+def test_evento_espera_anterior_do_mesmo_pagamento(monkeypatch):
+    applied = []
+    monkeypatch.setattr(payment_events, "apply_payment_event", lambda db, ev: applied.append(ev.id) or 1)
+
+    event = _event(8)
+    db = ScriptedSession(event, (7,))
+    monkeypatch.setattr(payment_events, "SessionLocal", lambda: db)
+    PaymentEventWorker()._process(8)
+
+    assert applied == []
+    assert event.status == "received" and event.attempts == 0
+    assert db.commits == 0
+
+    db = ScriptedSession(event, None)
+    monkeypatch.setattr(payment_events, "SessionLocal", lambda: db)
+    PaymentEventWorker()._process(8)
+
+    assert applied == [8]
+    assert event.status == "processed"
+    assert db.commits == 1
+
+
+def test_acoes_de_auditoria_mantem_os_nomes_antigos(monkeypatch):
+    actions = []
+    monkeypatch.setattr(payment_events, "confirm_payment", lambda db, ref, action, *a: actions.append(action) or 1)
+    monkeypatch.setattr(payment_events, "cancel_payment", lambda db, ref, action, *a: actions.append(action) or 1)
+
+    for provider, name in (("asaas", "PAYMENT_RECEIVED"), ("picpay", "paid"), ("picpay", "canceled")):
+        ev = _event(1)
+        ev.provider, ev.event = provider, name
+        payment_events.apply_payment_event(None, ev)
+
+    assert actions == ["PAYMENT_CONFIRMED_WEBHOOK", "PAYMENT_CONFIRMED_WEBHOOK", "PAYMENT_CANCELED_WEBHOOK"]
@@ -0,0 +1,170 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+import httpx
+import pytest
+from sqlalchemy.orm import Session
+
+from app.core import payment_reconciliation
+from app.core.payment_reconciliation import PaymentStatusCache, fetch_paid_payments
+from app.services.asaas_service import AsaasService
+
+
+def _service(pages):
+    chamadas = []
+
+    def handler(request):
+        params = dict(request.url.params)
+        chamadas.append(params)
+        status_pages = pages[params["status"]]
+        index = int(params["offset"]) // 2
+        return httpx.Response(200, json={
+            "data": status_pages[index] if index < len(status_pages) else [],
+            "hasMore": index + 1 < len(status_pages)
+        })
+
+    service = AsaasService()
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service, chamadas
+
+
+def test_lista_todas_as_paginas_de_cada_status():
+    service, chamadas = _service({
+        "RECEIVED": [
+            [{"id": "pay_1", "externalReference": "ref-1"}, {"id": "pay_2", "externalReference": "ref-2"}],
+            [{"id": "pay_3", "externalReference": "ref-3"}],
+        ],
+        "CONFIRMED": [
+            [{"id": "pay_4", "externalReference": "ref-4"}, {"id": "pay_5"}],
+        ],
+    })
+
+    paid = asyncio.run(fetch_paid_payments(service, date(2024, 5, 1)))
+
+    assert sorted(paid) == ["ref-1", "ref-2", "ref-3", "ref-4"]
+    assert [c["offset"] for c in chamadas] == ["0", "2", "0"]
+    assert all(c["dateCreated[ge]"] == "2024-05-01" for c in chamadas)
+
+
+def test_cache_expira_inclusive_paid(monkeypatch):
+    agora = [100.0]
+    monkeypatch.setattr(payment_reconciliation.time, "monotonic", lambda: agora[0])
+    cache = PaymentStatusCache(ttl_seconds=5)
+    cache.put("ref-1", "user-1", "pending")
+    cache.put("ref-2", "user-1", "paid")
+
+    assert cache.get("ref-1") == ("user-1", "pending")
+    assert cache.get("ref-2") == ("user-1", "paid")
+    agora[0] += 6
+    assert cache.get("ref-1") is None
+    assert cache.get("ref-2") is None
+
+
+def test_cache_so_muda_depois_do_commit(monkeypatch):
+    cache = PaymentStatusCache(ttl_seconds=60)
+    monkeypatch.setattr(payment_reconciliation, "payment_status_cache", cache)
+    cache.put("ref-1", "user-1", "pending")
+
+    db = Session()
+    db.begin()
+    cache.put_after_commit(db, "ref-1", "user-1", "paid")
+    assert cache.get("ref-1") == ("user-1", "pending")
+    db.commit()
+    assert cache.get("ref-1") == ("user-1", "paid")
+
+    db = Session()
+    db.begin()
+    cache.invalidate_after_commit(db, "ref-1")
+    db.rollback()
+    assert cache.get("ref-1") == ("user-1", "paid")
+
+    db = Session()
+    db.begin()
+    cache.invalidate_after_commit(db, "ref-1")
+    db.commit()
+    assert cache.get("ref-1") is None
+
+
+def _stub_reconcile(monkeypatch, oldest):
+    chamadas = {}
+
+    class DB:
+        def close(self):
+            pass
+
+    def fake_oldest(db, since, reserved_only=False):
+        chamadas["window_start"] = since
+        chamadas["reserved_only"] = reserved_only
+        return oldest
+
+    async def fake_fetch(since, not_before):
+        chamadas["since"] = since
+        chamadas["not_before"] = not_before
+        return {}
+
+    def fake_apply(db, paid, sweep_expired=False):
+        chamadas["sweep_expired"] = sweep_expired
+        return 0
+
+    monkeypatch.setattr(payment_reconciliation, "SessionLocal", DB)
+    monkeypatch.setattr(payment_reconciliation, "oldest_pending_intent", fake_oldest)
+    monkeypatch.setattr(payment_reconciliation, "_fetch_paid", fake_fetch)
+    monkeypatch.setattr(payment_reconciliation, "apply_reconciliation", fake_apply)
+    return chamadas
+
+
+def test_conciliacao_lista_desde_a_cobranca_pendente_mais_antiga(monkeypatch):
+    # 01h UTC de 10/05 ainda é 09/05 no horário do Asaas
+    chamadas = _stub_reconcile(monkeypatch, datetime(2024, 5, 10, 1, 0, tzinfo=timezone.utc))
+
+    payment_reconciliation.reconcile_pending_payments()
+
+    agora = datetime.now(timezone.utc)
+    assert agora - chamadas["window_start"] == pytest.approx(timedelta(minutes=60), abs=timedelta(seconds=5))
+    assert chamadas["since"] == date(2024, 5, 9)
+    assert chamadas["not_before"] == datetime(2024, 5, 10, 0, 55, tzinfo=timezone.utc)
+    assert chamadas["reserved_only"] is True
+    assert chamadas["sweep_expired"] is False
+
+
+def test_conciliacao_sem_cobranca_pendente_nao_chama_o_asaas(monkeypatch):
+    chamadas = _stub_reconcile(monkeypatch, None)
+
+    payment_reconciliation.reconcile_pending_payments()
+
+    assert "since" not in chamadas
+
+
+def test_varredura_de_expiradas_usa_lookback_em_dias(monkeypatch):
+    chamadas = _stub_reconcile(monkeypatch, datetime(2024, 5, 8, 15, 0, tzinfo=timezone.utc))
+
+    payment_reconciliation.reconcile_expired_payments()
+
+    agora = datetime.now(timezone.utc)
+    assert agora - chamadas["window_start"] == pytest.approx(timedelta(days=2), abs=timedelta(seconds=5))
+    assert chamadas["since"] == date(2024, 5, 8)
+    assert chamadas["reserved_only"] is False
+    assert chamadas["sweep_expired"] is True
+
+
+def test_ignora_cobrancas_anteriores_a_janela_e_para_de_paginar():
+    service, chamadas = _service({
+        "RECEIVED": [
+            [{"id": "pay_1", "externalReference": "ref-1", "dateCreated": "2024-05-10 10:00:00"},
+             {"id": "pay_2", "externalReference": "ref-2", "dateCreated": "2024-05-10 08:00:00"}],
+            [{"id": "pay_3", "externalReference": "ref-3", "dateCreated": "2024-05-10 07:00:00"}],
+            [{"id": "pay_4", "externalReference": "ref-4", "dateCreated": "2024-05-10 06:00:00"}],
+        ],
+        "CONFIRMED": [
+            # Só a data: pode ser de qualquer hora do dia, fica
+            [{"id": "pay_5", "externalReference": "ref-5", "dateCreated": "2024-05-10"},
+             {"id": "pay_6", "externalReference": "ref-6", "dateCreated": "2024-05-09"}],
+        ],
+    })
+    # 09h em Brasília
+    not_before = datetime(2024, 5, 10, 12, 0, tzinfo=timezone.utc)
+
+    paid = asyncio.run(fetch_paid_payments(service, date(2024, 5, 10), not_before))
+
+    assert sorted(paid) == ["ref-1", "ref-5"]
+    # RECEIVED: a segunda página já é toda anterior, a terceira nem é pedida
+    assert [(c["status"], c["offset"]) for c in chamadas] == [("RECEIVED", "0"), ("RECEIVED", "2"), ("CONFIRMED", "0")]
@@ -0,0 +1,69 @@
+import requests
+from datetime import datetime, timedelta, timezone
+
+
+BASE_URL = "http://localhost:8000/api/v1"
+
+
+def _create_rifa(token_value: str) -> str:
+    headers = {"Authorization": f"Bearer {token_value}"}
+    now = datetime.now(timezone.utc)
+    payload = {
+        "titulo": f"Rifa Lote {now.timestamp()}",
+        "descricao": "Rifa criada para testes de reserva em lote",
+        "preco_numero": 10.0,
+        "tipo_rifa": "dezena",
+        "data_sorteio": (now + timedelta(hours=1)).isoformat(),
+        "hora_encerramento": (now + timedelta(minutes=30)).isoformat(),
+        "local_sorteio": "PT-RJ",
+        "status": "ativa",
+    }
+    res = requests.post(f"{BASE_URL}/rifas/", json=payload, headers=headers)
+    assert res.status_code == 200, f"Falha ao criar rifa: {res.text}"
+    return res.json()["id"]
+
+
+def test_reserva_lote_tudo_ou_nada(token):
+    rifa_id_local = _create_rifa(token)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    res = requests.post(
+        f"{BASE_URL}/rifas/{rifa_id_local}/reservar",
+        json={"numeros": ["10", "03", "42"]},
+        headers=headers,
+    )
+    assert res.status_code == 200, res.text
+    data = res.json()
+    assert data["reservados"] == ["10", "03", "42"]
+    assert data["indisponiveis"] == []
+    payment_id = data["payment_id"]
+
+    # "42" já é do usuário e "xx" não existe: sem parcial nada é reservado
+    res = requests.post(
+        f"{BASE_URL}/rifas/{rifa_id_local}/reservar",
+        json={"numeros": ["42", "43", "xx"]},
+        headers=headers,
+    )
+    assert res.status_code == 409
+
+    numeros = requests.get(f"{BASE_URL}/rifas/{rifa_id_local}/numeros", headers=headers).json()
+    por_numero = {n["numero"]: n for n in numeros}
+    assert por_numero["43"]["status"] == "livre"
+    assert {por_numero[n]["payment_id"] for n in ["10", "03", "42"]} == {payment_id}
+
+
+def test_reserva_lote_parcial(token):
+    rifa_id_local = _create_rifa(token)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    requests.post(f"{BASE_URL}/rifas/{rifa_id_local}/numeros/20/reservar", headers=headers)
+    res = requests.post(
+        f"{BASE_URL}/rifas/{rifa_id_local}/reservar",
+        json={"numeros": ["20", "21", "xx"], "parcial": True},
+        headers=headers,
+    )
+    assert res.status_code == 200, res.text
+    data = res.json()
+    assert data["reservados"] == ["21"]
+    assert data["ja_reservados"] == ["20"]
+    assert data["indisponiveis"] == ["xx"]
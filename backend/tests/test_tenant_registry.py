@@ -0,0 +1,50 @@
+import dataclasses
+import uuid
+import pytest
+
+from app.core.tenant import MAIN_TENANT_DOMAIN, TenantRegistry, TenantSnapshot
+
+
+def _snapshot(domain):
+    return TenantSnapshot(id=uuid.uuid4(), name=domain, domain=domain)
+
+
+def _registry(domains):
+    registry = TenantRegistry(ttl_seconds=300)
+    cargas = []
+
+    def load():
+        cargas.append(1)
+        snapshots = [_snapshot(d) for d in domains]
+        return {s.domain: s for s in snapshots}, snapshots[0] if snapshots else None
+
+    registry._load = load
+    return registry, cargas
+
+
+def test_resolve_sem_recarregar_ate_invalidar():
+    registry, cargas = _registry(["a.com.br", "b.com.br"])
+
+    assert registry.resolve_host("a.com.br").domain == "a.com.br"
+    assert registry.resolve_host("b.com.br").domain == "b.com.br"
+    assert registry.resolve_host("c.com.br") is None
+    assert len(cargas) == 1
+
+    registry.invalidate()
+    registry.resolve_host("a.com.br")
+    assert len(cargas) == 2
+
+
+def test_localhost_usa_tenant_principal_ou_localhost():
+    registry, _ = _registry(["localhost", MAIN_TENANT_DOMAIN])
+    assert registry.resolve_host("127.0.0.1").domain == MAIN_TENANT_DOMAIN
+
+    registry, _ = _registry(["a.com.br", "localhost"])
+    assert registry.resolve_host("127.0.0.1").domain == "localhost"
+    assert registry.default().domain == "a.com.br"
+
+
+def test_snapshot_imutavel():
+    snapshot = _snapshot("a.com.br")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        snapshot.domain = "b.com.br"